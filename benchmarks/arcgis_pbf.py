@@ -0,0 +1,161 @@
+"""Encoder for ArcGIS `f=pbf` query responses, used by the fake FeatureServer and
+the wire format benchmark. `utils.arcgis_pbf` is the matching decoder.
+
+Geometry is quantized like an ArcGIS server does without `quantizationParameters`:
+upper-left origin, translate (-400, 400) and a scale of 1e-9 on both axes.
+"""
+
+import struct
+from typing import Dict, List, Optional
+
+from utils.arcgis_pbf import (
+    GEOMETRY_MULTIPOINT,
+    GEOMETRY_POINT,
+    GEOMETRY_POLYGON,
+    GEOMETRY_POLYLINE,
+    ORIGIN_UPPER_LEFT,
+)
+
+SCALE = 1e-9
+TRANSLATE = (-400.0, 400.0)
+
+## esriPBuffer.FeatureCollectionPBuffer.FieldType
+FIELD_TYPE_INTEGER = 1
+FIELD_TYPE_DOUBLE = 3
+FIELD_TYPE_STRING = 4
+FIELD_TYPE_OID = 6
+
+
+def _varint(value) -> bytes:
+    out = bytearray()
+    value &= (1 << 64) - 1
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _key(number, wire):
+    return _varint(number << 3 | wire)
+
+
+def _message(number, payload: bytes) -> bytes:
+    return _key(number, 2) + _varint(len(payload)) + payload
+
+
+def _uint(number, value) -> bytes:
+    return _key(number, 0) + _varint(value)
+
+
+def _double(number, value) -> bytes:
+    return _key(number, 1) + struct.pack("<d", value)
+
+
+def _packed(number, values) -> bytes:
+    return _message(number, b"".join(_varint(value) for value in values))
+
+
+def encode_value(value) -> bytes:
+    if value is None:
+        return b""
+    if isinstance(value, bool):
+        return _uint(9, int(value))
+    if isinstance(value, int):
+        ## sint64_value
+        return _uint(8, _zigzag(value))
+    if isinstance(value, float):
+        return _double(3, value)
+    return _message(1, str(value).encode("utf-8"))
+
+
+def _field_type(name, value, object_id_field):
+    if name == object_id_field:
+        return FIELD_TYPE_OID
+    if isinstance(value, int) and not isinstance(value, bool):
+        return FIELD_TYPE_INTEGER
+    if isinstance(value, float):
+        return FIELD_TYPE_DOUBLE
+    return FIELD_TYPE_STRING
+
+
+def _quantize(vertices) -> List[int]:
+    coords, previous = [], (0, 0)
+    for x, y in vertices:
+        point = (
+            round((x - TRANSLATE[0]) / SCALE),
+            round((TRANSLATE[1] - y) / SCALE),
+        )
+        coords.extend(_zigzag(point[axis] - previous[axis]) for axis in (0, 1))
+        previous = point
+    return coords
+
+
+def _geometry_type(geometry):
+    if "rings" in geometry:
+        return GEOMETRY_POLYGON
+    if "paths" in geometry:
+        return GEOMETRY_POLYLINE
+    if "points" in geometry:
+        return GEOMETRY_MULTIPOINT
+    return GEOMETRY_POINT
+
+
+def encode_geometry(geometry: Dict) -> bytes:
+    if "x" in geometry:
+        return _packed(3, _quantize([(geometry["x"], geometry["y"])]))
+    parts = geometry.get("rings") or geometry.get("paths") or [geometry["points"]]
+    lengths = [len(part) for part in parts]
+    vertices = [tuple(vertex[:2]) for part in parts for vertex in part]
+    return _packed(2, lengths) + _packed(3, _quantize(vertices))
+
+
+def encode_query_response(body: Dict, fields: Optional[List[str]] = None) -> bytes:
+    """Encode a query response dictionary, as served with `f=json`, in the
+    `f=pbf` format. `fields` defaults to the first feature's attribute names."""
+    features = body.get("features") or []
+    object_id_field = body.get("objectIdFieldName", "OBJECTID")
+    if fields is None:
+        fields = list(features[0]["attributes"]) if features else []
+    sample = features[0]["attributes"] if features else {}
+    geometries = [feature.get("geometry") for feature in features]
+    geometry_type = next(
+        (_geometry_type(geometry) for geometry in geometries if geometry),
+        GEOMETRY_POINT,
+    )
+    result = [
+        _message(1, object_id_field.encode("utf-8")),
+        _uint(7, geometry_type),
+    ]
+    if body.get("exceededTransferLimit"):
+        result.append(_uint(9, 1))
+    result.append(
+        _message(
+            12,
+            _uint(1, ORIGIN_UPPER_LEFT)
+            + _message(2, _double(1, SCALE) + _double(2, SCALE))
+            + _message(3, _double(1, TRANSLATE[0]) + _double(2, TRANSLATE[1])),
+        )
+    )
+    for name in fields:
+        result.append(
+            _message(
+                13,
+                _message(1, name.encode("utf-8"))
+                + _uint(2, _field_type(name, sample.get(name), object_id_field)),
+            )
+        )
+    for feature, geometry in zip(features, geometries):
+        attributes = feature["attributes"]
+        payload = b"".join(
+            _message(1, encode_value(attributes.get(name))) for name in fields
+        )
+        if geometry:
+            payload += _message(2, encode_geometry(geometry))
+        result.append(_message(15, payload))
+    ## FeatureCollectionPBuffer { version = 1; queryResult = 2 { featureResult = 1 } }
+    return _message(1, b"1.0") + _message(2, _message(1, b"".join(result)))
@@ -0,0 +1,120 @@
+"""Micro-benchmark for the queue file JSON codecs.
+
+    python -m benchmarks.codec --lines 50000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from dataclasses import asdict
+
+from utils.data_bridge import GISAttachment, GISIncident
+from utils.serialization import CODECS, get_codec
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--lines", type=int, help="lines per queue file", default=50000)
+parser.add_argument("--seed", type=int, default=0)
+
+
+def make_incident(rng: random.Random, i):
+    return GISIncident(
+        object_id=i,
+        created=1600000000000 + i * 1000,
+        updated=1620000000000 + i * 1000,
+        incident_number=f"SR-{rng.randint(1000000, 9999999)}",
+        parcel_id=f"0{rng.randint(10000, 99999)} 0{rng.randint(1000, 9999)}",
+        city_file_no=f"CE{rng.randint(100000, 999999)}",
+        sub_district=f"{rng.randint(1, 7)}-{rng.choice(['North', 'South', 'East'])}",
+        npa_inspect_summary=" ".join(
+            rng.choice(["vacant", "open", "roof", "damage", "overgrown", "debris"])
+            for _ in range(rng.randint(10, 60))
+        ),
+        court_status=rng.choice(["Hearing", "Stay", "Receiver", "Dismissed"]),
+        location=f"{rng.randint(100, 9999)} Main St",
+        next_court_date=1630000000000 + rng.randint(0, 10 ** 9),
+        property_owner=f"Owner {i}",
+        defendent=f"Defendent {i}",
+        civil_warrant=f"CW-{i:08d}",
+        latest_court_notes="Reset for status. " * rng.randint(1, 8),
+        geometry={"x": -90.0 + rng.random(), "y": 35.0 + rng.random()},
+    )
+
+
+def make_matter_log(rng: random.Random, i):
+    return {
+        "matter": {
+            "id": 100000 + i,
+            "etag": f'"{rng.getrandbits(64):x}"',
+            "updated_at": "2021-07-01T10:10:10-05:00",
+            "custom_field_values": [
+                {
+                    "id": f"text_line-{rng.getrandbits(32)}",
+                    "etag": f'"{rng.getrandbits(64):x}"',
+                    "field_name": f"Field {n}",
+                    "value": f"value {rng.getrandbits(24)}",
+                }
+                for n in range(16)
+            ],
+        },
+        "next_court_date": "2021-09-01T09:00:00-05:00",
+        "court_notes": "Reset for status. " * rng.randint(1, 8),
+    }
+
+
+def bench(name, records, encode, decode, path):
+    start = time.perf_counter()
+    with open(path, "wb") as f:
+        for record in records:
+            f.write(encode(record))
+            f.write(b"\n")
+    encoded = time.perf_counter() - start
+    size = os.path.getsize(path)
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        for line in f:
+            decode(line)
+    decoded = time.perf_counter() - start
+    print(
+        f"{name:<24} write {len(records) / encoded:>10,.0f} lines/s"
+        f"  read {len(records) / decoded:>10,.0f} lines/s"
+        f"  {size / 1e6:>8.1f} MB"
+    )
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    datasets = {
+        "active_litigations": [make_incident(rng, i) for i in range(args.lines)],
+        "attachments": [
+            GISAttachment(
+                id=i,
+                litigation_object_id=i // 3,
+                civil_warrant=f"CW-{i // 3:08d}",
+                content_type="image/jpeg",
+                size=rng.randint(10 ** 4, 10 ** 7),
+                name=f"IMG_{i}.jpg",
+            )
+            for i in range(args.lines)
+        ],
+        "matters": [make_matter_log(rng, i) for i in range(args.lines)],
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "queue")
+        for dataset, records in datasets.items():
+            print(f"{dataset} ({len(records)} lines)")
+            baseline_encode = (
+                (lambda x: json.dumps(x).encode())
+                if isinstance(records[0], dict)
+                else (lambda x: json.dumps(asdict(x)).encode())
+            )
+            bench("stdlib json + asdict", records, baseline_encode, json.loads, path)
+            for codec_name in CODECS:
+                try:
+                    codec = get_codec(codec_name)
+                except ImportError:
+                    print(f"{codec_name:<24} not installed")
+                    continue
+                bench(codec_name, records, codec.dumps, codec.loads, path)
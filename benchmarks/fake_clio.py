@@ -0,0 +1,535 @@
+"""Fake Clio v4 API with the endpoints ClioApiClient and DataBridge use: matters
+(with paging), custom_fields, contacts, groups, practice_areas, calendars,
+calendar_entries, notes, documents (with a put_url served by this same server) and
+the OAuth token endpoint. Authorization headers are accepted without checks.
+
+    python -m benchmarks.fake_clio --matters 10000 --latency 0.05 --rate-limit 50
+
+Point the jobs at it with CLIO_HOST={url printed on start} and
+OAUTHLIB_INSECURE_TRANSPORT=1, since it serves plain http.
+"""
+
+import argparse
+import datetime
+import itertools
+import re
+import threading
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Set, Tuple
+from urllib.parse import urlencode
+
+from benchmarks.fake_server import (
+    FakeRequest,
+    FakeServer,
+    FakeServerConfig,
+    add_server_arguments,
+    config_from_args,
+    serve_forever,
+)
+from benchmarks.synthetic import (
+    SyntheticConfig,
+    calendar_entry,
+    custom_field_values,
+    matter_field_values,
+)
+from utils.constants import (
+    CLIO_CALENDAR_NAME,
+    CLIO_CLIENT_NAME,
+    CLIO_CUSTOM_FIELDS,
+    CLIO_GROUP_NAME,
+    CLIO_PRACTICE_AREA,
+    ClioCustomFieldNames,
+)
+
+DEFAULT_LIMIT = 200
+MAX_LIMIT = 200
+_CUSTOM_FIELD_FILTER = re.compile(r"^custom_field_values\[(\d+)\]$")
+
+
+def _parse_time(value):
+    parsed = datetime.datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed
+
+
+def parse_fields(spec):
+    """Parse a Clio `fields` parameter such as "id,name,picklist_options{id,option}"
+    into {name: nested fields or None}."""
+    fields, stack, name = {}, [], ""
+    current = fields
+    for char in spec + ",":
+        if char in ",{}":
+            if name.strip():
+                current[name.strip()] = None
+            if char == "{":
+                current[name.strip()] = {}
+                stack.append(current)
+                current = current[name.strip()]
+            elif char == "}":
+                current = stack.pop()
+            name = ""
+        else:
+            name += char
+    return fields
+
+
+def select_fields(record, fields):
+    if fields is None or not isinstance(record, (dict, list)):
+        return record
+    if isinstance(record, list):
+        return [select_fields(item, fields) for item in record]
+    return {
+        name: select_fields(record[name], nested)
+        for name, nested in fields.items()
+        if name in record
+    }
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+class FakeClioServer(FakeServer):
+    name = "fake Clio API"
+
+    def __init__(
+        self,
+        config: FakeServerConfig = None,
+        port=0,
+        matters=0,
+        synthetic: SyntheticConfig = None,
+        bootstrap=True,
+        token_ttl=604800,
+    ):
+        super().__init__(config, port)
+        ## expires_in of refreshed tokens, lower it to exercise proactive refresh
+        self.token_ttl = token_ttl
+        self.synthetic = synthetic or SyntheticConfig(seed=self.config.seed)
+        self._ids = itertools.count(1000)
+        self._state_lock = threading.Lock()
+        self.collections: Dict[str, Dict[int, Dict]] = {
+            name: {}
+            for name in [
+                "matters",
+                "custom_fields",
+                "contacts",
+                "groups",
+                "practice_areas",
+                "calendars",
+                "calendar_entries",
+                "notes",
+                "documents",
+            ]
+        }
+        self.uploads: Dict[str, int] = {}
+        ## Lookups the jobs make once per record, kept indexed so large seeded
+        ## datasets do not turn every request into a full scan
+        self._custom_field_index: Dict[Tuple[int, str], Set[int]] = defaultdict(set)
+        self._documents_by_matter: Dict[int, List[int]] = defaultdict(list)
+        if bootstrap:
+            self.bootstrap()
+        if matters:
+            self.seed_matters(matters, self.synthetic)
+
+        api = r"/api/v4"
+        for name in self.collections:
+            if name not in (
+                "matters",
+                "documents",
+                "calendar_entries",
+                "notes",
+                "custom_fields",
+            ):
+                self.route("GET", rf"{api}/{name}(?:\.json)?", self.list_handler(name))
+                self.route(
+                    "POST", rf"{api}/{name}(?:\.json)?", self.create_handler(name)
+                )
+            self.route(
+                "GET", rf"{api}/{name}/(?P<id>\d+)(?:\.json)?", self.get_handler(name)
+            )
+        self.route("GET", rf"{api}/custom_fields(?:\.json)?", self.list_custom_fields)
+        self.route("POST", rf"{api}/custom_fields(?:\.json)?", self.create_custom_field)
+        self.route("GET", rf"{api}/matters(?:\.json)?", self.list_matters)
+        self.route("POST", rf"{api}/matters(?:\.json)?", self.create_matter)
+        self.route(
+            "PATCH", rf"{api}/matters/(?P<id>\d+)(?:\.json)?", self.update_matter
+        )
+        self.route(
+            "GET", rf"{api}/calendar_entries(?:\.json)?", self.list_calendar_entries
+        )
+        self.route(
+            "POST", rf"{api}/calendar_entries(?:\.json)?", self.create_calendar_entry
+        )
+        self.route("GET", rf"{api}/notes(?:\.json)?", self.list_notes)
+        self.route("POST", rf"{api}/notes(?:\.json)?", self.create_handler("notes"))
+        self.route("GET", rf"{api}/documents(?:\.json)?", self.list_documents)
+        self.route("POST", rf"{api}/documents(?:\.json)?", self.create_document)
+        self.route(
+            "PATCH", rf"{api}/documents/(?P<id>\d+)(?:\.json)?", self.update_document
+        )
+        self.route("PUT", r"/storage/(?P<uuid>[0-9a-f-]+)", self.put_document_content)
+        self.route("POST", r"/oauth/token", self.token)
+
+    ## State helpers
+
+    def next_id(self):
+        with self._state_lock:
+            return next(self._ids)
+
+    def insert(self, collection, record):
+        record.setdefault("id", self.next_id())
+        record.setdefault("created_at", _now())
+        record.setdefault("updated_at", record["created_at"])
+        record.setdefault("etag", f'"{uuid.uuid4().hex}"')
+        with self._state_lock:
+            self.collections[collection][record["id"]] = record
+            if collection == "matters":
+                self._index_matter(record)
+            elif collection == "documents" and record.get("parent"):
+                self._documents_by_matter[record["parent"]["id"]].append(record["id"])
+        return record
+
+    def _index_matter(self, matter, remove=False):
+        for value in matter.get("custom_field_values") or []:
+            key = (value["custom_field"]["id"], str(value["value"]))
+            if remove:
+                self._custom_field_index[key].discard(matter["id"])
+            else:
+                self._custom_field_index[key].add(matter["id"])
+
+    def bootstrap(self):
+        """Create the entities job/bootstrap.py looks for."""
+        self.client = self.insert(
+            "contacts", {"name": CLIO_CLIENT_NAME, "type": "Company"}
+        )
+        self.group = self.insert("groups", {"name": CLIO_GROUP_NAME})
+        self.practice_area = self.insert("practice_areas", {"name": CLIO_PRACTICE_AREA})
+        self.calendar = self.insert("calendars", {"name": CLIO_CALENDAR_NAME})
+        for field in CLIO_CUSTOM_FIELDS:
+            self.add_custom_field(field)
+
+    def add_custom_field(self, field):
+        record = {
+            "name": field["name"],
+            "field_type": field.get("field_type", "text_line"),
+            "parent_type": field.get("parent_type", "Matter"),
+            "displayed": field.get("displayed", True),
+            "picklist_options": [
+                {"id": self.next_id(), "option": option["option"]}
+                for option in field.get("picklist_options") or []
+            ],
+        }
+        return self.insert("custom_fields", record)
+
+    def seed_matters(self, count, synthetic: SyntheticConfig):
+        """Add a matter for each synthetic litigation, as a migration would have, and
+        a calendar entry for the ones with a next court date."""
+        fields = self.records("custom_fields")
+        for object_id in range(1, count + 1):
+            values = matter_field_values(object_id, synthetic)
+            matter = self.insert(
+                "matters",
+                {
+                    "description": values[ClioCustomFieldNames.LOCATION.value],
+                    "client": {"id": self.client["id"]},
+                    "group": {"id": self.group["id"]},
+                    "practice_area": {"id": self.practice_area["id"]},
+                    "custom_field_values": custom_field_values(
+                        values, fields, self._ids
+                    ),
+                },
+            )
+            entry = calendar_entry(object_id, synthetic)
+            if entry is not None:
+                self.insert(
+                    "calendar_entries",
+                    {
+                        **entry,
+                        "calendar_owner": {"id": self.calendar["id"]},
+                        "matter": {"id": matter["id"]},
+                    },
+                )
+
+    def data(self, request: FakeRequest, data):
+        fields = request.arg("fields")
+        return {"data": select_fields(data, parse_fields(fields)) if fields else data}
+
+    ## Paging
+
+    def page(self, request: FakeRequest, records: List[Dict]):
+        limit = min(int(request.arg("limit") or DEFAULT_LIMIT), MAX_LIMIT)
+        offset = int(request.arg("page_token") or 0)
+        data = records[offset : offset + limit]
+        paging = {}
+        if offset + limit < len(records):
+            query = {
+                key: values
+                for key, values in request.query.items()
+                if key != "page_token"
+            }
+            query["page_token"] = [str(offset + limit)]
+            paging["next"] = f"{self.url}{request.path}?{urlencode(query, doseq=True)}"
+        return 200, {
+            **self.data(request, data),
+            "meta": {"paging": paging, "records": len(records)},
+        }
+
+    def records(self, collection):
+        with self._state_lock:
+            return sorted(
+                self.collections[collection].values(), key=lambda record: record["id"]
+            )
+
+    ## Generic handlers
+
+    def list_handler(self, collection):
+        def handler(request: FakeRequest):
+            records = self.records(collection)
+            name = request.arg("name")
+            query = request.arg("query")
+            if name:
+                records = [r for r in records if r.get("name") == name]
+            if query:
+                records = [
+                    r for r in records if query.lower() in r.get("name", "").lower()
+                ]
+            return self.page(request, records)
+
+        return handler
+
+    def create_handler(self, collection):
+        def handler(request: FakeRequest):
+            return 201, self.data(
+                request, self.insert(collection, dict(request.json()["data"]))
+            )
+
+        return handler
+
+    def get_handler(self, collection):
+        def handler(request: FakeRequest):
+            record = self.collections[collection].get(int(request.match["id"]))
+            if record is None:
+                return 404, {"error": {"type": "RecordNotFound"}}
+            return 200, self.data(request, record)
+
+        return handler
+
+    ## Custom fields
+
+    def list_custom_fields(self, request: FakeRequest):
+        records = self.records("custom_fields")
+        query = request.arg("query")
+        if query:
+            records = [r for r in records if query.lower() in r["name"].lower()]
+        return self.page(request, records)
+
+    def create_custom_field(self, request: FakeRequest):
+        return 201, self.data(request, self.add_custom_field(request.json()["data"]))
+
+    ## Matters
+
+    def list_matters(self, request: FakeRequest):
+        candidates = None
+        for key, values in request.query.items():
+            match = _CUSTOM_FIELD_FILTER.match(key)
+            if match:
+                ids = self._custom_field_index.get((int(match[1]), values[-1]), set())
+                candidates = set(ids) if candidates is None else candidates & ids
+        if candidates is None:
+            records = self.records("matters")
+        else:
+            matters = self.collections["matters"]
+            records = [matters[id] for id in sorted(candidates)]
+        for key in ("group", "practice_area"):
+            value = request.arg(f"{key}_id")
+            if value:
+                records = [r for r in records if str(r[key]["id"]) == value]
+        ids = {int(x) for x in request.args("ids")}
+        if ids:
+            records = [r for r in records if r["id"] in ids]
+        updated_since = request.arg("updated_since")
+        if updated_since:
+            since = _parse_time(updated_since)
+            records = [r for r in records if _parse_time(r["updated_at"]) > since]
+        updated_before = request.arg("updated_before")
+        if updated_before:
+            before = _parse_time(updated_before)
+            records = [r for r in records if _parse_time(r["updated_at"]) < before]
+        if request.arg("order") == "updated_at(asc)":
+            records = sorted(records, key=lambda r: _parse_time(r["updated_at"]))
+        return self.page(request, records)
+
+    def _custom_field_values_from_request(self, values):
+        out = []
+        for value in values or []:
+            field = self.collections["custom_fields"].get(
+                (value.get("custom_field") or {}).get("id")
+            )
+            if field is None:
+                continue
+            out.append(
+                {
+                    "id": f"{field['field_type']}-{self.next_id()}",
+                    "etag": f'"{uuid.uuid4().hex}"',
+                    "field_name": field["name"],
+                    "custom_field": {"id": field["id"]},
+                    "value": value.get("value"),
+                }
+            )
+        return out
+
+    def create_matter(self, request: FakeRequest):
+        data = dict(request.json()["data"])
+        data["custom_field_values"] = self._custom_field_values_from_request(
+            data.get("custom_field_values")
+        )
+        return 201, self.data(request, self.insert("matters", data))
+
+    def update_matter(self, request: FakeRequest):
+        matter = self.collections["matters"].get(int(request.match["id"]))
+        if matter is None:
+            return 404, {"error": {"type": "RecordNotFound"}}
+        data = request.json()["data"]
+        with self._state_lock:
+            self._index_matter(matter, remove=True)
+            for update in data.get("custom_field_values", []):
+                for value in matter["custom_field_values"]:
+                    if value["id"] == update.get("id"):
+                        value["value"] = update.get("value")
+            for key, value in data.items():
+                if key != "custom_field_values":
+                    matter[key] = value
+            matter["updated_at"] = _now()
+            self._index_matter(matter)
+        return 200, self.data(request, matter)
+
+    ## Calendar entries
+
+    def list_calendar_entries(self, request: FakeRequest):
+        records = self.records("calendar_entries")
+        calendar_id = request.arg("calendar_id")
+        if calendar_id:
+            records = [
+                r for r in records if str(r["calendar_owner"]["id"]) == calendar_id
+            ]
+        matter_id = request.arg("matter_id")
+        if matter_id:
+            records = [
+                r
+                for r in records
+                if r.get("matter") and str(r["matter"]["id"]) == matter_id
+            ]
+        created_since = request.arg("created_since")
+        if created_since:
+            since = _parse_time(created_since)
+            records = [r for r in records if _parse_time(r["created_at"]) > since]
+        return self.page(request, records)
+
+    def create_calendar_entry(self, request: FakeRequest):
+        return 201, self.data(
+            request, self.insert("calendar_entries", dict(request.json()["data"]))
+        )
+
+    ## Notes
+
+    def list_notes(self, request: FakeRequest):
+        records = self.records("notes")
+        note_type = request.arg("type")
+        if note_type:
+            records = [r for r in records if r.get("type") == note_type]
+        matter_id = request.arg("matter_id")
+        if matter_id:
+            records = [
+                r
+                for r in records
+                if r.get("matter") and str(r["matter"]["id"]) == matter_id
+            ]
+        updated_since = request.arg("updated_since")
+        if updated_since:
+            since = _parse_time(updated_since)
+            records = [r for r in records if _parse_time(r["updated_at"]) > since]
+        return self.page(request, records)
+
+    ## Documents
+
+    def list_documents(self, request: FakeRequest):
+        matter_id = request.arg("matter_id")
+        if matter_id:
+            documents = self.collections["documents"]
+            records = [
+                documents[id]
+                for id in self._documents_by_matter.get(int(matter_id), [])
+            ]
+        else:
+            records = self.records("documents")
+        name = request.arg("external_property_name")
+        value = request.arg("external_property_value")
+        if name:
+            records = [
+                r
+                for r in records
+                if any(
+                    p["name"] == name and (value is None or str(p["value"]) == value)
+                    for p in r.get("external_properties", [])
+                )
+            ]
+        return self.page(request, records)
+
+    def create_document(self, request: FakeRequest):
+        data = dict(request.json()["data"])
+        version_uuid = str(uuid.uuid4())
+        data["latest_document_version"] = {
+            "uuid": version_uuid,
+            "put_url": f"{self.url}/storage/{version_uuid}",
+            "put_headers": [
+                {"name": "Content-Type", "value": "application/octet-stream"}
+            ],
+            "fully_uploaded": False,
+        }
+        return 201, self.data(request, self.insert("documents", data))
+
+    def put_document_content(self, request: FakeRequest):
+        with self._state_lock:
+            self.uploads[request.match["uuid"]] = len(request.body)
+        return 200, b""
+
+    def update_document(self, request: FakeRequest):
+        document = self.collections["documents"].get(int(request.match["id"]))
+        if document is None:
+            return 404, {"error": {"type": "RecordNotFound"}}
+        data = request.json()["data"]
+        version = document["latest_document_version"]
+        if data.get("uuid") != version["uuid"] or version["uuid"] not in self.uploads:
+            return 422, {"error": {"type": "UnprocessableEntity"}}
+        version["fully_uploaded"] = True
+        return 200, self.data(request, document)
+
+    ## OAuth
+
+    def token(self, request: FakeRequest):
+        return 200, {
+            "access_token": uuid.uuid4().hex,
+            "refresh_token": uuid.uuid4().hex,
+            "token_type": "bearer",
+            "expires_in": self.token_ttl,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_server_arguments(parser)
+    parser.add_argument("--matters", type=int, default=0)
+    parser.add_argument("--calendar-entry-rate", type=float, default=0.5)
+    args = parser.parse_args()
+    serve_forever(
+        FakeClioServer(
+            config_from_args(args),
+            port=args.port,
+            matters=args.matters,
+            synthetic=SyntheticConfig(
+                seed=args.seed, calendar_entry_rate=args.calendar_entry_rate
+            ),
+        )
+    )
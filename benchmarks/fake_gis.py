@@ -0,0 +1,327 @@
+"""Fake ArcGIS FeatureServer with the endpoints GISClient and DataBridge use:
+query, attachments, attachment content, queryAttachments, addFeatures and
+updateFeatures. Queries
+answer in `f=pjson`, `f=json` or `f=pbf`.
+
+    python -m benchmarks.fake_gis --litigations 10000 --latency 0.05 --rate-limit 50
+
+Point the jobs at it with GIS_HOST={url printed on start}.
+"""
+
+import argparse
+import datetime
+import json
+import re
+from typing import Dict, List
+
+from benchmarks.arcgis_pbf import encode_query_response
+from benchmarks.fake_server import (
+    FakeRequest,
+    FakeServer,
+    FakeServerConfig,
+    add_server_arguments,
+    config_from_args,
+    serve_forever,
+)
+from benchmarks.synthetic import (
+    SyntheticConfig,
+    attachment_infos,
+    iter_litigation_history,
+    iter_litigations,
+    iter_payload,
+)
+from utils.arcgis_pbf import CONTENT_TYPE as PBF_CONTENT_TYPE
+from utils.constants import (
+    GIS_ACTIVE_LITIGATION_TABLE_ID,
+    GIS_LITIGATION_HISTORY_TABLE_ID,
+    GISActiveLitigationsFields,
+    GISLitigationHistoryFields,
+)
+
+_CONDITION = re.compile(
+    r"^\(?\s*(?P<field>\w+)\s*(?:(?P<op>>=|<=|>|<|=)\s*(?P<value>'[^']*'|[\d.]+)"
+    r"|IS (?P<not>NOT )?NULL)\s*\)?$",
+    re.IGNORECASE,
+)
+
+
+def _epoch_ms(value: str):
+    parsed = datetime.datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return int(parsed.timestamp() * 1e3)
+
+
+def _field_value(attributes, name):
+    for key, value in attributes.items():
+        if key.lower() == name.lower():
+            return value
+    return None
+
+
+def _matches(attributes, condition):
+    match = _CONDITION.match(condition.strip())
+    if match is None:
+        raise ValueError(f"Unsupported where clause {condition}")
+    value = _field_value(attributes, match["field"])
+    if match["op"] is None:
+        return (value is not None) == bool(match["not"])
+    if value is None:
+        return False
+    expected = match["value"]
+    if expected.startswith("'"):
+        expected = expected[1:-1]
+        if isinstance(value, (int, float)):
+            expected = _epoch_ms(expected)
+    else:
+        expected = float(expected)
+    return {
+        ">": value > expected,
+        "<": value < expected,
+        ">=": value >= expected,
+        "<=": value <= expected,
+        "=": value == expected,
+    }[match["op"]]
+
+
+def where_filter(where: str):
+    """Compile an ArcGIS where clause made of simple comparisons joined by AND/OR."""
+    where = (where or "").strip()
+    if not where or where == "1=1":
+        return lambda attributes: True
+    groups = [
+        [condition for condition in re.split(r"\s+AND\s+", group, flags=re.I)]
+        for group in re.split(r"\s+OR\s+", where, flags=re.I)
+    ]
+    return lambda attributes: any(
+        all(_matches(attributes, condition) for condition in group) for group in groups
+    )
+
+
+class FakeGISServer(FakeServer):
+    name = "fake GIS FeatureServer"
+
+    def __init__(
+        self,
+        config: FakeServerConfig = None,
+        port=0,
+        litigations=1000,
+        max_record_count=2000,
+        synthetic: SyntheticConfig = None,
+        active_litigation_table_id=GIS_ACTIVE_LITIGATION_TABLE_ID,
+        litigation_history_table_id=GIS_LITIGATION_HISTORY_TABLE_ID,
+    ):
+        super().__init__(config, port)
+        self.litigations = litigations
+        self.max_record_count = max_record_count
+        self.synthetic = synthetic or SyntheticConfig(seed=self.config.seed)
+        self.active_litigation_table_id = str(active_litigation_table_id)
+        self.litigation_history_table_id = str(litigation_history_table_id)
+        ## Tables are queried with arbitrary where clauses and grow with addFeatures,
+        ## so their rows are kept; attachments are generated per request
+        self.tables: Dict[str, List[Dict]] = {
+            self.active_litigation_table_id: list(
+                iter_litigations(litigations, self.synthetic)
+            ),
+            self.litigation_history_table_id: list(
+                iter_litigation_history(litigations, self.synthetic)
+            ),
+        }
+        self._next_object_ids = {
+            table: max(
+                [
+                    row["attributes"][GISActiveLitigationsFields.OBJECT_ID.value]
+                    for row in rows
+                ],
+                default=0,
+            )
+            + 1
+            for table, rows in self.tables.items()
+        }
+        self.route("GET", r".*/(?P<table>\d+)/query", self.query)
+        self.route("POST", r".*/(?P<table>\d+)/query", self.query)
+        self.route(
+            "GET",
+            r".*/(?P<table>\d+)/(?P<object_id>\d+)/attachments",
+            self.list_attachments,
+        )
+        self.route(
+            "GET",
+            r".*/(?P<table>\d+)/(?P<object_id>\d+)/attachments/(?P<attachment_id>\d+)",
+            self.get_attachment,
+        )
+        self.route("GET", r".*/(?P<table>\d+)/queryAttachments", self.query_attachments)
+        self.route("POST", r".*/(?P<table>\d+)/addFeatures", self.add_features)
+        self.route(
+            "POST", r".*/(?P<table>\d+)/updateFeatures", self.update_features
+        )
+
+    def params(self, request: FakeRequest):
+        params = dict(request.query)
+        if request.method == "POST" and request.body:
+            params.update(request.form())
+        return {key: values[-1] for key, values in params.items()}
+
+    def encode(self, params, body):
+        if params.get("f", "json") == "pjson":
+            return json.dumps(body, indent=2)
+        return json.dumps(body, separators=(",", ":"))
+
+    def query(self, request: FakeRequest):
+        params = self.params(request)
+        table = self.tables.get(request.match["table"])
+        if table is None:
+            return 400, {"error": {"code": 400, "message": "Invalid table"}}
+        predicate = where_filter(params.get("where"))
+        object_ids = params.get("objectIds")
+        if object_ids:
+            wanted = {int(x) for x in object_ids.split(",") if x}
+            rows = [
+                row
+                for row in table
+                if row["attributes"][GISActiveLitigationsFields.OBJECT_ID.value]
+                in wanted
+            ]
+        else:
+            rows = table
+        rows = [row for row in rows if predicate(row["attributes"])]
+        offset = int(params.get("resultOffset") or 0)
+        count = min(
+            int(params.get("resultRecordCount") or self.max_record_count),
+            self.max_record_count,
+        )
+        page = rows[offset : offset + count]
+        out_fields = params.get("outFields") or "*"
+        fields = None if out_fields == "*" else out_fields.split(",")
+        return_geometry = params.get("returnGeometry", "true").lower() == "true"
+        features = []
+        for row in page:
+            feature = {
+                "attributes": (
+                    row["attributes"]
+                    if fields is None
+                    else {name: row["attributes"].get(name) for name in fields}
+                )
+            }
+            if return_geometry and "geometry" in row:
+                feature["geometry"] = row["geometry"]
+            features.append(feature)
+        body = {
+            "objectIdFieldName": "OBJECTID",
+            "features": features,
+        }
+        if offset + count < len(rows):
+            body["exceededTransferLimit"] = True
+        if params.get("f") == "pbf":
+            return (
+                200,
+                encode_query_response(body, fields),
+                {"Content-Type": PBF_CONTENT_TYPE},
+            )
+        return 200, self.encode(params, body), {"Content-Type": "application/json"}
+
+    def attachment_infos(self, object_id):
+        if not 1 <= object_id <= self.litigations:
+            return []
+        return attachment_infos(object_id, self.synthetic)
+
+    def list_attachments(self, request: FakeRequest):
+        infos = self.attachment_infos(int(request.match["object_id"]))
+        return 200, self.encode(self.params(request), {"attachmentInfos": infos})
+
+    def get_attachment(self, request: FakeRequest):
+        attachment_id = int(request.match["attachment_id"])
+        info = next(
+            (
+                info
+                for info in self.attachment_infos(int(request.match["object_id"]))
+                if info["id"] == attachment_id
+            ),
+            None,
+        )
+        if info is None:
+            return 404, {"error": {"code": 404, "message": "Attachment not found"}}
+        return (
+            200,
+            iter_payload(attachment_id, info["size"], info["contentType"]),
+            {"Content-Type": info["contentType"], "Content-Length": str(info["size"])},
+        )
+
+    def query_attachments(self, request: FakeRequest):
+        params = self.params(request)
+        object_ids = [int(x) for x in params.get("objectIds", "").split(",") if x]
+        groups = []
+        for object_id in object_ids:
+            infos = self.attachment_infos(object_id)
+            if infos:
+                groups.append({"parentObjectId": object_id, "attachmentInfos": infos})
+        return 200, self.encode(params, {"attachmentGroups": groups})
+
+    def add_features(self, request: FakeRequest):
+        params = self.params(request)
+        table = self.tables.get(request.match["table"])
+        if table is None:
+            return 400, {"error": {"code": 400, "message": "Invalid table"}}
+        results = []
+        for feature in json.loads(params.get("features") or "[]"):
+            with self._lock:
+                object_id = self._next_object_ids[request.match["table"]]
+                self._next_object_ids[request.match["table"]] += 1
+            attributes = dict(feature.get("attributes") or {})
+            attributes[GISLitigationHistoryFields.OBJECT_ID.value] = object_id
+            table.append(
+                {"attributes": attributes, "geometry": feature.get("geometry")}
+            )
+            results.append({"objectId": object_id, "success": True})
+        return 200, {"addResults": results}
+
+    def update_features(self, request: FakeRequest):
+        params = self.params(request)
+        table = self.tables.get(request.match["table"])
+        if table is None:
+            return 400, {"error": {"code": 400, "message": "Invalid table"}}
+        object_id_field = GISActiveLitigationsFields.OBJECT_ID.value
+        with self._lock:
+            rows = {row["attributes"].get(object_id_field): row for row in table}
+            results = []
+            for feature in json.loads(params.get("features") or "[]"):
+                attributes = feature.get("attributes") or {}
+                object_id = attributes.get(object_id_field)
+                row = rows.get(object_id)
+                if row is None:
+                    results.append(
+                        {
+                            "objectId": object_id,
+                            "success": False,
+                            "error": {"code": 1019, "description": "Not found"},
+                        }
+                    )
+                    continue
+                row["attributes"].update(attributes)
+                if feature.get("geometry"):
+                    row["geometry"] = feature["geometry"]
+                results.append({"objectId": object_id, "success": True})
+        return 200, {"updateResults": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_server_arguments(parser)
+    parser.add_argument("--litigations", type=int, default=1000)
+    parser.add_argument("--max-record-count", type=int, default=2000)
+    parser.add_argument("--dismissed-rate", type=float, default=0.1)
+    parser.add_argument("--attachment-scale", type=float, default=1.0)
+    args = parser.parse_args()
+    serve_forever(
+        FakeGISServer(
+            config_from_args(args),
+            port=args.port,
+            litigations=args.litigations,
+            max_record_count=args.max_record_count,
+            synthetic=SyntheticConfig(
+                seed=args.seed,
+                dismissed_rate=args.dismissed_rate,
+                attachment_scale=args.attachment_scale,
+            ),
+        )
+    )
@@ -0,0 +1,269 @@
+"""Minimal threaded HTTP server used by the fake GIS and Clio services.
+
+Routes are (method, path regex, handler) triples. Handlers receive a `FakeRequest`
+and return `(status, body)` or `(status, body, headers)`; dict and list bodies are
+sent as JSON, and any other iterable is streamed chunk by chunk with the
+Content-Length the handler sets. Every server can add latency, fail a share of requests with 500s and
+answer 429 with Retry-After once a requests-per-second budget is spent.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+
+@dataclass
+class FakeServerConfig:
+    ## Seconds added to every response, plus up to `jitter` seconds more
+    latency: float = 0.0
+    jitter: float = 0.0
+    ## Share of requests answered with a 500
+    error_rate: float = 0.0
+    ## Requests per second before answering 429; 0 disables rate limiting
+    rate_limit: float = 0.0
+    retry_after: int = 1
+    seed: int = 0
+
+
+@dataclass
+class FakeRequest:
+    method: str
+    path: str
+    query: Dict[str, List[str]]
+    headers: Dict[str, str]
+    body: bytes
+    match: Any = None
+
+    def arg(self, name, default=None):
+        values = self.query.get(name)
+        return values[-1] if values else default
+
+    def args(self, name) -> List[str]:
+        return self.query.get(name, []) + self.query.get(f"{name}[]", [])
+
+    def json(self):
+        return json.loads(self.body) if self.body else None
+
+    def form(self) -> Dict[str, List[str]]:
+        return parse_qs(self.body.decode("utf-8"), keep_blank_values=True)
+
+
+Handler = Callable[[FakeRequest], Tuple]
+
+
+class _TokenBucket:
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class FakeServer:
+    name = "fake"
+
+    def __init__(self, config: Optional[FakeServerConfig] = None, port=0):
+        self.config = config or FakeServerConfig()
+        self.port = port
+        self.routes: List[Tuple[str, Any, Handler, str]] = []
+        self.requests: Counter = Counter()
+        self.responses: Counter = Counter()
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(self.config.seed)
+        self._bucket = (
+            _TokenBucket(self.config.rate_limit) if self.config.rate_limit else None
+        )
+        self._server = None
+        self._thread = None
+
+    def route(self, method, pattern, handler: Handler):
+        ## Requests are counted under a readable label, e.g. "GET /api/v4/matters/{id}"
+        label = re.sub(r"\(\?P<(\w+)>[^)]*\)", r"{\1}", pattern)
+        label = label.replace(r"(?:\.json)?", "").replace(".*/", ".../")
+        self.routes.append((method, re.compile(pattern + "$"), handler, label))
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self):
+        server = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            ## Headers and body are written separately; without TCP_NODELAY every
+            ## response can stall on the client's delayed ACK
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def handle(self):
+                try:
+                    super().handle()
+                except (BrokenPipeError, ConnectionResetError):
+                    ## Streaming clients hang up once they read enough
+                    pass
+
+            def handle_any(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                status, payload, headers = server.dispatch(
+                    self.command, self.path, dict(self.headers), body
+                )
+                if isinstance(payload, (dict, list)):
+                    payload = json.dumps(payload).encode("utf-8")
+                    headers.setdefault("Content-Type", "application/json")
+                elif isinstance(payload, str):
+                    payload = payload.encode("utf-8")
+                if isinstance(payload, bytes):
+                    headers["Content-Length"] = str(len(payload))
+                    payload = [payload]
+                ## Anything else is an iterable of chunks and the handler has set
+                ## Content-Length
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                sent = 0
+                for chunk in payload:
+                    self.wfile.write(chunk)
+                    sent += len(chunk)
+                with server._lock:
+                    server.bytes_sent += sent
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = handle_any
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", self.port), RequestHandler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _delay(self):
+        delay = self.config.latency
+        if self.config.jitter:
+            with self._lock:
+                delay += self._random.random() * self.config.jitter
+        if delay:
+            time.sleep(delay)
+
+    def _inject_error(self):
+        if not self.config.error_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.config.error_rate
+
+    def dispatch(self, method, raw_path, headers, body):
+        parts = urlsplit(raw_path)
+        for route_method, pattern, handler, label in self.routes:
+            match = pattern.match(parts.path)
+            if route_method != method or not match:
+                continue
+            route = f"{method} {label}"
+            with self._lock:
+                self.requests[route] += 1
+            self._delay()
+            if self._bucket is not None and not self._bucket.take():
+                status, payload, extra = (
+                    429,
+                    {"error": "rate limited"},
+                    {"Retry-After": str(self.config.retry_after)},
+                )
+            elif self._inject_error():
+                status, payload, extra = 500, {"error": "injected failure"}, {}
+            else:
+                request = FakeRequest(
+                    method=method,
+                    path=parts.path,
+                    query=parse_qs(parts.query, keep_blank_values=True),
+                    headers=headers,
+                    body=body,
+                    match=match,
+                )
+                try:
+                    result = handler(request)
+                except Exception as e:
+                    result = (500, {"error": repr(e)})
+                status, payload = result[0], result[1]
+                extra = dict(result[2]) if len(result) > 2 else {}
+            with self._lock:
+                self.responses[status] += 1
+            return status, payload, extra
+        with self._lock:
+            self.responses[404] += 1
+        return 404, {"error": f"no route for {method} {parts.path}"}, {}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "responses": {str(k): v for k, v in self.responses.items()},
+                "total_requests": sum(self.requests.values()),
+                "bytes_sent": self.bytes_sent,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests.clear()
+            self.responses.clear()
+            self.bytes_sent = 0
+
+
+def add_server_arguments(parser):
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def config_from_args(args):
+    return FakeServerConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        seed=args.seed,
+    )
+
+
+def serve_forever(server: FakeServer):
+    server.start()
+    print(f"{server.name} listening on {server.url}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,89 @@
+"""Bytes on the wire and decode time of GIS query responses per format.
+
+python -m benchmarks.gis_formats --litigations 100000 --page-size 2000
+
+Active litigations from `benchmarks.synthetic` are served in pages the way a pull
+receives them, encoded as `f=pjson`, `f=json` and `f=pbf`. For each format the
+benchmark reports the response bytes, their gzipped size (what a server
+compressing responses sends) and the time to decode every page and build the
+`GISIncident` records a pull queues.
+"""
+
+import argparse
+import gzip
+import json
+import time
+
+from benchmarks.arcgis_pbf import encode_query_response
+from benchmarks.synthetic import SyntheticConfig, iter_litigations
+from utils.arcgis_pbf import decode_query_response
+from utils.data_bridge import incident_from_feature
+from utils.gis_client import ACTIVE_LITIGATION_FIELDS
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--litigations", type=int, default=100000)
+parser.add_argument("--page-size", type=int, default=2000)
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--repeat", type=int, help="best of N decodes", default=3)
+
+ENCODERS = {
+    "pjson": lambda body: json.dumps(body, indent=2).encode("utf-8"),
+    "json": lambda body: json.dumps(body, separators=(",", ":")).encode("utf-8"),
+    "pbf": lambda body: encode_query_response(body, ACTIVE_LITIGATION_FIELDS),
+}
+DECODERS = {
+    "pjson": json.loads,
+    "json": json.loads,
+    "pbf": decode_query_response,
+}
+
+
+def pages(count, page_size, config: SyntheticConfig):
+    page = []
+    for row in iter_litigations(count, config):
+        page.append(
+            {
+                "attributes": {
+                    name: row["attributes"].get(name)
+                    for name in ACTIVE_LITIGATION_FIELDS
+                },
+                "geometry": row["geometry"],
+            }
+        )
+        if len(page) == page_size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+def bench(name, payloads, repeat):
+    size = sum(len(payload) for payload in payloads)
+    compressed = sum(len(gzip.compress(payload, 6)) for payload in payloads)
+    decode = DECODERS[name]
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        records = 0
+        for payload in payloads:
+            for feature in decode(payload)["features"]:
+                incident_from_feature(feature)
+                records += 1
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(
+        f"{name:<6} {size / 1e6:>9.1f} MB  gzip {compressed / 1e6:>8.1f} MB"
+        f"  decode {best:>7.2f}s  {records / best:>10,.0f} records/s"
+    )
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    config = SyntheticConfig(seed=args.seed)
+    bodies = [
+        {"objectIdFieldName": "OBJECTID", "features": page}
+        for page in pages(args.litigations, args.page_size, config)
+    ]
+    print(f"{args.litigations} litigations in {len(bodies)} pages")
+    for name, encode in ENCODERS.items():
+        bench(name, [encode(body) for body in bodies], args.repeat)
@@ -0,0 +1,48 @@
+"""Compare queue segment footprint and write/read time per compression.
+
+    python -m benchmarks.segments --lines 50000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.codec import make_incident, make_matter_log
+from utils.queue_segments import EXTENSIONS, SegmentWriter, iter_segment
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--lines", type=int, help="records per queue", default=50000)
+parser.add_argument("--seed", type=int, default=0)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    datasets = {
+        "active_litigations": [make_incident(rng, i) for i in range(args.lines)],
+        "matters": [make_matter_log(rng, i) for i in range(args.lines)],
+    }
+    for dataset, records in datasets.items():
+        print(f"{dataset} ({len(records)} lines)")
+        for compression in EXTENSIONS:
+            with tempfile.TemporaryDirectory() as tmp:
+                start = time.perf_counter()
+                try:
+                    with SegmentWriter(tmp, "queue", compression=compression) as w:
+                        w.write_all(records)
+                except ImportError:
+                    print(f"{compression:<6} not installed")
+                    continue
+                written = time.perf_counter() - start
+                size = sum(os.path.getsize(path) for path in w.paths)
+                start = time.perf_counter()
+                read = sum(1 for path in w.paths for _ in iter_segment(path))
+                elapsed = time.perf_counter() - start
+                assert read == len(records)
+                print(
+                    f"{compression:<6} {size / 1e6:>8.1f} MB on disk"
+                    f" ({w.bytes_written / max(size, 1):.1f}x)"
+                    f"  write {written:.2f}s  read {elapsed:.2f}s"
+                    f"  {len(w.paths)} segment(s)"
+                )
@@ -0,0 +1,328 @@
+"""End-to-end benchmark of the four sync jobs against the fake GIS and Clio servers.
+
+    python -m benchmarks.sync_jobs --sizes 1000,10000,100000
+    python -m benchmarks.sync_jobs --sizes 1000 --baseline benchmarks/results/abc1234.json
+
+Every dataset size gets fresh fake servers and a fresh BASE_DATA_DIR. The fake Clio
+server is seeded with a matter for every GIS litigation, as after a migration.
+`bootstrap` runs first and is not timed, then pull_gis_updates, push_gis_updates,
+pull_clio_updates and push_clio_updates each run in their own process so wall time
+and peak RSS are per job. Request counts come from the fake servers and per-stage
+records/sec from each job's metrics summary.
+
+Results are written to benchmarks/results/{commit}.json. They are compared with
+--baseline, or with the newest other results file, and any job or stage slower than
+--threshold is flagged. Use --fail-on-regression to exit non-zero when one is found.
+"""
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_clio import FakeClioServer
+from benchmarks.fake_gis import FakeGISServer
+from benchmarks.fake_server import FakeServerConfig
+from benchmarks.synthetic import SyntheticConfig
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+JOBS = [
+    "pull_gis_updates",
+    "push_gis_updates",
+    "pull_clio_updates",
+    "push_clio_updates",
+]
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--sizes", help="comma separated litigation counts", default="1000,10000,100000"
+)
+parser.add_argument("--latency", type=float, help="fake server latency", default=0.0)
+parser.add_argument("--rate-limit", type=float, help="fake server rps", default=0.0)
+parser.add_argument("--error-rate", type=float, default=0.0)
+parser.add_argument("--workers", type=int, help="push_gis_updates --workers", default=1)
+parser.add_argument(
+    "--attachment-scale",
+    type=float,
+    help="multiplier on synthetic attachment sizes",
+    default=0.05,
+)
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--output", help="results file", default=None)
+parser.add_argument("--baseline", help="results file to compare with", default=None)
+parser.add_argument(
+    "--threshold", type=float, help="allowed slowdown, 0.2 = 20%%", default=0.2
+)
+parser.add_argument(
+    "--min-seconds",
+    type=float,
+    help="ignore slowdowns smaller than this many seconds",
+    default=0.5,
+)
+parser.add_argument("--fail-on-regression", action="store_true")
+parser.add_argument("--keep-data", action="store_true", help="keep BASE_DATA_DIRs")
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True
+        ).strip()
+        dirty = subprocess.check_output(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=ROOT,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if dirty else commit
+
+
+def peak_rss_mb(rusage):
+    ## ru_maxrss is in KB on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return rusage.ru_maxrss / scale
+
+
+def exit_code(status):
+    """The return code of a wait status, negative for a signal as in subprocess."""
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    if os.WIFEXITED(status):
+        return os.WEXITSTATUS(status)
+    return status
+
+
+def run_job(job, env, log_path, job_args=()):
+    with open(log_path, "wb") as log:
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", f"job.{job}", *job_args],
+            cwd=ROOT,
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+        _, status, rusage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - start
+    process.returncode = exit_code(status)
+    return {
+        "returncode": process.returncode,
+        "wall_seconds": wall,
+        "peak_rss_mb": peak_rss_mb(rusage),
+        "log": log_path,
+    }
+
+
+def job_summary(base_data_dir, job):
+    try:
+        with open(os.path.join(base_data_dir, "data", "metrics", f"{job}.json")) as f:
+            summary = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {
+        "status": summary.get("status"),
+        "stages": summary.get("stages", {}),
+    }
+
+
+def run_size(size, args):
+    config = FakeServerConfig(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        seed=args.seed,
+    )
+    base_data_dir = tempfile.mkdtemp(prefix=f"databridge-bench-{size}-")
+    auth_dir = os.path.join(base_data_dir, "auth")
+    os.makedirs(auth_dir)
+    with open(os.path.join(auth_dir, "token.json"), "w") as f:
+        json.dump(
+            {
+                "access_token": "benchmark-access-token",
+                "refresh_token": "benchmark-refresh-token",
+                "token_type": "bearer",
+                "expires_at": time.time() + 7 * 24 * 3600,
+            },
+            f,
+        )
+
+    print(f"{size} litigations (data in {base_data_dir})", flush=True)
+    setup_start = time.perf_counter()
+    synthetic = SyntheticConfig(seed=args.seed, attachment_scale=args.attachment_scale)
+    gis = FakeGISServer(
+        config, litigations=size, max_record_count=size, synthetic=synthetic
+    )
+    clio = FakeClioServer(config, matters=size, synthetic=synthetic)
+    setup_seconds = time.perf_counter() - setup_start
+    results = {"size": size, "setup_seconds": setup_seconds, "jobs": {}}
+    with gis, clio:
+        env = {
+            **os.environ,
+            "PYTHONPATH": ROOT,
+            "BASE_DATA_DIR": base_data_dir,
+            "GIS_HOST": gis.url,
+            "CLIO_HOST": clio.url,
+            "CLIO_API_KEY": "benchmark",
+            "CLIO_API_SECRET": "benchmark",
+            "OAUTHLIB_INSECURE_TRANSPORT": "1",
+        }
+        bootstrap = run_job(
+            "bootstrap", env, os.path.join(base_data_dir, "bootstrap.log")
+        )
+        if bootstrap["returncode"]:
+            raise RuntimeError(f"bootstrap failed, see {bootstrap['log']}")
+        for job in JOBS:
+            gis.reset_stats()
+            clio.reset_stats()
+            job_args = (
+                ["--workers", str(args.workers)] if job == "push_gis_updates" else []
+            )
+            result = run_job(
+                job, env, os.path.join(base_data_dir, f"{job}.log"), job_args
+            )
+            gis_stats, clio_stats = gis.stats(), clio.stats()
+            result.update(job_summary(base_data_dir, job))
+            result["requests"] = {
+                "gis": gis_stats["total_requests"],
+                "clio": clio_stats["total_requests"],
+            }
+            result["responses"] = {
+                "gis": gis_stats["responses"],
+                "clio": clio_stats["responses"],
+            }
+            result["requests_by_route"] = {
+                "gis": gis_stats["requests"],
+                "clio": clio_stats["requests"],
+            }
+            result["bytes_received"] = (
+                gis_stats["bytes_sent"] + clio_stats["bytes_sent"]
+            )
+            results["jobs"][job] = result
+            print(format_job(job, result), flush=True)
+    if not args.keep_data:
+        shutil.rmtree(base_data_dir, ignore_errors=True)
+    return results
+
+
+def format_job(job, result):
+    line = (
+        f"  {job:<18} {result['wall_seconds']:>8.2f}s"
+        f" {result['peak_rss_mb']:>7.1f} MB"
+        f"  gis {result['requests']['gis']:>7} req"
+        f"  clio {result['requests']['clio']:>7} req"
+    )
+    if result["returncode"]:
+        line += f"  FAILED ({result['returncode']}, see {result['log']})"
+    for stage, values in sorted(result.get("stages", {}).items()):
+        rate = values.get("records_per_second")
+        line += (
+            f"\n    {stage:<32} {values['seconds']:>8.2f}s {values['records']:>8}"
+            f" records {rate or 0:>10.1f}/s"
+        )
+    return line
+
+
+def latest_results(exclude):
+    paths = [
+        path
+        for path in glob.glob(os.path.join(RESULTS_DIR, "*.json"))
+        if os.path.abspath(path) != os.path.abspath(exclude)
+    ]
+    return max(paths, key=os.path.getmtime) if paths else None
+
+
+def compare(current, baseline, threshold, min_seconds):
+    """Return a description of every job and stage that got slower than threshold."""
+    regressions = []
+    baseline_runs = {run["size"]: run for run in baseline.get("runs", [])}
+    for run in current["runs"]:
+        base_run = baseline_runs.get(run["size"])
+        if base_run is None:
+            continue
+        for job, result in run["jobs"].items():
+            base = base_run["jobs"].get(job)
+            if base is None:
+                continue
+            before, after = base["wall_seconds"], result["wall_seconds"]
+            if after - before > min_seconds and after > before * (1 + threshold):
+                regressions.append(
+                    f"{run['size']} {job}: wall time {before:.2f}s -> {after:.2f}s"
+                )
+            before, after = base["peak_rss_mb"], result["peak_rss_mb"]
+            if after > before * (1 + threshold):
+                regressions.append(
+                    f"{run['size']} {job}: peak RSS {before:.1f} MB -> {after:.1f} MB"
+                )
+            for stage, values in result.get("stages", {}).items():
+                base_stage = base.get("stages", {}).get(stage)
+                if not base_stage or not base_stage.get("records_per_second"):
+                    continue
+                if values["seconds"] - base_stage["seconds"] <= min_seconds:
+                    continue
+                before = base_stage["records_per_second"]
+                after = values.get("records_per_second") or 0
+                if after < before / (1 + threshold):
+                    regressions.append(
+                        f"{run['size']} {job} {stage}: "
+                        f"{before:.1f} -> {after:.1f} records/s"
+                    )
+    return regressions
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    commit = git_commit()
+    results = {
+        "commit": commit,
+        "created_at": datetime.datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            key: getattr(args, key)
+            for key in (
+                "latency",
+                "rate_limit",
+                "error_rate",
+                "workers",
+                "attachment_scale",
+                "seed",
+            )
+        },
+        "runs": [],
+    }
+    for size in [int(size) for size in args.sizes.split(",") if size]:
+        results["runs"].append(run_size(size, args))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    baseline_path = args.baseline or latest_results(exclude=output)
+    if baseline_path is None:
+        sys.exit(0)
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    if baseline.get("config") != results["config"]:
+        print(f"Warning: {baseline_path} was run with {baseline.get('config')}")
+    regressions = compare(results, baseline, args.threshold, args.min_seconds)
+    print(f"Compared with {baseline_path} ({baseline.get('commit')})")
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print("No regressions")
+    failed = any(
+        job["returncode"] for run in results["runs"] for job in run["jobs"].values()
+    )
+    if failed or (regressions and args.fail_on_regression):
+        sys.exit(1)
@@ -0,0 +1,543 @@
+"""Seeded synthetic GIS litigations, litigation history, attachments and Clio matters.
+
+Every record is generated from (seed, kind, object id) alone, so any record can be
+regenerated on its own and whole datasets are streamed one record at a time instead of
+being held in memory. The same object id always describes the same case everywhere: a
+matter carries the civil warrant, parcel and address of the litigation it came from,
+and attachment payloads are reproduced byte for byte from their id and size.
+
+    python -m benchmarks.synthetic litigations --count 1000000 -o litigations.jsonl.gz
+    python -m benchmarks.synthetic matters --count 100000 -o matters.jsonl
+    python -m benchmarks.synthetic payloads --count 1000 -o attachments/
+"""
+
+import argparse
+import datetime
+import gzip
+import math
+import os
+import random
+import sys
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from utils.constants import (
+    CLIO_CUSTOM_FIELDS,
+    ClioCustomFieldNames,
+    GISActiveLitigationsFields,
+    GISLitigationHistoryFields,
+)
+from utils.serialization import dump_line
+
+## Attachment ids are object_id * ATTACHMENTS_PER_LITIGATION + n, so an attachment can
+## be traced back to its litigation without a lookup table
+ATTACHMENTS_PER_LITIGATION = 10
+PAYLOAD_CHUNK_BYTES = 64 * 1024
+
+EPOCH_START = datetime.datetime(2018, 1, 1, tzinfo=datetime.timezone.utc)
+STREETS = [
+    "Main St",
+    "Poplar Ave",
+    "Union Ave",
+    "Summer Ave",
+    "Lamar Ave",
+    "Jackson Ave",
+]
+STREETS += [
+    "Chelsea Ave",
+    "Walker Ave",
+    "Elvis Presley Blvd",
+    "Park Ave",
+    "Madison Ave",
+]
+COURT_STATUSES = [
+    ("Hearing", 30),
+    ("Status", 20),
+    ("Initial Setting", 12),
+    ("Stay", 8),
+    ("Receiver", 6),
+    ("Non-Compliance", 6),
+    ("Dev Plan", 5),
+    ("Nuisance", 4),
+    ("Payment", 3),
+    ("Demo", 3),
+    ("Dismissed", 3),
+]
+DISMISSED_CONDITIONS = [
+    option["option"]
+    for field in CLIO_CUSTOM_FIELDS
+    if field["name"] == ClioCustomFieldNames.DISMISSED_CONDITION.value
+    for option in field["picklist_options"]
+]
+INSPECTION_NOTES = [
+    "Vacant, open and unsecured.",
+    "Overgrown lot with debris.",
+    "Roof partially collapsed.",
+    "Boarded, secure at time of inspection.",
+    "Fire damage to rear of structure.",
+    "Owner reports rehab in progress.",
+]
+COURT_NOTES = [
+    "Reset for status.",
+    "Owner to submit rehab plan.",
+    "Continued, receiver appointed.",
+    "Defendant did not appear.",
+    "Work in progress, reset 60 days.",
+]
+
+## (content type, extension, magic bytes, share, median bytes, sigma)
+ATTACHMENT_TYPES = [
+    ("image/jpeg", "jpg", b"\xff\xd8\xff\xe0\x00\x10JFIF\x00", 70, 800_000, 0.8),
+    ("application/pdf", "pdf", b"%PDF-1.7\n", 20, 250_000, 1.0),
+    ("image/png", "png", b"\x89PNG\r\n\x1a\n", 10, 400_000, 0.9),
+]
+
+
+@dataclass
+class SyntheticConfig:
+    seed: int = 0
+    ## Share of litigations with a dismissed status in the history table
+    dismissed_rate: float = 0.1
+    ## Share of litigations with a next court date on the Clio calendar
+    calendar_entry_rate: float = 0.5
+    ## Mean attachments per litigation (0 to ATTACHMENTS_PER_LITIGATION - 1 each)
+    attachments_per_litigation: float = 1.2
+    ## Multiplier applied to every attachment size, and hard bounds after it
+    attachment_scale: float = 1.0
+    min_attachment_bytes: int = 1024
+    max_attachment_bytes: int = 25 * 1024 * 1024
+
+
+def _rng(config: SyntheticConfig, kind, key):
+    return random.Random(f"{config.seed}:{kind}:{key}")
+
+
+def _epoch_ms(value: datetime.datetime):
+    return int(value.timestamp() * 1e3)
+
+
+def _weighted(rng, choices):
+    return rng.choices([value for value, _ in choices], [w for _, w in choices])[0]
+
+
+def civil_warrant(object_id):
+    return f"CW-{object_id:08d}"
+
+
+## GIS active litigations
+
+
+def litigation(object_id, config: SyntheticConfig = SyntheticConfig()) -> Dict:
+    """An active-litigation feature with every GISActiveLitigationsFields attribute."""
+    rng = _rng(config, "litigation", object_id)
+    created = EPOCH_START + datetime.timedelta(seconds=rng.randint(0, 3 * 365 * 86400))
+    modified = created + datetime.timedelta(seconds=rng.randint(0, 365 * 86400))
+    next_court_date = modified + datetime.timedelta(days=rng.randint(7, 120))
+    address = f"{rng.randint(100, 9999)} {rng.choice(STREETS)}"
+    district = rng.randint(1, 7)
+    attributes = {
+        GISActiveLitigationsFields.OBJECT_ID.value: object_id,
+        GISActiveLitigationsFields.LAST_EDITED_DATE.value: _epoch_ms(modified),
+        GISActiveLitigationsFields.LAST_MODIFIED_DATE.value: _epoch_ms(modified),
+        GISActiveLitigationsFields.CREATION_DATE.value: _epoch_ms(created),
+        GISActiveLitigationsFields.INCIDENT_NUMBER.value: f"SR-{object_id:07d}",
+        GISActiveLitigationsFields.PARCEL_ID.value: (
+            f"0{rng.randint(10, 99)}0{rng.randint(100, 999)} {rng.randint(10000, 99999)}"
+        ),
+        GISActiveLitigationsFields.CITY_FILE_NO.value: f"CE{object_id:07d}",
+        GISActiveLitigationsFields.SUB_DISTRICT.value: f"{district}-District {district}",
+        GISActiveLitigationsFields.NPA_INSPECT_SUMMARY.value: " ".join(
+            rng.sample(INSPECTION_NOTES, rng.randint(1, 4))
+        ),
+        GISActiveLitigationsFields.COURT_STATUS.value: _weighted(rng, COURT_STATUSES),
+        GISActiveLitigationsFields.LOCATION.value: address,
+        GISActiveLitigationsFields.NEXT_COURT_DATE.value: _epoch_ms(next_court_date),
+        GISActiveLitigationsFields.PROPERTY_OWNER.value: f"Owner {rng.randint(1, 10**6)}",
+        GISActiveLitigationsFields.DEFENDENT.value: f"Defendent {object_id}",
+        GISActiveLitigationsFields.CIVIL_WARRANT.value: civil_warrant(object_id),
+        GISActiveLitigationsFields.LATEST_COURT_NOTES.value: rng.choice(COURT_NOTES),
+        GISActiveLitigationsFields.COURT_NOTES.value: " ".join(
+            rng.choices(COURT_NOTES, k=rng.randint(1, 6))
+        ),
+        GISActiveLitigationsFields.LITIGATION_HISTORY_INCIDENT_NUMBER.value: (
+            f"SR-{object_id:07d}"
+        ),
+    }
+    geometry = {
+        "x": round(-90.05 + rng.uniform(-0.15, 0.15), 6),
+        "y": round(35.12 + rng.uniform(-0.1, 0.1), 6),
+    }
+    return {"attributes": attributes, "geometry": geometry}
+
+
+def iter_litigations(
+    count, config: SyntheticConfig = SyntheticConfig(), start=1
+) -> Iterator[Dict]:
+    for object_id in range(start, start + count):
+        yield litigation(object_id, config)
+
+
+## GIS litigation history
+
+
+def litigation_history(
+    object_id, config: SyntheticConfig = SyntheticConfig()
+) -> Optional[Dict]:
+    """The dismissed-status history row for a litigation, or None for most of them."""
+    rng = _rng(config, "history", object_id)
+    if rng.random() >= config.dismissed_rate:
+        return None
+    attributes = litigation(object_id, config)["attributes"]
+    return {
+        "attributes": {
+            GISLitigationHistoryFields.OBJECT_ID.value: object_id,
+            GISLitigationHistoryFields.CIVIL_WARRANT.value: civil_warrant(object_id),
+            GISLitigationHistoryFields.COURT_STATUS.value: "Dismissed",
+            GISLitigationHistoryFields.SUB_DISTRICT.value: int(
+                attributes[GISActiveLitigationsFields.SUB_DISTRICT.value].split("-")[0]
+            ),
+            GISLitigationHistoryFields.COURT_NOTES.value: rng.choice(COURT_NOTES),
+            GISLitigationHistoryFields.DISMISS_STATUS.value: "Dismissed",
+            GISLitigationHistoryFields.DISMISSED_CONDITION.value: rng.choice(
+                DISMISSED_CONDITIONS
+            ),
+            GISLitigationHistoryFields.NEXT_COURT_DATE.value: attributes[
+                GISActiveLitigationsFields.NEXT_COURT_DATE.value
+            ],
+            GISLitigationHistoryFields.ADDRESS.value: attributes[
+                GISActiveLitigationsFields.LOCATION.value
+            ],
+            GISLitigationHistoryFields.PARCEL_ID.value: attributes[
+                GISActiveLitigationsFields.PARCEL_ID.value
+            ],
+            GISLitigationHistoryFields.INCIDENT_NUMBER.value: attributes[
+                GISActiveLitigationsFields.INCIDENT_NUMBER.value
+            ],
+        }
+    }
+
+
+def iter_litigation_history(
+    count, config: SyntheticConfig = SyntheticConfig(), start=1
+) -> Iterator[Dict]:
+    for object_id in range(start, start + count):
+        row = litigation_history(object_id, config)
+        if row is not None:
+            yield row
+
+
+## GIS attachments
+
+
+def attachment_infos(
+    object_id, config: SyntheticConfig = SyntheticConfig()
+) -> List[Dict]:
+    """attachmentInfos for a litigation. Sizes are log-normal per content type."""
+    rng = _rng(config, "attachments", object_id)
+    ## Poisson number of attachments, capped by the id scheme
+    count, limit, product = 0, math.exp(-config.attachments_per_litigation), 1.0
+    while count < ATTACHMENTS_PER_LITIGATION - 1:
+        product *= rng.random()
+        if product <= limit:
+            break
+        count += 1
+    infos = []
+    for n in range(1, count + 1):
+        content_type, extension, _, _, median, sigma = rng.choices(
+            ATTACHMENT_TYPES, [kind[3] for kind in ATTACHMENT_TYPES]
+        )[0]
+        size = int(
+            rng.lognormvariate(math.log(median), sigma) * config.attachment_scale
+        )
+        size = max(config.min_attachment_bytes, min(size, config.max_attachment_bytes))
+        attachment_id = object_id * ATTACHMENTS_PER_LITIGATION + n
+        infos.append(
+            {
+                "id": attachment_id,
+                "contentType": content_type,
+                "size": size,
+                "name": f"IMG_{attachment_id}.{extension}",
+            }
+        )
+    return infos
+
+
+def attachment_info(attachment_id, config: SyntheticConfig = SyntheticConfig()):
+    object_id = attachment_id // ATTACHMENTS_PER_LITIGATION
+    for info in attachment_infos(object_id, config):
+        if info["id"] == attachment_id:
+            return info
+    return None
+
+
+def iter_attachments(
+    count, config: SyntheticConfig = SyntheticConfig(), start=1
+) -> Iterator[Dict]:
+    """Attachment infos for `count` litigations, each with its parentObjectId."""
+    for object_id in range(start, start + count):
+        for info in attachment_infos(object_id, config):
+            yield {"parentObjectId": object_id, **info}
+
+
+def iter_payload(
+    attachment_id, size, content_type="image/jpeg", chunk_size=PAYLOAD_CHUNK_BYTES
+) -> Iterator[bytes]:
+    """Stream an attachment's bytes: the content type's magic number followed by
+    seeded noise, so the payload does not compress and is identical on every run."""
+    magic = next(
+        (kind[2] for kind in ATTACHMENT_TYPES if kind[0] == content_type), b""
+    )[:size]
+    rng = random.Random(f"payload:{attachment_id}")
+    if magic:
+        yield magic
+    remaining = size - len(magic)
+    while remaining > 0:
+        n = min(chunk_size, remaining)
+        ## Random.randbytes needs Python 3.9
+        chunk = rng.getrandbits(8 * n).to_bytes(n, "little")
+        remaining -= len(chunk)
+        yield chunk
+
+
+def attachment_payload(attachment_id, size, content_type="image/jpeg") -> bytes:
+    return b"".join(iter_payload(attachment_id, size, content_type))
+
+
+## Clio
+
+
+def custom_field_definitions(first_id=1000) -> List[Dict]:
+    """CLIO_CUSTOM_FIELDS with ids and picklist option ids assigned, shaped like the
+    custom_fields.json entity saved by bootstrap."""
+    ids = iter(range(first_id, first_id + 10**6))
+    fields = []
+    for field in CLIO_CUSTOM_FIELDS:
+        fields.append(
+            {
+                "id": next(ids),
+                "name": field["name"],
+                "field_type": field["field_type"],
+                "picklist_options": [
+                    {"id": next(ids), "option": option["option"]}
+                    for option in field.get("picklist_options") or []
+                ],
+            }
+        )
+    return fields
+
+
+def matter_field_values(object_id, config: SyntheticConfig = SyntheticConfig()):
+    """Matter custom field values by field name, taken from the litigation."""
+    feature = litigation(object_id, config)
+    attributes, geometry = feature["attributes"], feature["geometry"]
+    history = litigation_history(object_id, config)
+    values = {
+        ClioCustomFieldNames.GIS_OBJECT_ID.value: object_id,
+        ClioCustomFieldNames.CIVIL_WARRANT.value: civil_warrant(object_id),
+        ClioCustomFieldNames.LONGITUDE.value: str(geometry["x"]),
+        ClioCustomFieldNames.LATITUDE.value: str(geometry["y"]),
+    }
+    for name, field in [
+        (
+            ClioCustomFieldNames.INCIDENT_NUMBER,
+            GISActiveLitigationsFields.INCIDENT_NUMBER,
+        ),
+        (ClioCustomFieldNames.PARCEL_ID, GISActiveLitigationsFields.PARCEL_ID),
+        (ClioCustomFieldNames.CITY_FILE_NO, GISActiveLitigationsFields.CITY_FILE_NO),
+        (ClioCustomFieldNames.SUB_DISTRICT, GISActiveLitigationsFields.SUB_DISTRICT),
+        (
+            ClioCustomFieldNames.NPA_INSPECT_SUMMARY,
+            GISActiveLitigationsFields.NPA_INSPECT_SUMMARY,
+        ),
+        (ClioCustomFieldNames.COURT_STATUS, GISActiveLitigationsFields.COURT_STATUS),
+        (ClioCustomFieldNames.LOCATION, GISActiveLitigationsFields.LOCATION),
+        (
+            ClioCustomFieldNames.PROPERTY_OWNER,
+            GISActiveLitigationsFields.PROPERTY_OWNER,
+        ),
+        (ClioCustomFieldNames.DEFENDENT, GISActiveLitigationsFields.DEFENDENT),
+        (
+            ClioCustomFieldNames.LATEST_COURT_NOTES,
+            GISActiveLitigationsFields.LATEST_COURT_NOTES,
+        ),
+    ]:
+        values[name.value] = attributes[field.value]
+    if history is not None:
+        history_attributes = history["attributes"]
+        values[ClioCustomFieldNames.COURT_STATUS.value] = "Dismissed"
+        values[ClioCustomFieldNames.DISMISS_STATUS.value] = history_attributes[
+            GISLitigationHistoryFields.DISMISS_STATUS.value
+        ]
+        values[ClioCustomFieldNames.DISMISSED_CONDITION.value] = history_attributes[
+            GISLitigationHistoryFields.DISMISSED_CONDITION.value
+        ]
+    return values
+
+
+def custom_field_values(values: Dict, fields: List[Dict], value_ids=None):
+    """Clio custom_field_values for values by field name. Picklist values are replaced
+    by their option id, as Clio returns them."""
+    fields_by_name = {field["name"]: field for field in fields}
+    value_ids = value_ids if value_ids is not None else iter(range(1, 10**12))
+    out = []
+    for name, value in values.items():
+        field = fields_by_name.get(name)
+        if field is None:
+            continue
+        if field["field_type"] == "picklist":
+            value = next(
+                (o["id"] for o in field["picklist_options"] if o["option"] == value),
+                None,
+            )
+        out.append(
+            {
+                "id": f"{field['field_type']}-{next(value_ids)}",
+                "etag": f'"{next(value_ids):032x}"',
+                "field_name": name,
+                "custom_field": {"id": field["id"]},
+                "value": value,
+            }
+        )
+    return out
+
+
+def matter(
+    object_id,
+    fields: Optional[List[Dict]] = None,
+    config: SyntheticConfig = SyntheticConfig(),
+    matter_id=None,
+) -> Dict:
+    """A Clio matter for a litigation, with custom_field_values for `fields`
+    (default: custom_field_definitions())."""
+    fields = fields if fields is not None else custom_field_definitions()
+    matter_id = matter_id if matter_id is not None else object_id
+    values = matter_field_values(object_id, config)
+    attributes = litigation(object_id, config)["attributes"]
+    updated = datetime.datetime.fromtimestamp(
+        attributes[GISActiveLitigationsFields.LAST_MODIFIED_DATE.value] / 1e3,
+        datetime.timezone.utc,
+    )
+    return {
+        "id": matter_id,
+        "etag": f'"{object_id:032x}"',
+        "description": values[ClioCustomFieldNames.LOCATION.value],
+        "updated_at": updated.isoformat(),
+        "custom_field_values": custom_field_values(
+            values, fields, iter(range(matter_id * 100, matter_id * 100 + 100))
+        ),
+    }
+
+
+def iter_matters(
+    count,
+    fields: Optional[List[Dict]] = None,
+    config: SyntheticConfig = SyntheticConfig(),
+    start=1,
+) -> Iterator[Dict]:
+    fields = fields if fields is not None else custom_field_definitions()
+    for object_id in range(start, start + count):
+        yield matter(object_id, fields, config)
+
+
+def calendar_entry(
+    object_id, config: SyntheticConfig = SyntheticConfig()
+) -> Optional[Dict]:
+    """The next court date for a litigation's matter, or None when it has none.
+    Returns summary, description, start_at and end_at."""
+    rng = _rng(config, "calendar", object_id)
+    if rng.random() >= config.calendar_entry_rate:
+        return None
+    attributes = litigation(object_id, config)["attributes"]
+    start = datetime.datetime.fromtimestamp(
+        attributes[GISActiveLitigationsFields.NEXT_COURT_DATE.value] / 1e3,
+        datetime.timezone.utc,
+    )
+    return {
+        "summary": attributes[GISActiveLitigationsFields.DEFENDENT.value],
+        "description": rng.choice(COURT_NOTES),
+        "start_at": start.isoformat(),
+        "end_at": (start + datetime.timedelta(hours=1)).isoformat(),
+    }
+
+
+## Command line
+
+
+def _open_output(path):
+    if path in (None, "-"):
+        return sys.stdout.buffer
+    if path.endswith(".gz"):
+        return gzip.open(path, "wb", compresslevel=3)
+    return open(path, "wb")
+
+
+def write_jsonl(records, path) -> Tuple[int, int]:
+    f = _open_output(path)
+    count = size = 0
+    try:
+        for record in records:
+            line = dump_line(record)
+            f.write(line)
+            count += 1
+            size += len(line)
+    finally:
+        if f is not sys.stdout.buffer:
+            f.close()
+    return count, size
+
+
+def write_payloads(count, config: SyntheticConfig, directory):
+    os.makedirs(directory, exist_ok=True)
+    files = size = 0
+    for info in iter_attachments(count, config):
+        with open(os.path.join(directory, info["name"]), "wb") as f:
+            for chunk in iter_payload(info["id"], info["size"], info["contentType"]):
+                f.write(chunk)
+        files += 1
+        size += info["size"]
+    return files, size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "kind",
+        choices=["litigations", "history", "attachments", "matters", "payloads"],
+    )
+    parser.add_argument(
+        "--count", type=int, help="litigations to generate", default=1000
+    )
+    parser.add_argument("--start", type=int, help="first object id", default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dismissed-rate", type=float, default=0.1)
+    parser.add_argument("--attachments-per-litigation", type=float, default=1.2)
+    parser.add_argument("--attachment-scale", type=float, default=1.0)
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="file (.gz to compress), or a directory for payloads; default stdout",
+        default=None,
+    )
+    args = parser.parse_args()
+    config = SyntheticConfig(
+        seed=args.seed,
+        dismissed_rate=args.dismissed_rate,
+        attachments_per_litigation=args.attachments_per_litigation,
+        attachment_scale=args.attachment_scale,
+    )
+    if args.kind == "payloads":
+        files, size = write_payloads(args.count, config, args.output or "payloads")
+        print(f"Wrote {files} attachments ({size / 1e6:.1f} MB)", file=sys.stderr)
+    else:
+        records = {
+            "litigations": iter_litigations,
+            "history": iter_litigation_history,
+            "attachments": iter_attachments,
+            "matters": iter_matters,
+        }[args.kind]
+        if args.kind == "matters":
+            records = records(args.count, config=config, start=args.start)
+        else:
+            records = records(args.count, config, start=args.start)
+        count, size = write_jsonl(records, args.output)
+        print(f"Wrote {count} {args.kind} ({size / 1e6:.1f} MB)", file=sys.stderr)
@@ -1,19 +1,34 @@
 ## Fetch all active litigation
 ## Create new matters
+
+## Before the other imports, so DATABRIDGE_PROFILE_STARTUP times them all
+from utils import startup
+
+startup.install_from_env()
+
 import datetime
 from utils.data_bridge import DataBridge
+from utils.gis_versions import GIS_FETCH_MODES
+from utils.metrics import metrics
 import argparse
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--max_records", type=int,
                     help="maximum number of records to pull", default=None, required=False)
+parser.add_argument("--fetch_mode", choices=GIS_FETCH_MODES,
+                    help="delta (default) or full; see utils/gis_versions.py",
+                    default=None, required=False)
+parser.add_argument("--workers", type=int,
+                    help="workers per queue file", default=1, required=False)
 
 
 if __name__ == "__main__":
     args = parser.parse_args()
-    data_bridge = DataBridge()
-    data_bridge.gis_to_clio_migration(max_records=args.max_records)
-    data_bridge.push_gis_updates(migrate=True)
-    now = (datetime.datetime.utcnow() + datetime.timedelta(seconds=1)).isoformat()
-    with open(data_bridge.clio_update_log_path, "w") as f:
-        f.write(now)
+    with metrics.job("migrate"):
+        data_bridge = DataBridge()
+        data_bridge.gis_to_clio_migration(
+            max_records=args.max_records, fetch_mode=args.fetch_mode
+        )
+        data_bridge.push_gis_updates(migrate=True, workers=args.workers)
+        now = (datetime.datetime.utcnow() + datetime.timedelta(seconds=1)).isoformat()
+        data_bridge.write_log(data_bridge.clio_update_log_path, now)
@@ -1,4 +1,10 @@
+## Before the other imports, so DATABRIDGE_PROFILE_STARTUP times them all
+from utils import startup
+
+startup.install_from_env()
+
 from utils.data_bridge import DataBridge
+from utils.metrics import metrics
 import argparse
 
 parser = argparse.ArgumentParser()
@@ -8,5 +14,6 @@ parser.add_argument("--max_records", type=int,
 
 if __name__ == "__main__":
     args = parser.parse_args()
-    data_bridge = DataBridge()
-    data_bridge.pull_clio_updates(args.max_records)
\ No newline at end of file
+    with metrics.job("pull_clio_updates"):
+        data_bridge = DataBridge()
+        data_bridge.pull_clio_updates(args.max_records)
\ No newline at end of file
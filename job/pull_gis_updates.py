@@ -1,15 +1,27 @@
 ## Get new documents
+
+## Before the other imports, so DATABRIDGE_PROFILE_STARTUP times them all
+from utils import startup
+
+startup.install_from_env()
+
 from utils.data_bridge import DataBridge
+from utils.gis_versions import GIS_FETCH_MODES
+from utils.metrics import metrics
 import argparse
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--max_records", type=int,
                     help="maximum number of records to pull", default=None, required=False)
-parser.add_argument("--migrate", type=bool,
-                    help="migration?", default=False, required=False)
+parser.add_argument("--fetch_mode", choices=GIS_FETCH_MODES,
+                    help="delta (default) or full; see utils/gis_versions.py",
+                    default=None, required=False)
 
 
 if __name__ == "__main__":
     args = parser.parse_args()
-    data_bridge = DataBridge()
-    data_bridge.pull_gis_updates(migrate=args.migrate, max_records=args.max_records)
+    with metrics.job("pull_gis_updates"):
+        data_bridge = DataBridge()
+        data_bridge.pull_gis_updates(
+            max_records=args.max_records, fetch_mode=args.fetch_mode
+        )
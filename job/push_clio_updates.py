@@ -1,6 +1,13 @@
+## Before the other imports, so DATABRIDGE_PROFILE_STARTUP times them all
+from utils import startup
+
+startup.install_from_env()
+
 from utils.data_bridge import DataBridge
+from utils.metrics import metrics
 
 
 if __name__ == "__main__":
-    data_bridge = DataBridge()
-    data_bridge.push_clio_updates()
+    with metrics.job("push_clio_updates"):
+        data_bridge = DataBridge()
+        data_bridge.push_clio_updates()
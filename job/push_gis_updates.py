@@ -2,15 +2,32 @@
 ## get unprocessed updates
 ## update next court date, update next court notes
 
+## Before the other imports, so DATABRIDGE_PROFILE_STARTUP times them all
+from utils import startup
+
+startup.install_from_env()
+
 from utils.data_bridge import DataBridge
+from utils.matter_documents import DOCUMENT_LOOKUPS
+from utils.metrics import metrics
 import argparse
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--migrate", type=bool,
                     help="migration?", default=False, required=False)
+parser.add_argument("--workers", type=int,
+                    help="workers per queue file", default=1, required=False)
+parser.add_argument("--document_lookup", choices=DOCUMENT_LOOKUPS,
+                    help="bulk (default) or single; see utils/matter_documents.py",
+                    default=None, required=False)
 
 
 if __name__ == "__main__":
     args = parser.parse_args()
-    data_bridge = DataBridge()
-    data_bridge.push_gis_updates(migrate=args.migrate)
+    with metrics.job("push_gis_updates"):
+        data_bridge = DataBridge()
+        data_bridge.push_gis_updates(
+            migrate=args.migrate,
+            workers=args.workers,
+            document_lookup=args.document_lookup,
+        )
@@ -0,0 +1,296 @@
+"""Decoder for ArcGIS query responses in the protobuf format (`f=pbf`).
+
+FeatureServer query results with `f=pbf` are an `esriPBuffer.FeatureCollectionPBuffer`
+message. Attribute values are sent once per feature, without field names, in the
+order of the result's field list, and geometry coordinates are integers delta-encoded
+against the previous vertex and quantized by the result's transform. That makes the
+payload several times smaller than `f=json`.
+
+This is a small hand-written reader for the fields the data bridge uses, so the job
+image needs no protobuf runtime. `decode_query_response` returns the same dictionary
+`f=json` would: `objectIdFieldName`, `exceededTransferLimit` and `features`, each
+with `attributes` and `geometry`. Coordinates are rounded to the precision of the
+transform so decoded points compare equal to their JSON counterparts.
+"""
+
+import math
+import struct
+from typing import Dict, List, Optional, Tuple
+
+CONTENT_TYPE = "application/x-protobuf"
+
+## esriPBuffer.FeatureCollectionPBuffer.GeometryType
+GEOMETRY_POINT = 0
+GEOMETRY_MULTIPOINT = 1
+GEOMETRY_POLYLINE = 2
+GEOMETRY_POLYGON = 3
+## esriPBuffer.FeatureCollectionPBuffer.QuantizeOriginPostion
+ORIGIN_UPPER_LEFT = 0
+ORIGIN_LOWER_LEFT = 1
+## Axes of the transform's Scale and Translate messages
+AXIS_X, AXIS_Y, AXIS_M, AXIS_Z = 0, 1, 2, 3
+
+_FLOAT = struct.Struct("<f")
+_DOUBLE = struct.Struct("<d")
+
+## Wire types
+_VARINT, _FIXED64, _LENGTH, _FIXED32 = 0, 1, 2, 5
+## One-byte keys of Feature.attributes and of the common Value types
+_ATTRIBUTE_KEY = 1 << 3 | _LENGTH
+_STRING_KEY = 1 << 3 | _LENGTH
+_SINT64_KEY = 8 << 3 | _VARINT
+
+
+def _varint(data, pos) -> Tuple[int, int]:
+    byte = data[pos]
+    if byte < 0x80:
+        return byte, pos + 1
+    result, shift = byte & 0x7F, 7
+    while True:
+        pos += 1
+        byte = data[pos]
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos + 1
+        shift += 7
+
+
+def _zigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def _signed64(value):
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _field(data, pos):
+    """Read the field at `pos`: (field number, wire type, value, next position).
+    Length-delimited values are given as their (start, end) offsets."""
+    key, pos = _varint(data, pos)
+    wire = key & 7
+    if wire == _VARINT:
+        value, pos = _varint(data, pos)
+    elif wire == _LENGTH:
+        length, pos = _varint(data, pos)
+        value = (pos, pos + length)
+        pos += length
+    elif wire == _FIXED64:
+        value = data[pos : pos + 8]
+        pos += 8
+    elif wire == _FIXED32:
+        value = data[pos : pos + 4]
+        pos += 4
+    else:
+        raise ValueError(f"Unsupported protobuf wire type {wire}")
+    return key >> 3, wire, value, pos
+
+
+def _fields(data, start, end):
+    """Yield (field number, wire type, value) for the message in data[start:end]."""
+    pos = start
+    while pos < end:
+        number, wire, value, pos = _field(data, pos)
+        yield number, wire, value
+
+
+def _packed_varints(data, start, end) -> List[int]:
+    values = []
+    pos = start
+    while pos < end:
+        value, pos = _varint(data, pos)
+        values.append(value)
+    return values
+
+
+def _string(data, span):
+    return data[span[0] : span[1]].decode("utf-8")
+
+
+def _value(data, start, end):
+    """One esriPBuffer Value; an empty message is a null attribute."""
+    for number, wire, value in _fields(data, start, end):
+        if number == 1:
+            return _string(data, value)
+        if number == 2:
+            return _FLOAT.unpack(value)[0]
+        if number == 3:
+            return _DOUBLE.unpack(value)[0]
+        if number in (4, 8):
+            return _zigzag(value)
+        if number in (5, 7):
+            return value
+        if number == 6:
+            return _signed64(value)
+        if number == 9:
+            return bool(value)
+    return None
+
+
+class _Transform:
+    def __init__(self):
+        self.origin = ORIGIN_UPPER_LEFT
+        self.scale = [1.0, 1.0, 1.0, 1.0]
+        self.translate = [0.0, 0.0, 0.0, 0.0]
+
+    @classmethod
+    def decode(cls, data, start, end) -> "_Transform":
+        transform = cls()
+        for number, wire, value in _fields(data, start, end):
+            if number == 1:
+                transform.origin = value
+            elif number in (2, 3):
+                target = transform.scale if number == 2 else transform.translate
+                ## x, y, m, z
+                for axis, _, double in _fields(data, *value):
+                    target[axis - 1] = _DOUBLE.unpack(double)[0]
+        return transform
+
+    def digits(self, axis):
+        scale = self.scale[axis]
+        return max(0, math.ceil(-math.log10(scale))) if 0 < scale < 1 else None
+
+    def axis(self, axis, value, digits):
+        if axis == AXIS_Y and self.origin == ORIGIN_UPPER_LEFT:
+            value = self.translate[1] - value * self.scale[1]
+        else:
+            value = self.translate[axis] + value * self.scale[axis]
+        return value if digits is None else round(value, digits)
+
+
+def _geometry(data, start, end, geometry_type, transform: _Transform, axes, digits):
+    lengths: List[int] = []
+    coords: List[int] = []
+    for number, wire, value in _fields(data, start, end):
+        if number == 2:
+            lengths.extend(
+                _packed_varints(data, *value) if wire == _LENGTH else [value]
+            )
+        elif number == 3:
+            coords.extend(
+                _zigzag(x)
+                for x in (_packed_varints(data, *value) if wire == _LENGTH else [value])
+            )
+    ## Coordinates are deltas from the previous vertex, across parts
+    dimensions = len(axes)
+    vertices = []
+    running = [0] * dimensions
+    for i in range(0, len(coords) - dimensions + 1, dimensions):
+        vertex = []
+        for n, axis in enumerate(axes):
+            running[n] += coords[i + n]
+            vertex.append(transform.axis(axis, running[n], digits[n]))
+        vertices.append(vertex)
+    if geometry_type == GEOMETRY_POINT:
+        if not vertices:
+            return None
+        point = {"x": vertices[0][0], "y": vertices[0][1]}
+        if len(axes) > 2 and axes[2] == AXIS_Z:
+            point["z"] = vertices[0][2]
+        return point
+    if geometry_type == GEOMETRY_MULTIPOINT:
+        return {"points": vertices}
+    parts, offset = [], 0
+    for length in lengths or [len(vertices)]:
+        parts.append(vertices[offset : offset + length])
+        offset += length
+    return {"rings" if geometry_type == GEOMETRY_POLYGON else "paths": parts}
+
+
+def _feature_result(data, start, end) -> Dict:
+    result: Dict = {"features": []}
+    names: List[str] = []
+    geometry_type = GEOMETRY_POINT
+    has_z = has_m = False
+    transform = _Transform()
+    features: List[Tuple[int, int]] = []
+    for number, wire, value in _fields(data, start, end):
+        if number == 1:
+            result["objectIdFieldName"] = _string(data, value)
+        elif number == 7:
+            geometry_type = value
+        elif number == 9:
+            result["exceededTransferLimit"] = bool(value)
+        elif number == 10:
+            has_z = bool(value)
+        elif number == 11:
+            has_m = bool(value)
+        elif number == 12:
+            transform = _Transform.decode(data, *value)
+        elif number == 13:
+            for field_number, _, field_value in _fields(data, *value):
+                if field_number == 1:
+                    names.append(_string(data, field_value))
+                    break
+        elif number == 15:
+            features.append(value)
+    ## Fields and the transform precede features on the wire, but that is not
+    ## guaranteed, so features are decoded last. Vertices are x, y[, z][, m].
+    axes = [AXIS_X, AXIS_Y] + [AXIS_Z] * has_z + [AXIS_M] * has_m
+    digits = [transform.digits(axis) for axis in axes]
+    for feature_start, feature_end in features:
+        values, geometry = _feature(data, feature_start, feature_end)
+        feature = {"attributes": dict(zip(names, values))}
+        if geometry is not None:
+            geometry = _geometry(
+                data, *geometry, geometry_type, transform, axes, digits
+            )
+            if geometry is not None:
+                feature["geometry"] = geometry
+        result["features"].append(feature)
+    return result
+
+
+def _feature(data, pos, end) -> Tuple[List[Optional[object]], Optional[Tuple]]:
+    """A feature's attribute values and the span of its geometry. This is the hot
+    loop of a decode, so strings and integers, which are nearly every value, are
+    read inline rather than through `_fields`."""
+    values: List[Optional[object]] = []
+    append = values.append
+    geometry = None
+    while pos < end:
+        key = data[pos]
+        if key != _ATTRIBUTE_KEY:
+            number, wire, value, pos = _field(data, pos)
+            if number == 2 and wire == _LENGTH:
+                geometry = value
+            continue
+        length = data[pos + 1]
+        if length < 0x80:
+            pos += 2
+        else:
+            length, pos = _varint(data, pos + 1)
+        value_end = pos + length
+        if not length:
+            append(None)
+        elif data[pos] == _STRING_KEY:
+            size = data[pos + 1]
+            if size < 0x80:
+                start = pos + 2
+            else:
+                size, start = _varint(data, pos + 1)
+            append(data[start : start + size].decode("utf-8"))
+        elif data[pos] == _SINT64_KEY:
+            value = _varint(data, pos + 1)[0]
+            append((value >> 1) ^ -(value & 1))
+        else:
+            append(_value(data, pos, value_end))
+        pos = value_end
+    return values, geometry
+
+
+def decode_query_response(data: bytes) -> Dict:
+    """Decode a `f=pbf` query response into the shape of its `f=json` equivalent.
+    Count-only results give `{"count": n}`."""
+    data = bytes(data)
+    for number, wire, value in _fields(data, 0, len(data)):
+        if number != 2:
+            continue
+        for result_number, _, result in _fields(data, *value):
+            if result_number == 1:
+                return _feature_result(data, *result)
+            if result_number == 2:
+                for count_number, _, count in _fields(data, *result):
+                    if count_number == 1:
+                        return {"count": count}
+                return {"count": 0}
+    raise ValueError("Response has no query result")
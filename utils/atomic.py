@@ -0,0 +1,99 @@
+## Writes go to a hidden temporary file that is fsynced and renamed over the
+## destination, so readers never see a truncated file
+
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Union
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+
+def fsync_directory(directory):
+    ## Makes the rename itself durable; not supported on every platform
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def fsync_path(path):
+    with open(path, "rb") as f:
+        os.fsync(f.fileno())
+
+
+def lock_path(path):
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, f".{name}.lock")
+
+
+## Advisory lock on a hidden `.{name}.lock` next to `path`; a no-op without fcntl
+@contextmanager
+def file_lock(path, shared=False):
+    if fcntl is None:
+        yield
+        return
+    lock_file = lock_path(path)
+    os.makedirs(os.path.dirname(lock_file), exist_ok=True)
+    fd = os.open(lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def _mode_for(path, mode):
+    if mode is not None:
+        return mode
+    try:
+        return os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        return 0o644
+
+
+## Without `durable` the fsyncs are skipped: readers still never see a partial
+## file, but a crash can leave the new file empty or the old one in place
+@contextmanager
+def replacing(path, mode=None, durable=True):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(
+        dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp"
+    )
+    os.close(fd)
+    try:
+        os.chmod(temp_path, _mode_for(path, mode))
+        yield temp_path
+        if durable:
+            fsync_path(temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+    if durable:
+        fsync_directory(directory)
+
+
+def atomic_write(path, data: Union[bytes, str], mode=None, lock=False, durable=True):
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    if lock:
+        with file_lock(path):
+            atomic_write(path, data, mode, durable=durable)
+        return
+    with replacing(path, mode, durable) as temp_path:
+        with open(temp_path, "wb") as f:
+            f.write(data)
@@ -0,0 +1,109 @@
+"""Which GIS attachments are already in Clio, so pulls stop re-queueing them.
+
+GIS gives no way to tell which attachments changed, so without a record every pull
+queues every attachment of every changed litigation and the push then spends a
+matter and a document lookup on each one only to find it uploaded. The manifest,
+`data/gis/attachments.jsonl`, has one line per synced attachment: its id, parent
+litigation, size and name, how it was synced and the Clio document id.
+
+Pushes append a line as each attachment is uploaded (or found in Clio), under an
+advisory lock so concurrent pushes never interleave lines; later lines win. Pulls
+skip attachments whose latest line has the same size and name, and compact the
+file once most of its lines are superseded.
+"""
+
+import datetime
+import os
+import threading
+from typing import Dict, Optional
+
+from utils.atomic import file_lock, replacing
+from utils.serialization import dump_line, loads
+
+## How an attachment was synced
+UPLOADED = "uploaded"
+FOUND = "found"
+
+
+def attachment_key(attachment) -> str:
+    return f"{attachment.litigation_object_id}/{attachment.id}"
+
+
+class AttachmentManifest:
+    def __init__(self, path):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        self.lines = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path) -> "AttachmentManifest":
+        manifest = cls(path)
+        with file_lock(path, shared=True):
+            manifest._read()
+        return manifest
+
+    def _read(self):
+        entries, lines = {}, 0
+        try:
+            with open(self.path, "rb") as f:
+                for line in f:
+                    try:
+                        entry = loads(line)
+                    except ValueError:
+                        ## A line cut short by a crash
+                        continue
+                    entries[entry["key"]] = entry
+                    lines += 1
+        except FileNotFoundError:
+            pass
+        self.entries, self.lines = entries, lines
+
+    def get(self, attachment) -> Optional[Dict]:
+        return self.entries.get(attachment_key(attachment))
+
+    def is_synced(self, attachment) -> bool:
+        """Whether the attachment is in Clio and unchanged since it was synced."""
+        entry = self.get(attachment)
+        return (
+            entry is not None
+            and entry.get("size") == attachment.size
+            and entry.get("name") == attachment.name
+        )
+
+    def record(self, attachment, status, document_id=None):
+        entry = {
+            "key": attachment_key(attachment),
+            "id": attachment.id,
+            "litigation_object_id": attachment.litigation_object_id,
+            "size": attachment.size,
+            "name": attachment.name,
+            "status": status,
+            "document_id": document_id,
+            "synced_at": datetime.datetime.utcnow().isoformat(),
+        }
+        line = dump_line(entry)
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with file_lock(self.path):
+                with open(self.path, "ab") as f:
+                    f.write(line)
+                    f.flush()
+                    os.fsync(f.fileno())
+            self.entries[entry["key"]] = entry
+            self.lines += 1
+
+    def compact(self, min_lines=1000):
+        """Rewrite the file with only the latest line per attachment, once at least
+        half of at least `min_lines` lines are superseded."""
+        with self._lock, file_lock(self.path):
+            ## Pick up lines other processes appended since loading
+            self._read()
+            if self.lines < min_lines or self.lines < 2 * len(self.entries):
+                return False
+            with replacing(self.path) as temp_path:
+                with open(temp_path, "wb") as f:
+                    for entry in self.entries.values():
+                        f.write(dump_line(entry))
+            self.lines = len(self.entries)
+        return True
@@ -0,0 +1,160 @@
+"""Attachment bytes and Clio upload progress, kept on disk between pushes.
+
+Uploading an attachment to Clio takes three requests: create the document, PUT the
+bytes to its put_url and PATCH it fully uploaded. A failure at any step re-queues
+the attachment, and without a record of how far it got the retry downloads the file
+from GIS again and creates another document. The spool in `data/gis/spool/` keeps
+
+- `blobs/{sha256}`, attachment bytes addressed by their hash, so a file attached
+  twice is stored once, and
+- `uploads/{litigation_object_id}-{attachment_id}.json`, the hash of each
+  attachment's bytes and the step its upload reached, with the Clio document id,
+  version uuid, put_url and put_headers once the document was created.
+
+A retry resumes at the step that failed, with the spooled bytes and the document
+already created. If Clio answers a resumed PUT or PATCH with 403, 404 or 410, because
+the put_url expired or the document is gone, the upload restarts from creating the
+document, keeping the spooled bytes. A finished upload's state is removed and its blob is left to
+`evict`, which removes blobs no unfinished upload refers to, least recently used
+first, once they are older than DATABRIDGE_SPOOL_MAX_AGE seconds (a day by default)
+or the spool is over DATABRIDGE_SPOOL_MAX_BYTES (1 GB by default).
+"""
+
+import glob
+import hashlib
+import os
+import time
+from typing import Callable, Dict, Optional
+
+from utils.atomic import atomic_write
+from utils.serialization import dumps, loads
+
+SPOOL_MAX_BYTES = int(os.environ.get("DATABRIDGE_SPOOL_MAX_BYTES", 1024**3))
+SPOOL_MAX_AGE = float(os.environ.get("DATABRIDGE_SPOOL_MAX_AGE", 24 * 3600))
+
+## Upload steps completed, in order; a finished upload has no state
+CREATED = "created"
+STORED = "stored"
+## Responses to a resumed PUT or PATCH after which the upload starts over
+RESTART_STATUSES = (403, 404, 410)
+
+
+class AttachmentSpool:
+    def __init__(self, path, max_bytes=SPOOL_MAX_BYTES, max_age=SPOOL_MAX_AGE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    @property
+    def blobs_path(self):
+        return os.path.join(self.path, "blobs")
+
+    @property
+    def uploads_path(self):
+        return os.path.join(self.path, "uploads")
+
+    def blob_path(self, digest):
+        return os.path.join(self.blobs_path, digest)
+
+    def upload_path(self, attachment):
+        return os.path.join(
+            self.uploads_path, f"{attachment.litigation_object_id}-{attachment.id}.json"
+        )
+
+    def upload_state(self, attachment) -> Dict:
+        try:
+            with open(self.upload_path(attachment), "rb") as f:
+                return loads(f.read())
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def save_upload_state(self, attachment, durable=True, **changes) -> Dict:
+        """Merge `changes` into the upload's state. Only states whose loss would
+        duplicate a document need to be `durable`; losing the others repeats a
+        download or a PUT."""
+        state = {**self.upload_state(attachment), **changes}
+        atomic_write(self.upload_path(attachment), dumps(state), durable=durable)
+        return state
+
+    def restart_upload(self, attachment) -> Dict:
+        """Forget the upload's steps and Clio document, keeping its spooled bytes."""
+        state = self.upload_state(attachment)
+        state = {key: state[key] for key in ("sha256", "size") if key in state}
+        atomic_write(self.upload_path(attachment), dumps(state))
+        return state
+
+    def finish_upload(self, attachment):
+        try:
+            os.remove(self.upload_path(attachment))
+        except FileNotFoundError:
+            pass
+
+    def content(
+        self, attachment, download: Callable[[], Optional[bytes]]
+    ) -> Optional[bytes]:
+        """The attachment's bytes from the spool, or from `download` if they were
+        never spooled or were evicted since."""
+        digest = self.upload_state(attachment).get("sha256")
+        if digest:
+            path = self.blob_path(digest)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                data = None
+            if data is not None and hashlib.sha256(data).hexdigest() == digest:
+                os.utime(path)
+                return data
+        data = download()
+        if data is None:
+            return None
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(digest)
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            ## A blob cut short by a crash fails the hash check and is downloaded again
+            atomic_write(path, data, durable=False)
+        self.save_upload_state(attachment, durable=False, sha256=digest, size=len(data))
+        return data
+
+    def evict(self, max_bytes=None, max_age=None, now=None) -> int:
+        """Remove blobs of finished uploads, least recently used first, while they
+        are older than `max_age` or the spool is over `max_bytes`. Returns how many
+        were removed."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        max_age = self.max_age if max_age is None else max_age
+        now = now or time.time()
+        referenced = set()
+        for path in glob.glob(os.path.join(self.uploads_path, "*.json")):
+            try:
+                with open(path, "rb") as f:
+                    referenced.add(loads(f.read()).get("sha256"))
+            except (FileNotFoundError, ValueError):
+                continue
+        try:
+            entries = list(os.scandir(self.blobs_path))
+        except FileNotFoundError:
+            entries = []
+        blobs = []
+        for entry in entries:
+            ## Temporary files of writes in progress
+            if entry.name.startswith("."):
+                continue
+            stat = entry.stat()
+            blobs.append((stat.st_mtime, stat.st_size, entry.name))
+        blobs.sort()
+        total = sum(size for _, size, _ in blobs)
+        removed = 0
+        for mtime, size, digest in blobs:
+            if total <= max_bytes and now - mtime <= max_age:
+                break
+            if digest in referenced:
+                continue
+            try:
+                os.remove(self.blob_path(digest))
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
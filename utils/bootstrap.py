@@ -0,0 +1,179 @@
+"""Look up or create the Clio entities the data bridge depends on.
+
+Each entity (client, practice area, group, custom fields and calendar) is a
+`BootstrapStep` that is skipped when its JSON file is already saved, so re-running
+the bootstrap only repeats the steps that did not finish. The remaining steps run
+concurrently. Custom fields are listed once, all pages, and matched by name; only
+the missing ones are created. Every entity is saved atomically as soon as its step
+finishes.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List
+
+from utils.clio_client import ClioApiClient
+from utils.constants import (
+    CLIO_CALENDAR_NAME,
+    CLIO_CLIENT_NAME,
+    CLIO_CUSTOM_FIELDS,
+    CLIO_GROUP_NAME,
+    CLIO_PRACTICE_AREA,
+)
+from utils.logging import logger
+from utils.metrics import metrics
+
+DEFAULT_WORKERS = 5
+## What ClioCustomField keeps of each field
+CUSTOM_FIELD_KEYS = ("id", "etag", "name", "field_type", "picklist_options")
+
+
+def find_or_create_client(api_client: ClioApiClient):
+    contact = api_client.get_contact(name=CLIO_CLIENT_NAME)
+    if contact is None:
+        logger.info(f"Clio client {CLIO_CLIENT_NAME} not found. Creating new client.")
+        contact = api_client.create_contact(name=CLIO_CLIENT_NAME).json()["data"]
+    return contact
+
+
+def find_or_create_practice_area(api_client: ClioApiClient):
+    practice_area = api_client.get_practice_area(name=CLIO_PRACTICE_AREA)
+    if practice_area is None:
+        logger.info(
+            f"Clio practice area {CLIO_PRACTICE_AREA} not found. Creating new practice area."
+        )
+        practice_area = api_client.create_practice_area(name=CLIO_PRACTICE_AREA).json()[
+            "data"
+        ]
+    return practice_area
+
+
+def find_or_create_group(api_client: ClioApiClient):
+    group = api_client.get_group(name=CLIO_GROUP_NAME)
+    if group is None:
+        logger.info(f"Clio group {CLIO_GROUP_NAME} not found. Creating new group.")
+        group = api_client.create_group(name=CLIO_GROUP_NAME).json()["data"]
+    return group
+
+
+def find_or_create_calendar(api_client: ClioApiClient):
+    calendars_json = api_client.get_calendars().json()
+    if calendars_json and calendars_json["data"]:
+        for calendar in calendars_json["data"]:
+            if calendar["name"] == CLIO_CALENDAR_NAME:
+                return calendar
+    logger.info(f"Clio calendar {CLIO_CALENDAR_NAME} not found. Creating new calendar.")
+    return api_client.create_calendar(name=CLIO_CALENDAR_NAME).json()["data"]
+
+
+def create_custom_field(api_client: ClioApiClient, field):
+    logger.info(f"Custom field {field} not found. Creating new custom field.")
+    res = api_client.create_custom_fields(
+        name=field["name"],
+        field_type=field["field_type"],
+        displayed=field.get("displayed"),
+        pick_list_options=field.get("picklist_options"),
+    )
+    res.raise_for_status()
+
+
+def _custom_fields_by_name(api_client: ClioApiClient) -> Dict[str, Any]:
+    existing: Dict[str, Any] = {}
+    for custom_field in api_client.get_all_custom_fields():
+        existing.setdefault(custom_field["name"], custom_field)
+    return existing
+
+
+def find_or_create_custom_fields(api_client: ClioApiClient, workers):
+    existing = _custom_fields_by_name(api_client)
+    missing = [field for field in CLIO_CUSTOM_FIELDS if field["name"] not in existing]
+    logger.info(
+        f"Found {len(CLIO_CUSTOM_FIELDS) - len(missing)} of "
+        f"{len(CLIO_CUSTOM_FIELDS)} Clio custom fields"
+    )
+    if missing:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(
+                pool.map(lambda field: create_custom_field(api_client, field), missing)
+            )
+        ## Creating a field only returns its id, so list them again to get the
+        ## picklist option ids
+        existing = _custom_fields_by_name(api_client)
+    entity = []
+    for field in CLIO_CUSTOM_FIELDS:
+        custom_field = existing[field["name"]]
+        entity.append(
+            {key: custom_field[key] for key in CUSTOM_FIELD_KEYS if key in custom_field}
+        )
+    return entity
+
+
+@dataclass
+class BootstrapStep:
+    name: str
+    ## DataBridge attributes holding the saved entity and the path it is saved to
+    attribute: str
+    path_attribute: str
+    find_or_create: Callable[..., Any]
+    ## Whether find_or_create also takes the number of concurrent requests
+    takes_workers: bool = False
+
+    def run(self, api_client: ClioApiClient, workers):
+        if self.takes_workers:
+            return self.find_or_create(api_client, workers)
+        return self.find_or_create(api_client)
+
+
+STEPS = [
+    BootstrapStep("client", "clio_client", "client_path", find_or_create_client),
+    BootstrapStep(
+        "practice_area",
+        "practice_area",
+        "practice_area_path",
+        find_or_create_practice_area,
+    ),
+    BootstrapStep("group", "group", "group_path", find_or_create_group),
+    BootstrapStep(
+        "custom_fields",
+        "custom_fields",
+        "custom_fields_path",
+        find_or_create_custom_fields,
+        takes_workers=True,
+    ),
+    BootstrapStep(
+        "calendar", "clio_calendar", "clio_calendar_path", find_or_create_calendar
+    ),
+]
+
+
+def bootstrap(
+    data_bridge, api_client: ClioApiClient, workers=DEFAULT_WORKERS, steps=STEPS
+) -> List[str]:
+    """Run every step whose entity is not saved yet and return their names. All
+    steps run to completion; the first failure is raised afterwards."""
+    pending = [step for step in steps if getattr(data_bridge, step.attribute) is None]
+    if not pending:
+        logger.info("Clio entities already bootstrapped")
+        return []
+    errors = []
+    with metrics.stage("clio.bootstrap") as stage:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = {
+                pool.submit(step.run, api_client, workers): step
+                for step in pending
+            }
+            for future in as_completed(futures):
+                step = futures[future]
+                try:
+                    entity = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to bootstrap Clio {step.name}: {e}")
+                    errors.append(e)
+                    continue
+                path = getattr(data_bridge, step.path_attribute)
+                logger.info(f"Saving Clio {step.name} to {path}: {entity}")
+                data_bridge.save_entity(path, entity)
+                stage.add(records=1)
+    if errors:
+        raise errors[0]
+    return [step.name for step in pending]
@@ -1,10 +1,8 @@
+import functools
 import os
-from typing import Any, Callable
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional
 import requests
-from oauthlib.oauth2.rfc6749.tokens import OAuth2Token
-from requests_oauthlib import OAuth2Session
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 
 from utils.constants import (
     CLIO_AUTH_URL,
@@ -16,6 +14,20 @@ from utils.constants import (
     BASE_DATA_DIR,
     ClioCustomFieldNames,
 )
+from utils.clio_paging import CLIO_PAGE_LIMIT, iter_pages
+from utils.metrics import instrument_client
+from utils.sessions import default_hooks, make_session
+from utils.startup import phase
+from utils.tokens import TokenRefreshHook, token_manager
+
+if TYPE_CHECKING:
+    from oauthlib.oauth2.rfc6749.tokens import OAuth2Token
+
+
+## Uploads go straight to Clio's storage host rather than the API
+@functools.lru_cache(maxsize=None)
+def storage_session():
+    return make_session("clio_storage")
 
 
 class AuthClient:
@@ -27,6 +39,7 @@ class AuthClient:
         auth_data_dir=BASE_DATA_DIR,
         refresh_token_filename="refresh",
         access_token_filename="access",
+        refresh_in_background=False,
     ):
         self.api_key = api_key
         self.api_secret = api_secret
@@ -37,29 +50,38 @@ class AuthClient:
         self.access_token_path = os.path.join(auth_data_dir, access_token_filename)
         self.access_token = None
         self.refresh_token = None
-        self.load_tokens()
-        retry_strategy = Retry(
-            total=10,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
+        ## Shared by every AuthClient of the process, so a refresh made for one
+        ## session reaches all of them
+        self.tokens = token_manager(
+            auth_data_dir,
+            api_key=self.api_key,
+            api_secret=self.api_secret,
+            access_token_filename=access_token_filename,
+            refresh_token_filename=refresh_token_filename,
         )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        self.client = OAuth2Session(
-            self.api_key,
-            token={
-                "access_token": self.access_token,
-                "refresh_token": self.refresh_token,
-            },
-            auto_refresh_kwargs={
+        self.load_tokens()
+        self.client = make_session(
+            "clio",
+            hooks=[TokenRefreshHook(self.tokens)] + default_hooks(),
+            oauth={
                 "client_id": self.api_key,
-                "client_secret": self.api_secret,
+                "token": self.tokens.token,
+                "auto_refresh_kwargs": {
+                    "client_id": self.api_key,
+                    "client_secret": self.api_secret,
+                },
+                "token_updater": self.save_tokens,
             },
-            token_updater=self.save_tokens,
         )
-        self.client.mount("https://", adapter)
-        self.client.mount("http://", adapter)
+        self.tokens.subscribe(self._use_token)
+        ## Only jobs keep the token fresh; the web app just runs the OAuth handshake
+        if refresh_in_background:
+            self.tokens.start_refresher()
 
     def get_authorization_url(self):
+        ## The OAuth stack is only imported by the code paths that talk to Clio
+        from requests_oauthlib import OAuth2Session
+
         oauth_client = OAuth2Session(
             client_id=self.api_key, redirect_uri=self.callback_url
         )
@@ -67,6 +89,8 @@ class AuthClient:
         return url
 
     def get_token(self, auth_response_url):
+        from requests_oauthlib import OAuth2Session
+
         oauth_client = OAuth2Session(
             client_id=self.api_key, redirect_uri=self.callback_url
         )
@@ -77,29 +101,25 @@ class AuthClient:
         )
         return token
 
-    def save_tokens(self, token: OAuth2Token):
-        with open(self.access_token_path, "w") as f:
-            f.write(token["access_token"])
-
-        with open(self.refresh_token_path, "w") as f:
-            f.write(token["refresh_token"])
+    def save_tokens(self, token: "OAuth2Token"):
+        self.tokens.save(token)
 
     def load_tokens(self):
-        try:
-            with open(
-                self.access_token_path,
-            ) as f:
-                self.access_token = f.read()
-
-            with open(self.refresh_token_path) as f:
-                self.refresh_token = f.read()
-
-            return self.access_token, self.refresh_token
-        except FileNotFoundError:
+        token = self.tokens.token or self.tokens.load()
+        self.access_token = token.get("access_token")
+        self.refresh_token = token.get("refresh_token")
+        if self.access_token is None:
             return None, None
+        return self.access_token, self.refresh_token
+
+    def _use_token(self, token):
+        self.access_token = token.get("access_token")
+        self.refresh_token = token.get("refresh_token")
+        self.client.token = token
 
 
 def take_one(func: Callable[..., requests.Response]):
+    @functools.wraps(func)
     def inner(*args, **kwargs):
         res = func(*args, **kwargs)
         if res.status_code:
@@ -111,10 +131,25 @@ def take_one(func: Callable[..., requests.Response]):
     return inner
 
 
+@instrument_client(
+    "clio",
+    exclude=("iter_matter_pages", "iter_calendar_entry_pages", "iter_note_pages"),
+)
 class ClioApiClient:
-    def __init__(self, api_url=CLIO_API_URL, oauth_client=AuthClient()):
+    def __init__(self, api_url=CLIO_API_URL, oauth_client: Optional[AuthClient] = None):
         self.api_url = api_url
-        self.oauth: AuthClient = oauth_client
+        self._oauth = oauth_client
+        self._oauth_lock = threading.Lock()
+
+    @property
+    def oauth(self) -> AuthClient:
+        ## Reads the saved tokens, so only built when the first request is made
+        if self._oauth is None:
+            with self._oauth_lock:
+                if self._oauth is None:
+                    with phase("clio_auth"):
+                        self._oauth = AuthClient(refresh_in_background=True)
+        return self._oauth
 
     def create_webhook(self):
         pass
@@ -145,6 +180,32 @@ class ClioApiClient:
         practice_area_id,
         ids=None,
         updated_since=None,
+        updated_before=None,
+        limit=None,
+        order=None,
+    ):
+        return self.oauth.client.get(
+            os.path.join(self.api_url, "matters"),
+            params=self._matters_params(
+                group_id,
+                practice_area_id,
+                ids,
+                updated_since,
+                updated_before,
+                limit,
+                order,
+            ),
+        )
+
+    def _matters_params(
+        self,
+        group_id,
+        practice_area_id,
+        ids=None,
+        updated_since=None,
+        updated_before=None,
+        limit=None,
+        order=None,
     ):
         params = {
             "group_id": group_id,
@@ -153,13 +214,38 @@ class ClioApiClient:
         }
         if updated_since:
             params["updated_since"] = updated_since
+        if updated_before:
+            params["updated_before"] = updated_before
         if ids:
             params["ids"] = ids
-        url = os.path.join(
-            self.api_url,
-            "matters",
+        if limit:
+            params["limit"] = limit
+        if order:
+            params["order"] = order
+        return params
+
+    def iter_matter_pages(
+        self,
+        group_id,
+        practice_area_id,
+        ids=None,
+        updated_since=None,
+        updated_before=None,
+        limit=CLIO_PAGE_LIMIT,
+    ) -> Iterator[List[Dict]]:
+        return iter_pages(
+            self.oauth.client.get,
+            os.path.join(self.api_url, "matters"),
+            self._matters_params(
+                group_id, practice_area_id, ids, updated_since, updated_before, limit
+            ),
+        )
+
+    @take_one
+    def get_least_recently_updated_matter(self, group_id, practice_area_id):
+        return self.get_matters(
+            group_id, practice_area_id, limit=1, order="updated_at(asc)"
         )
-        return self.oauth.client.get(url, params=params)
 
     def get_matter_by_id(self, id):
         url = os.path.join(self.api_url, "matters", str(id))
@@ -204,6 +290,18 @@ class ClioApiClient:
             else None,
         )
 
+    def get_all_custom_fields(self, parent_type="Matter", limit=CLIO_PAGE_LIMIT):
+        pages = iter_pages(
+            self.oauth.client.get,
+            os.path.join(self.api_url, "custom_fields"),
+            {
+                "parent_type": parent_type,
+                "fields": "id,name,field_type,picklist_options{id,option}",
+                "limit": limit,
+            },
+        )
+        return [field for page in pages for field in page]
+
     def create_custom_fields(
         self, name, field_type="text_line", displayed="true", pick_list_options=[]
     ):
@@ -255,12 +353,27 @@ class ClioApiClient:
                 "matter_id": matter_id,
                 "external_property_name": ClioCustomFieldNames.DOCUMENT_EXTERNAL_ID_FIELD.value,
                 "external_property_value": gis_id,
+                "fields": "id,etag,latest_document_version{fully_uploaded}",
+            },
+        )
+
+    def get_matter_documents(self, matter_id, limit=CLIO_PAGE_LIMIT):
+        pages = iter_pages(
+            self.oauth.client.get,
+            os.path.join(self.api_url, "documents"),
+            {
+                "matter_id": matter_id,
+                "fields": "id,etag,external_properties{name,value},latest_document_version{fully_uploaded}",
+                "limit": limit,
             },
         )
+        return [document for page in pages for document in page]
 
-    def upload_document(self, matter_id, gis_id, file_name, file_content):
+    ## An upload creates the document, PUTs its bytes to the put_url and then
+    ## marks it fully uploaded
+    def create_document(self, matter_id, gis_id, file_name):
         create_url = os.path.join(self.api_url, "documents")
-        create_res = self.oauth.client.post(
+        res = self.oauth.client.post(
             create_url,
             params={"fields": "id,latest_document_version{uuid,put_url,put_headers}"},
             json={
@@ -275,25 +388,23 @@ class ClioApiClient:
                     ],
                 }
             },
-        ).json()["data"]
-        document_id = create_res["id"]
-        document_uuid = create_res["latest_document_version"]["uuid"]
-        document_put_url = create_res["latest_document_version"]["put_url"]
-        headers = {
-            header["name"]: header["value"]
-            for header in create_res["latest_document_version"]["put_headers"]
-        }
+        )
+        res.raise_for_status()
+        return res.json()["data"]
 
-        put_res = requests.put(
-            document_put_url, headers=headers, files={"file": file_content}
+    def put_document_content(self, put_url, put_headers, file_content):
+        headers = {header["name"]: header["value"] for header in put_headers}
+        return storage_session().put(
+            put_url, headers=headers, files={"file": file_content}
         )
-        patch_url = os.path.join(create_url, str(document_id))
-        patch_res = self.oauth.client.patch(
+
+    def mark_document_uploaded(self, document_id, document_uuid):
+        patch_url = os.path.join(self.api_url, "documents", str(document_id))
+        return self.oauth.client.patch(
             patch_url,
             params={"fields": "id,latest_document_version{fully_uploaded}"},
             json={"data": {"fully_uploaded": "true", "uuid": document_uuid}},
         )
-        return patch_res
 
     def get_group_by_id(self, id):
         url = os.path.join(self.api_url, "groups", str(id))
@@ -320,8 +431,20 @@ class ClioApiClient:
             url, json={"data": {"name": name, "visible": True}}
         )
 
-    def get_calendar_entries(self, calendar_id, updated_since=None, _from=None):
+    def get_calendar_entries(
+        self, calendar_id, updated_since=None, _from=None, matter_id=None, limit=None
+    ):
         url = os.path.join(self.api_url, "calendar_entries")
+        return self.oauth.client.get(
+            url,
+            params=self._calendar_entries_params(
+                calendar_id, updated_since, _from, matter_id, limit
+            ),
+        )
+
+    def _calendar_entries_params(
+        self, calendar_id, updated_since=None, _from=None, matter_id=None, limit=None
+    ):
         params = {
             "calendar_id": calendar_id,
             "fields": "matter,summary,description,start_at,created_at,updated_at",
@@ -329,7 +452,27 @@ class ClioApiClient:
         }
         if _from:
             params["from"] = _from
-        return self.oauth.client.get(url, params=params)
+        if matter_id:
+            params["matter_id"] = matter_id
+        if limit:
+            params["limit"] = limit
+        return params
+
+    def iter_calendar_entry_pages(
+        self,
+        calendar_id,
+        updated_since=None,
+        _from=None,
+        matter_id=None,
+        limit=CLIO_PAGE_LIMIT,
+    ) -> Iterator[List[Dict]]:
+        return iter_pages(
+            self.oauth.client.get,
+            os.path.join(self.api_url, "calendar_entries"),
+            self._calendar_entries_params(
+                calendar_id, updated_since, _from, matter_id, limit
+            ),
+        )
 
     def create_calendar_entry(
         self, name, description, start, end, calendar_id, matter_id
@@ -367,6 +510,22 @@ class ClioApiClient:
             },
         )
 
+    ## In id order, so Clio pages them with a cursor
+    def iter_note_pages(
+        self, updated_since=None, limit=CLIO_PAGE_LIMIT
+    ) -> Iterator[List[Dict]]:
+        params = {
+            "type": "Matter",
+            "fields": "id,subject,detail,updated_at,matter{id}",
+            "order": "id(asc)",
+            "limit": limit,
+        }
+        if updated_since:
+            params["updated_since"] = updated_since
+        return iter_pages(
+            self.oauth.client.get, os.path.join(self.api_url, "notes"), params
+        )
+
     @take_one
     def get_contact(self, name=None):
         url = os.path.join(self.api_url, "contacts")
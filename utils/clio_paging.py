@@ -0,0 +1,122 @@
+"""Clio list endpoints read a page at a time, optionally split across threads.
+
+Clio pages a listing with `limit` records per page (at most 200) and a
+`meta.paging.next` link to the following page. `iter_pages` yields each page's
+records as it arrives, so a caller that writes them out as it goes holds one page
+at a time however large the collection.
+
+A single listing can only be read one page after another. To read a large one
+faster, `pull_clio_updates` splits it into `updated_since`/`updated_before`
+windows (`time_windows`) and reads them on DATABRIDGE_CLIO_FETCH_WORKERS threads
+with `iter_concurrently`, which hands pages to the caller as any thread gets them
+and stops fetching while DATABRIDGE_CLIO_FETCH_WORKERS pages wait to be consumed.
+"""
+
+import datetime
+import os
+import queue
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+CLIO_PAGE_LIMIT = int(os.environ.get("DATABRIDGE_CLIO_PAGE_LIMIT", 200))
+CLIO_FETCH_WORKERS = int(os.environ.get("DATABRIDGE_CLIO_FETCH_WORKERS", 1))
+## Windows per worker, so a window with many more updates than the others does
+## not leave the rest of the workers idle
+WINDOWS_PER_WORKER = 4
+
+T = TypeVar("T")
+
+
+def parse_clio_time(value) -> datetime.datetime:
+    """Parse a Clio timestamp, assuming UTC when it has no offset."""
+    parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed
+
+
+def iter_pages(get: Callable, url, params: Optional[Dict] = None) -> Iterator[List]:
+    """Yield the records of each page of a Clio listing, following `next` links."""
+    res = get(url, params=params)
+    while True:
+        res.raise_for_status()
+        body = res.json()
+        yield body.get("data", [])
+        next = body.get("meta", {}).get("paging", {}).get("next")
+        if not next:
+            return
+        res = get(next)
+
+
+def time_windows(
+    start: datetime.datetime, end: datetime.datetime, count: int
+) -> List[Tuple[datetime.datetime, datetime.datetime]]:
+    """Split [start, end) into `count` windows of whole seconds, the last of
+    which ends at `end`."""
+    seconds = max(int((end - start).total_seconds()), 1)
+    count = max(min(count, seconds), 1)
+    bounds = [
+        start + datetime.timedelta(seconds=seconds * i // count) for i in range(count)
+    ]
+    return list(zip(bounds, bounds[1:] + [end]))
+
+
+def iter_concurrently(
+    producers: Iterable[Callable[[], Iterable[T]]], workers: int, max_pending=None
+) -> Iterator[T]:
+    """Yield the items of every producer, running up to `workers` producers at a
+    time. At most `max_pending` items (default `workers`) wait to be consumed; an
+    exception raised by a producer is raised here. Closing the generator stops the
+    producers at their next item."""
+    producers = list(producers)
+    pending: "queue.Queue" = queue.Queue(maxsize=max_pending or workers)
+    remaining = queue.Queue()
+    for producer in producers:
+        remaining.put(producer)
+    stopped = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def work():
+        try:
+            while not stopped.is_set():
+                try:
+                    producer = remaining.get_nowait()
+                except queue.Empty:
+                    break
+                for item in producer():
+                    if not put((item, None)):
+                        return
+        except BaseException as e:
+            put((None, e))
+        finally:
+            put((done, None))
+
+    threads = [
+        threading.Thread(target=work, daemon=True)
+        for _ in range(max(min(workers, len(producers)), 1))
+    ]
+    for thread in threads:
+        thread.start()
+    running = len(threads)
+    try:
+        while running:
+            item, error = pending.get()
+            if error is not None:
+                raise error
+            if item is done:
+                running -= 1
+                continue
+            yield item
+    finally:
+        stopped.set()
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,181 @@
+"""Data directory layout for the data bridge, and files cached by modification time.
+
+Building a `DataBridgeConfig` only joins paths, so constructing a DataBridge or
+importing its module does no I/O. Saved Clio entities and pull logs are read through
+`cached_file`, which keeps one `CachedFile` per path and loader for the whole
+process and reloads a file only when its mtime or size changes.
+"""
+
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from utils.constants import BASE_DATA_DIR
+
+
+@dataclass(frozen=True)
+class DataBridgeConfig:
+    base_data_dir: str = BASE_DATA_DIR
+    data_directory_name: str = "data"
+    gis_directory_name: str = "gis"
+    clio_directory_name: str = "clio"
+    log_directory_name: str = "log"
+    queued_directory_name: str = "queued"
+    client_file_name: str = "client.json"
+    custom_fields_file_name: str = "custom_fields.json"
+    practice_area_file_name: str = "practice_area.json"
+    calendar_file_name: str = "calendar.json"
+    group_file_name: str = "group.json"
+    gis_versions_file_name: str = "versions.json"
+    dismissed_statuses_file_name: str = "dismissed_statuses.json"
+    attachment_manifest_file_name: str = "attachments.jsonl"
+    attachment_spool_directory_name: str = "spool"
+    note_watermarks_file_name: str = "note_watermarks.json"
+
+    @property
+    def data_directory_path(self):
+        return os.path.join(self.base_data_dir, self.data_directory_name)
+
+    ## GIS
+
+    @property
+    def gis_directory_path(self):
+        return os.path.join(self.data_directory_path, self.gis_directory_name)
+
+    @property
+    def gis_update_log_path(self):
+        return os.path.join(self.gis_directory_path, self.log_directory_name)
+
+    @property
+    def gis_update_queue_path(self):
+        return os.path.join(self.gis_directory_path, self.queued_directory_name)
+
+    @property
+    def gis_versions_path(self):
+        return os.path.join(self.gis_directory_path, self.gis_versions_file_name)
+
+    @property
+    def dismissed_statuses_path(self):
+        return os.path.join(self.gis_directory_path, self.dismissed_statuses_file_name)
+
+    @property
+    def attachment_manifest_path(self):
+        return os.path.join(self.gis_directory_path, self.attachment_manifest_file_name)
+
+    @property
+    def attachment_spool_path(self):
+        return os.path.join(
+            self.gis_directory_path, self.attachment_spool_directory_name
+        )
+
+    @property
+    def gis_active_litigation_update_path(self):
+        return os.path.join(self.gis_update_queue_path, "active_litigations")
+
+    @property
+    def gis_attachments_update_path(self):
+        return os.path.join(self.gis_update_queue_path, "attachments")
+
+    ## Clio
+
+    @property
+    def clio_directory_path(self):
+        return os.path.join(self.data_directory_path, self.clio_directory_name)
+
+    @property
+    def clio_update_log_path(self):
+        return os.path.join(self.clio_directory_path, self.log_directory_name)
+
+    @property
+    def clio_update_queue_path(self):
+        return os.path.join(self.clio_directory_path, self.queued_directory_name)
+
+    @property
+    def clio_matters_update_path(self):
+        return os.path.join(self.clio_update_queue_path, "matters")
+
+    @property
+    def clio_notes_update_path(self):
+        return os.path.join(self.clio_update_queue_path, "notes")
+
+    @property
+    def note_watermarks_path(self):
+        return os.path.join(self.clio_directory_path, self.note_watermarks_file_name)
+
+    @property
+    def client_path(self):
+        return os.path.join(self.clio_directory_path, self.client_file_name)
+
+    @property
+    def custom_fields_path(self):
+        return os.path.join(self.clio_directory_path, self.custom_fields_file_name)
+
+    @property
+    def practice_area_path(self):
+        return os.path.join(self.clio_directory_path, self.practice_area_file_name)
+
+    @property
+    def calendar_path(self):
+        return os.path.join(self.clio_directory_path, self.calendar_file_name)
+
+    @property
+    def group_path(self):
+        return os.path.join(self.clio_directory_path, self.group_file_name)
+
+
+def file_signature(path) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class CachedFile:
+    """The parsed contents of a file, reloaded only when its mtime or size changes.
+    `load(path)` returns the parsed value; a missing or unreadable file gives None."""
+
+    def __init__(self, path, load: Callable[[str], Any]):
+        self.path = path
+        self._load = load
+        self._lock = threading.Lock()
+        self._signature = None
+        self._value = None
+
+    def get(self):
+        signature = file_signature(self.path)
+        with self._lock:
+            if signature != self._signature:
+                try:
+                    value = self._load(self.path) if signature else None
+                except Exception:
+                    value = None
+                self._signature, self._value = signature, value
+            return self._value
+
+    def invalidate(self):
+        with self._lock:
+            self._signature = self._value = None
+
+
+_cached_files: Dict[Tuple[str, Callable], CachedFile] = {}
+_cached_files_lock = threading.Lock()
+
+
+def cached_file(path, load: Callable[[str], Any]) -> CachedFile:
+    key = (os.path.abspath(path), load)
+    with _cached_files_lock:
+        cached = _cached_files.get(key)
+        if cached is None:
+            cached = _cached_files[key] = CachedFile(path, load)
+        return cached
+
+
+def invalidate_cached(path):
+    """Forget every cached copy of a file, e.g. right after writing it."""
+    path = os.path.abspath(path)
+    with _cached_files_lock:
+        cached = [value for key, value in _cached_files.items() if key[0] == path]
+    for value in cached:
+        value.invalidate()
@@ -188,9 +188,10 @@ CLIO_CUSTOM_FIELDS = [
     },
 ]
 
-CLIO_API_URL = "https://app.clio.com/api/v4/"
-CLIO_AUTH_URL = "https://app.clio.com/oauth/authorize"
-CLIO_TOKEN_URL = "https://app.clio.com/oauth/token"
+CLIO_HOST = os.environ.get("CLIO_HOST", "https://app.clio.com")
+CLIO_API_URL = f"{CLIO_HOST}/api/v4/"
+CLIO_AUTH_URL = f"{CLIO_HOST}/oauth/authorize"
+CLIO_TOKEN_URL = f"{CLIO_HOST}/oauth/token"
 
 CLIO_CALLBACK_URL = os.environ.get(
     "CLIO_CALLBACK_URL", "https://e95f61a94782.ngrok.io/callback"
@@ -199,7 +200,7 @@ CLIO_CALLBACK_URL = os.environ.get(
 CLIO_API_KEY = os.environ.get("CLIO_API_KEY")
 CLIO_API_SECRET = os.environ.get("CLIO_API_SECRET")
 
-GIS_HOST = "https://mapviewtest.memphistn.gov"
+GIS_HOST = os.environ.get("GIS_HOST", "https://mapviewtest.memphistn.gov")
 GIS_FEATURE_SERVER_PATH = (
     "arcgis/rest/services/AGO_Code/Code_Memphis_Fights_Blight/FeatureServer"
 )
@@ -1,28 +1,69 @@
 import os
 import datetime
-import json
-from dataclasses import dataclass, asdict
+import functools
+import threading
+from dataclasses import dataclass
 from collections import defaultdict
-from typing import Dict, List, Optional, TypedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    TypedDict,
+)
 
-import requests
+from utils.atomic import atomic_write
+from utils.config import DataBridgeConfig, cached_file, invalidate_cached
 from utils.constants import (
     BASE_DATA_DIR,
     ClioCustomFieldNames,
     GISActiveLitigationsFields,
     GISLitigationHistoryFields,
 )
+from utils.attachment_manifest import FOUND, UPLOADED, AttachmentManifest
+from utils.attachment_spool import (
+    CREATED,
+    RESTART_STATUSES,
+    STORED,
+    AttachmentSpool,
+)
+from utils.dismissed_statuses import DismissedStatusIndex
+from utils.matter_documents import DOCUMENT_LOOKUP, DOCUMENT_LOOKUPS, MatterDocuments
+from utils.note_watermarks import NoteWatermarks
 from utils.gis_client import GISClient
+from utils.gis_versions import (
+    GIS_FETCH_BATCH_SIZE,
+    GIS_FETCH_MODE,
+    GIS_FETCH_MODES,
+    GISVersionMap,
+)
 from utils.clio_client import ClioApiClient, take_one
+from utils.clio_paging import (
+    CLIO_FETCH_WORKERS,
+    CLIO_PAGE_LIMIT,
+    WINDOWS_PER_WORKER,
+    iter_concurrently,
+    parse_clio_time,
+    time_windows,
+)
+from utils.leases import exclusive, segment_lease
 from utils.logging import logger
-
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-
-s = requests.Session()
-retries = Retry(total=10, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
-s.mount("http://", HTTPAdapter(max_retries=retries))
-s.mount("https://", HTTPAdapter(max_retries=retries))
+from utils.metrics import metrics
+from utils.startup import phase
+from utils.serialization import dumps, loads
+from utils.queue_segments import (
+    SegmentWriter,
+    iter_segment,
+    list_segments,
+    remove_segment,
+    rewrite_segment,
+)
+from utils.queue_index import IndexedSegment, is_indexable, iter_batches
 
 DATE_FORMAT = "%Y-%m-%dT%H:%M:%S+00:00"
 
@@ -49,6 +90,12 @@ class GISIncident:
     dismissed_condition: str = None
 
 
+## What a pull keeps of each queued litigation to look up its attachments
+class LitigationRef(NamedTuple):
+    object_id: int
+    civil_warrant: str
+
+
 @dataclass
 class GISLitigationHistory:
     object_id: int
@@ -98,6 +145,22 @@ class ClioCalendarEntry:
         }
 
 
+class ClioNote:
+    def __init__(self, matter, note):
+        self.matter = ClioMatter(matter)
+        self.id = note["id"]
+        self.detail = note.get("detail")
+        self.updated_at = note.get("updated_at")
+
+    def to_gis_request_feature(self):
+        return {
+            "attributes": {
+                GISActiveLitigationsFields.OBJECT_ID.value: int(self.matter.object_id),
+                GISActiveLitigationsFields.LATEST_COURT_NOTES.value: self.detail,
+            }
+        }
+
+
 @dataclass
 class ClioClient:
     id: str
@@ -268,11 +331,92 @@ class ClioMatter:
         }
 
 
+def _load_json(path):
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+def _load_text(path):
+    with open(path) as f:
+        return f.read()
+
+
+def _load_client(path):
+    asset = _load_json(path)
+    return ClioClient(id=asset["id"], name=asset["name"]) if asset else None
+
+
+def _load_group(path):
+    asset = _load_json(path)
+    return ClioGroup(id=asset["id"], name=asset["name"]) if asset else None
+
+
+def _load_practice_area(path):
+    asset = _load_json(path)
+    return ClioPracticeArea(id=asset["id"], name=asset["name"]) if asset else None
+
+
+def _load_calendar(path):
+    asset = _load_json(path)
+    return ClioCalendar(id=asset["id"]) if asset else None
+
+
+def _load_custom_fields(path):
+    asset = _load_json(path)
+    return ClioCustomFields(asset) if asset else None
+
+
+def incident_from_feature(feature) -> GISIncident:
+    attributes = feature["attributes"]
+    return GISIncident(
+        object_id=attributes.get(GISActiveLitigationsFields.OBJECT_ID.value),
+        updated=attributes.get(GISActiveLitigationsFields.LAST_MODIFIED_DATE.value),
+        created=attributes.get(GISActiveLitigationsFields.CREATION_DATE.value),
+        incident_number=attributes.get(
+            GISActiveLitigationsFields.INCIDENT_NUMBER.value
+        ),
+        parcel_id=attributes.get(GISActiveLitigationsFields.PARCEL_ID.value),
+        city_file_no=attributes.get(GISActiveLitigationsFields.CITY_FILE_NO.value),
+        sub_district=attributes.get(GISActiveLitigationsFields.SUB_DISTRICT.value),
+        npa_inspect_summary=attributes.get(
+            GISActiveLitigationsFields.NPA_INSPECT_SUMMARY.value
+        ),
+        court_status=attributes.get(GISActiveLitigationsFields.COURT_STATUS.value),
+        location=attributes.get(GISActiveLitigationsFields.LOCATION.value),
+        next_court_date=attributes.get(
+            GISActiveLitigationsFields.NEXT_COURT_DATE.value
+        ),
+        property_owner=attributes.get(GISActiveLitigationsFields.PROPERTY_OWNER.value),
+        defendent=attributes.get(GISActiveLitigationsFields.DEFENDENT.value),
+        civil_warrant=attributes.get(GISActiveLitigationsFields.CIVIL_WARRANT.value),
+        latest_court_notes=attributes.get(
+            GISActiveLitigationsFields.LATEST_COURT_NOTES.value
+        ),
+        geometry=feature["geometry"],
+    )
+
+
+## Keeps each matter's soonest entry; of entries starting together the last read wins
+def reduce_next_calendar_entries(
+    entries: Iterable[Dict], next_entries: Dict[int, Dict]
+) -> Dict[int, Dict]:
+    for entry in entries:
+        if not entry.get("matter"):
+            continue
+        matter_id = entry["matter"]["id"]
+        current = next_entries.get(matter_id)
+        if current is None or parse_clio_time(entry["start_at"]) <= parse_clio_time(
+            current["start_at"]
+        ):
+            next_entries[matter_id] = entry
+    return next_entries
+
+
 class DataBridge:
     def __init__(
         self,
-        clio_client: ClioApiClient = ClioApiClient(),
-        gis_client: GISClient = GISClient(),
+        clio_client: Optional[ClioApiClient] = None,
+        gis_client: Optional[GISClient] = None,
         data_directory_name="data",
         gis_directory_name="gis",
         clio_directory_name="clio",
@@ -284,275 +428,324 @@ class DataBridge:
         calendar_file_name="calendar.json",
         group_file_name="group.json",
         base_data_dir=BASE_DATA_DIR,
+        config: Optional[DataBridgeConfig] = None,
     ):
-        ## API client instances
-        self.clio_api_client = clio_client
-        self.gis_client = gis_client
-
-        ## Set base data directory path
-        data_directory_path = os.path.join(
-            base_data_dir,
-            data_directory_name,
+        ## API clients are built on first use
+        self._clio_api_client = clio_client
+        self._gis_client = gis_client
+        self._clients_lock = threading.Lock()
+
+        ## Directories are created when first written to, and saved entities and pull
+        ## logs are read when first used, so constructing a DataBridge does no I/O
+        self.config = config or DataBridgeConfig(
+            base_data_dir=base_data_dir,
+            data_directory_name=data_directory_name,
+            gis_directory_name=gis_directory_name,
+            clio_directory_name=clio_directory_name,
+            log_directory_name=log_directory_name,
+            queued_directory_name=queued_directory_name,
+            client_file_name=client_file_name,
+            custom_fields_file_name=custom_fields_file_name,
+            practice_area_file_name=practice_area_file_name,
+            calendar_file_name=calendar_file_name,
+            group_file_name=group_file_name,
         )
 
-        ## GIS directory setup
-        gis_directory_path = os.path.join(data_directory_path, gis_directory_name)
-        os.makedirs(gis_directory_path, exist_ok=True)
         ## File contains log of last pull
-        self.gis_update_log_path = os.path.join(gis_directory_path, log_directory_name)
-        try:
-            with open(self.gis_update_log_path) as f:
-                self.last_gis_pull = f.read()
-        except:
-            self.last_gis_pull = None
-        self.gis_update_queue_path = os.path.join(
-            gis_directory_path, queued_directory_name
-        )
+        self.gis_update_log_path = self.config.gis_update_log_path
+        ## File contains the last seen version of every active litigation
+        self.gis_versions_path = self.config.gis_versions_path
+        ## File contains the latest dismissed status of every civil warrant
+        self.dismissed_statuses_path = self.config.dismissed_statuses_path
+        ## File contains the attachments already synced to Clio
+        self.attachment_manifest_path = self.config.attachment_manifest_path
+        self._attachment_manifest: Optional[AttachmentManifest] = None
+        ## Attachment bytes and the progress of unfinished uploads
+        self.attachment_spool = AttachmentSpool(self.config.attachment_spool_path)
+        ## Matters and their documents looked up by the current push
+        self.matter_documents = MatterDocuments()
         ## Directory contains GIS updates to process
-        self.gis_active_litigation_update_path = os.path.join(
-            self.gis_update_queue_path, "active_litigations"
+        self.gis_update_queue_path = self.config.gis_update_queue_path
+        self.gis_active_litigation_update_path = (
+            self.config.gis_active_litigation_update_path
         )
-        os.makedirs(self.gis_active_litigation_update_path, exist_ok=True)
-        self.gis_ligation_attachments_update_path = os.path.join(
-            self.gis_update_queue_path, "attachments"
+        self.gis_ligation_attachments_update_path = (
+            self.config.gis_attachments_update_path
         )
-        os.makedirs(self.gis_ligation_attachments_update_path, exist_ok=True)
 
-        ## Clio directory setup
-        clio_directory_path = os.path.join(data_directory_path, clio_directory_name)
-        os.makedirs(clio_directory_path, exist_ok=True)
         ## File contains log of last pull
-        self.clio_update_log_path = os.path.join(
-            clio_directory_path, log_directory_name
-        )
-        try:
-            with open(self.clio_update_log_path) as f:
-                self.last_clio_pull = f.read()
-        except:
-            self.last_clio_pull = None
+        self.clio_update_log_path = self.config.clio_update_log_path
         ## Directory contians Clio updates to process
-        self.clio_update_queue_path = os.path.join(
-            clio_directory_path, queued_directory_name
-        )
-        self.clio_matters_update_path = os.path.join(
-            self.clio_update_queue_path, "matters"
-        )
-        os.makedirs(self.clio_matters_update_path, exist_ok=True)
+        self.clio_update_queue_path = self.config.clio_update_queue_path
+        self.clio_matters_update_path = self.config.clio_matters_update_path
+        self.clio_notes_update_path = self.config.clio_notes_update_path
+        ## File contains the update time of the latest note queued per matter
+        self.note_watermarks_path = self.config.note_watermarks_path
+
         ## Files contain json with saved Clio resources (Client, Practice Area, Group, Custom Fields)
-        ## Load Client
-        self.client_path = os.path.join(clio_directory_path, client_file_name)
-        client_asset = self.load_entity(self.client_path)
-        self.clio_client = (
-            ClioClient(id=client_asset["id"], name=client_asset["name"])
-            if client_asset
-            else None
-        )
-        ## Load Custom Fields
-        self.custom_fields_path = os.path.join(
-            clio_directory_path, custom_fields_file_name
-        )
-        custom_fields_asset = self.load_entity(self.custom_fields_path)
-        self.custom_fields = custom_fields_asset
-        self.custom_fields: Optional[ClioCustomFields] = (
-            ClioCustomFields(custom_fields_asset) if custom_fields_asset else None
-        )
+        self.client_path = self.config.client_path
+        self.custom_fields_path = self.config.custom_fields_path
+        self.group_path = self.config.group_path
+        self.practice_area_path = self.config.practice_area_path
+        self.clio_calendar_path = self.config.calendar_path
+
+    @property
+    def clio_api_client(self) -> ClioApiClient:
+        if self._clio_api_client is None:
+            with self._clients_lock:
+                if self._clio_api_client is None:
+                    self._clio_api_client = ClioApiClient()
+        return self._clio_api_client
+
+    @property
+    def gis_client(self) -> GISClient:
+        if self._gis_client is None:
+            with self._clients_lock:
+                if self._gis_client is None:
+                    with phase("gis_client"):
+                        self._gis_client = GISClient()
+        return self._gis_client
+
+    @property
+    def attachment_manifest(self) -> AttachmentManifest:
+        if self._attachment_manifest is None:
+            with self._clients_lock:
+                if self._attachment_manifest is None:
+                    self._attachment_manifest = AttachmentManifest.load(
+                        self.attachment_manifest_path
+                    )
+        return self._attachment_manifest
 
-        ## Load Group
-        self.group_path = os.path.join(clio_directory_path, group_file_name)
-        group_asset = self.load_entity(self.group_path)
-        self.group = (
-            ClioGroup(id=group_asset["id"], name=group_asset["name"])
-            if group_asset
-            else None
-        )
+    @property
+    def last_gis_pull(self) -> Optional[str]:
+        return cached_file(self.gis_update_log_path, _load_text).get()
 
-        ## Load Practice Area
-        self.practice_area_path = os.path.join(
-            clio_directory_path, practice_area_file_name
-        )
-        practice_area_asset = self.load_entity(self.practice_area_path)
-        self.practice_area = (
-            ClioPracticeArea(
-                id=practice_area_asset["id"], name=practice_area_asset["name"]
-            )
-            if practice_area_asset
-            else None
-        )
-        ## Load Calendar
-        self.clio_calendar_path = os.path.join(clio_directory_path, calendar_file_name)
-        calendar_asset = self.load_entity(self.clio_calendar_path)
-        self.clio_calendar = (
-            ClioCalendar(id=calendar_asset["id"]) if calendar_asset else None
-        )
+    @property
+    def last_clio_pull(self) -> Optional[str]:
+        return cached_file(self.clio_update_log_path, _load_text).get()
+
+    @property
+    def clio_client(self) -> Optional[ClioClient]:
+        return cached_file(self.client_path, _load_client).get()
+
+    @property
+    def custom_fields(self) -> Optional["ClioCustomFields"]:
+        return cached_file(self.custom_fields_path, _load_custom_fields).get()
+
+    @property
+    def group(self) -> Optional[ClioGroup]:
+        return cached_file(self.group_path, _load_group).get()
+
+    @property
+    def practice_area(self) -> Optional[ClioPracticeArea]:
+        return cached_file(self.practice_area_path, _load_practice_area).get()
+
+    @property
+    def clio_calendar(self) -> Optional[ClioCalendar]:
+        return cached_file(self.clio_calendar_path, _load_calendar).get()
 
     def make_timestamp(self):
         return datetime.datetime.utcnow().strftime(DATE_FORMAT)
 
     def load_entity(self, path):
         try:
-            with open(path) as f:
-                return json.loads(f.read())
+            return _load_json(path)
         except:
             return None
 
-    def save_entity(self, path, input_json, field):
-        try:
-            with open(path, "w") as f:
-                f.write(json.dumps(input_json))
-                self.__setattr__(field, input_json)
-        except FileNotFoundError:
+    def save_entity(self, path, input_json):
+        atomic_write(path, dumps(input_json))
+        invalidate_cached(path)
+
+    ## Atomic, since losing a pull log forces a full re-pull
+    def write_log(self, path, timestamp):
+        atomic_write(path, timestamp)
+        invalidate_cached(path)
+
+    ## None for a full pull
+    def load_gis_versions(self, fetch_mode=None) -> Optional[GISVersionMap]:
+        fetch_mode = fetch_mode or GIS_FETCH_MODE
+        if fetch_mode not in GIS_FETCH_MODES:
+            raise ValueError(f"Unknown GIS fetch mode {fetch_mode}")
+        if fetch_mode == "full":
             return None
+        return GISVersionMap.load(self.gis_versions_path)
 
-    def fetch_gis_active_litigation_features(self, max_records=None):
-        return [
-            GISIncident(
-                object_id=x["attributes"].get(
-                    GISActiveLitigationsFields.OBJECT_ID.value
-                ),
-                updated=x["attributes"].get(
-                    GISActiveLitigationsFields.LAST_MODIFIED_DATE.value
-                ),
-                created=x["attributes"].get(
-                    GISActiveLitigationsFields.CREATION_DATE.value
-                ),
-                incident_number=x["attributes"].get(
-                    GISActiveLitigationsFields.INCIDENT_NUMBER.value
-                ),
-                parcel_id=x["attributes"].get(
-                    GISActiveLitigationsFields.PARCEL_ID.value
-                ),
-                city_file_no=x["attributes"].get(
-                    GISActiveLitigationsFields.CITY_FILE_NO.value
-                ),
-                sub_district=x["attributes"].get(
-                    GISActiveLitigationsFields.SUB_DISTRICT.value
-                ),
-                npa_inspect_summary=x["attributes"].get(
-                    GISActiveLitigationsFields.NPA_INSPECT_SUMMARY.value
-                ),
-                court_status=x["attributes"].get(
-                    GISActiveLitigationsFields.COURT_STATUS.value
-                ),
-                location=x["attributes"].get(GISActiveLitigationsFields.LOCATION.value),
-                next_court_date=x["attributes"].get(
-                    GISActiveLitigationsFields.NEXT_COURT_DATE.value
-                ),
-                property_owner=x["attributes"].get(
-                    GISActiveLitigationsFields.PROPERTY_OWNER.value
-                ),
-                defendent=x["attributes"].get(
-                    GISActiveLitigationsFields.DEFENDENT.value
-                ),
-                civil_warrant=x["attributes"].get(
-                    GISActiveLitigationsFields.CIVIL_WARRANT.value
-                ),
-                latest_court_notes=x["attributes"].get(
-                    GISActiveLitigationsFields.LATEST_COURT_NOTES.value
-                ),
-                geometry=x["geometry"],
+    def refresh_dismissed_statuses(self) -> DismissedStatusIndex:
+        index = DismissedStatusIndex.load(self.dismissed_statuses_path)
+        with metrics.stage("gis.fetch_dismissed_statuses") as stage:
+            stage.add(records=index.refresh(self.gis_client))
+        index.save()
+        logger.info(
+            f"Dismissed statuses known for {len(index.statuses)} civil warrants"
+        )
+        return index
+
+    def fetch_gis_active_litigation_features(
+        self, max_records=None, versions: Optional[GISVersionMap] = None
+    ) -> List[GISIncident]:
+        return list(self.iter_gis_active_litigation_features(max_records, versions))
+
+    ## Given a version map, only litigations new or changed since it was recorded
+    def iter_gis_active_litigation_features(
+        self, max_records=None, versions: Optional[GISVersionMap] = None
+    ) -> Iterator[GISIncident]:
+        if versions is not None:
+            yield from self.iter_changed_gis_active_litigation_features(
+                versions, max_records
             )
-            for x in self.gis_client.get_active_litigations(
+            return
+        with metrics.stage("gis.fetch_active_litigations") as stage:
+            features = self.gis_client.iter_active_litigations(
                 query_start_datetime=self.last_gis_pull
-            )["features"][0:max_records]
-        ]
+            )
+            try:
+                for x in islice(features, max_records):
+                    stage.add(records=1)
+                    yield incident_from_feature(x)
+            finally:
+                features.close()
+
+    def iter_changed_gis_active_litigation_features(
+        self, versions: GISVersionMap, max_records=None
+    ) -> Iterator[GISIncident]:
+        with metrics.stage("gis.scan_active_litigations") as stage:
+            rows = self.gis_client.scan_active_litigations()
+            stage.add(records=len(rows))
+        if not versions.versions and self.last_gis_pull:
+            ## First delta pull after full pulls: rows not modified since the last
+            ## pull were queued by it already
+            modified = {
+                row[GISActiveLitigationsFields.OBJECT_ID.value]
+                for row in self.gis_client.scan_active_litigations(
+                    query_start_datetime=self.last_gis_pull
+                )
+            }
+            versions.record(rows, exclude=modified)
+        versions.retain(rows)
+        changed = versions.changed(rows)[0:max_records]
+        logger.info(f"{len(changed)} of {len(rows)} active litigations changed")
+        del rows
+        with metrics.stage("gis.fetch_active_litigations") as stage:
+            for start in range(0, len(changed), GIS_FETCH_BATCH_SIZE):
+                for x in self.gis_client.get_active_litigations_by_ids(
+                    changed[start : start + GIS_FETCH_BATCH_SIZE]
+                ):
+                    ## Record the fetched version, which is newer than the scanned
+                    ## one if the row changed in between
+                    versions.record([x["attributes"]])
+                    stage.add(records=1)
+                    yield incident_from_feature(x)
 
     def log_gis_active_litigation_features(
-        self, timestamp, active_litigation_features: List[GISIncident]
-    ):
-        if bool(active_litigation_features):
-            active_litigation_f = open(
-                os.path.join(self.gis_active_litigation_update_path, timestamp), "w"
-            )
+        self, timestamp, active_litigation_features: Iterable[GISIncident]
+    ) -> List[LitigationRef]:
+        refs = []
+        with metrics.stage("gis.queue_active_litigations") as stage, SegmentWriter(
+            self.gis_active_litigation_update_path, timestamp
+        ) as active_litigation_f:
             for incident in active_litigation_features:
                 logger.info(f"Logging update to litigation {incident}")
-                active_litigation_f.write(json.dumps(asdict(incident)))
-                active_litigation_f.write("\n")
-            active_litigation_f.close()
+                active_litigation_f.write(incident)
+                refs.append(LitigationRef(incident.object_id, incident.civil_warrant))
+            stage.add(
+                records=active_litigation_f.records,
+                bytes=active_litigation_f.bytes_written,
+            )
+        logger.info(f"Queued {len(refs)} active litigation features")
+        return refs
 
+    ## Skips attachments already synced to Clio and unchanged since
     def fetch_active_litigation_features_attachments(
-        self, active_litigation_features: List[GISIncident]
+        self, active_litigation_features: Iterable[LitigationRef]
     ) -> List[GISAttachment]:
         attachments = []
-        for incident in active_litigation_features:
-            object_id = incident.object_id
-            attachment_infos = self.gis_client.get_attachments(object_id)
-            for attachment in attachment_infos:
-                obj = GISAttachment(
-                    litigation_object_id=object_id,
-                    civil_warrant=incident.civil_warrant,
-                    id=attachment["id"],
-                    content_type=attachment["contentType"],
-                    size=attachment["size"],
-                    name=attachment["name"],
-                )
-                attachments.append(obj)
+        skipped = 0
+        ## Reloaded, since pushes append to it
+        manifest = AttachmentManifest.load(self.attachment_manifest_path)
+        with metrics.stage("gis.fetch_attachments") as stage:
+            for incident in active_litigation_features:
+                object_id = incident.object_id
+                attachment_infos = self.gis_client.get_attachments(object_id)
+                for attachment in attachment_infos:
+                    obj = GISAttachment(
+                        litigation_object_id=object_id,
+                        civil_warrant=incident.civil_warrant,
+                        id=attachment["id"],
+                        content_type=attachment["contentType"],
+                        size=attachment["size"],
+                        name=attachment["name"],
+                    )
+                    if manifest.is_synced(obj):
+                        skipped += 1
+                        continue
+                    attachments.append(obj)
+            ## Keep each matter's attachments together, so a push lists its
+            ## documents once
+            attachments.sort(key=lambda attachment: attachment.civil_warrant or "")
+            stage.add(records=len(attachments))
+        metrics.inc("databridge_attachments_skipped_total", skipped)
+        logger.info(
+            f"Skipped {skipped} attachments already synced to Clio, "
+            f"queueing {len(attachments)}"
+        )
+        manifest.compact()
         return attachments
 
     def log_gis_attachments(self, timestamp, attachments: List[GISAttachment]):
-        attachments_file = open(
-            os.path.join(self.gis_ligation_attachments_update_path, timestamp), "w"
-        )
-        for obj in attachments:
-            logger.info(
-                f"Logging attachment for civil warrant number {obj.civil_warrant}: {obj}"
+        with metrics.stage("gis.queue_attachments") as stage, SegmentWriter(
+            self.gis_ligation_attachments_update_path, timestamp
+        ) as attachments_file:
+            for obj in attachments:
+                logger.info(
+                    f"Logging attachment for civil warrant number {obj.civil_warrant}: {obj}"
+                )
+                attachments_file.write(obj)
+            stage.add(
+                records=attachments_file.records, bytes=attachments_file.bytes_written
             )
-            attachments_file.write(json.dumps(asdict(obj)))
-            attachments_file.write("\n")
-        attachments_file.close()
 
-    def gis_to_clio_migration(self, max_records=None):
+    @exclusive(lambda self: self.gis_update_queue_path)
+    def gis_to_clio_migration(self, max_records=None, fetch_mode=None):
         now = self.make_timestamp()
+        versions = self.load_gis_versions(fetch_mode)
+        dismissed_statuses = self.refresh_dismissed_statuses()
         logger.info(f"Fetching active litigations updated since {self.last_gis_pull}")
-        active_litigation_features = self.fetch_gis_active_litigation_features(
-            max_records
-        )
-        logger.info(
-            f"Fetched {len(active_litigation_features)} active litigation features"
+        active_litigations = self.log_gis_active_litigation_features(
+            now,
+            dismissed_statuses.annotate(
+                self.iter_gis_active_litigation_features(max_records, versions)
+            ),
         )
-        dismissed_statuses = self.gis_client.get_dismissed_statuses()["features"]
-        last_dismissed_statuses_by_civil_warrant_number = {
-            status["attributes"][
-                GISLitigationHistoryFields.CIVIL_WARRANT.value
-            ]: status["attributes"]
-            for status in dismissed_statuses
-        }
-        for feature in active_litigation_features:
-            feature.dismiss_status = (
-                last_dismissed_statuses_by_civil_warrant_number.get(
-                    feature.civil_warrant, {}
-                ).get(GISLitigationHistoryFields.DISMISS_STATUS.value)
-            )
-            feature.dismissed_condition = (
-                last_dismissed_statuses_by_civil_warrant_number.get(
-                    feature.civil_warrant, {}
-                ).get(GISLitigationHistoryFields.DISMISSED_CONDITION.value)
-            )
-        self.log_gis_active_litigation_features(now, active_litigation_features)
         attachments = self.fetch_active_litigation_features_attachments(
-            active_litigation_features
+            active_litigations
         )
         self.log_gis_attachments(now, attachments)
 
-        with open(self.gis_update_log_path, "w") as f:
-            f.write(now)
+        if versions is not None:
+            versions.save()
+        self.write_log(self.gis_update_log_path, now)
 
-    def pull_gis_updates(self, max_records=None):
+    @exclusive(lambda self: self.gis_update_queue_path)
+    def pull_gis_updates(self, max_records=None, fetch_mode=None):
         now = self.make_timestamp()
+        versions = self.load_gis_versions(fetch_mode)
+        dismissed_statuses = self.refresh_dismissed_statuses()
         logger.info(f"Fetching active litigations updated since {self.last_gis_pull}")
-        active_litigation_features = self.fetch_gis_active_litigation_features(
-            max_records
-        )
-        logger.info(
-            f"Fetched {len(active_litigation_features)} active litigation features"
+        active_litigations = self.log_gis_active_litigation_features(
+            now,
+            dismissed_statuses.annotate(
+                self.iter_gis_active_litigation_features(max_records, versions)
+            ),
         )
-        self.log_gis_active_litigation_features(now, active_litigation_features)
         attachments = self.fetch_active_litigation_features_attachments(
-            active_litigation_features
+            active_litigations
         )
         self.log_gis_attachments(now, attachments)
 
-        with open(self.gis_update_log_path, "w") as f:
-            f.write(now)
+        if versions is not None:
+            versions.save()
+        self.write_log(self.gis_update_log_path, now)
 
     def create_or_update_matter(self, incident: GISIncident, migrate=False):
         matter = (
@@ -600,247 +793,516 @@ class DataBridge:
                 )
             return res
 
-    def upload_document(self, attachment: GISAttachment, migrate=False):
-        doc = None
-        matter = self.clio_api_client.get_matter(
-            self.group.id,
-            self.custom_fields.get_field_id_by_name(
-                ClioCustomFieldNames.CIVIL_WARRANT.value
-            ),
-            attachment.civil_warrant,
+    def download_attachment(self, attachment: GISAttachment) -> Optional[bytes]:
+        url = os.path.join(
+            self.gis_client.host,
+            self.gis_client.feature_server_path,
+            str(self.gis_client.active_litigation_table_id),
+            str(attachment.litigation_object_id),
+            "attachments",
+            str(attachment.id),
         )
-        if matter:
+        res = self.gis_client.session.get(url, stream=True)
+        if res.status_code == 200:
+            return res.content
+        return None
+
+    def find_document(self, matter_id, gis_id, document_lookup=None):
+        if (document_lookup or DOCUMENT_LOOKUP) == "single":
+            return self.clio_api_client.get_document(matter_id=matter_id, gis_id=gis_id)
+        return self.matter_documents.document(
+            matter_id,
+            gis_id,
+            lambda: self.clio_api_client.get_matter_documents(matter_id),
+        )
+
+    ## Resumes an earlier attempt at the step it failed
+    def upload_document(
+        self, attachment: GISAttachment, migrate=False, document_lookup=None
+    ):
+        spool = self.attachment_spool
+        upload = spool.upload_state(attachment)
+        if upload.get("document_id") is None:
+            matter = self.matter_documents.matter(
+                attachment.civil_warrant,
+                lambda: self.clio_api_client.get_matter(
+                    self.group.id,
+                    self.custom_fields.get_field_id_by_name(
+                        ClioCustomFieldNames.CIVIL_WARRANT.value
+                    ),
+                    attachment.civil_warrant,
+                ),
+            )
+            if not matter:
+                return None
             doc = (
                 None
                 if migrate
-                else self.clio_api_client.get_document(
-                    matter_id=matter["id"], gis_id=attachment.id
-                )
+                else self.find_document(matter["id"], attachment.id, document_lookup)
             )
-            if doc is None:
-                url = os.path.join(
-                    self.gis_client.host,
-                    self.gis_client.feature_server_path,
-                    str(self.gis_client.active_litigation_table_id),
-                    str(attachment.litigation_object_id),
-                    "attachments",
-                    str(attachment.id),
+            ## A document created by an upload that never finished does not count
+            if doc and (doc.get("latest_document_version") or {}).get(
+                "fully_uploaded", True
+            ):
+                spool.finish_upload(attachment)
+                return doc
+            matter_id = matter["id"]
+        else:
+            matter_id = upload["matter_id"]
+        content = spool.content(
+            attachment, lambda: self.download_attachment(attachment)
+        )
+        if content is None:
+            return None
+        ## Only an upload resumed from an earlier push can have a stale put_url
+        resumed = upload.get("step") is not None
+        while True:
+            if upload.get("step") is None:
+                document = self.clio_api_client.create_document(
+                    matter_id=matter_id,
+                    gis_id=attachment.id,
+                    file_name=attachment.name,
+                )
+                version = document["latest_document_version"]
+                upload = spool.save_upload_state(
+                    attachment,
+                    step=CREATED,
+                    matter_id=matter_id,
+                    document_id=document["id"],
+                    document_uuid=version["uuid"],
+                    put_url=version["put_url"],
+                    put_headers=version["put_headers"],
+                )
+            res = None
+            if upload["step"] == CREATED:
+                res = self.clio_api_client.put_document_content(
+                    upload["put_url"], upload["put_headers"], content
                 )
-                res = s.get(url, stream=True)
-                if res.status_code == 200:
-                    res = self.clio_api_client.upload_document(
-                        matter_id=matter["id"],
-                        gis_id=attachment.id,
-                        file_name=attachment.name,
-                        file_content=res.content,
+                if res.ok:
+                    upload = spool.save_upload_state(
+                        attachment, durable=False, step=STORED
                     )
-                    doc = res.json()
-        return doc
-
-    def push_gis_updates(self, migrate=False):
-        litigation_update_files = sorted(
-            os.listdir(self.gis_active_litigation_update_path)
-        )
-        for _file in litigation_update_files:
-            failures = []
-            file_path = os.path.join(self.gis_active_litigation_update_path, _file)
-            with open(file_path, "r") as f:
-                litigation_json = f.readline()
-                while litigation_json:
-                    litigation = GISIncident(**json.loads(litigation_json))
-                    logger.info(f"uploading matter {litigation}")
                     res = None
-                    try:
-                        res = self.create_or_update_matter(litigation, migrate)
-
-                        res.raise_for_status()
-                    except Exception as e:
-
-                        logger.warning(f"Failed to process matter update {litigation}")
-                        logger.warning(res.content)
-                        failures.append(litigation)
-                    litigation_json = f.readline()
-            if bool(failures):
-                update_file = open(file_path, "w")
-                for failure in failures:
-                    update_file.write(json.dumps(asdict(failure)))
-                    update_file.write("\n")
-                update_file.close()
-            else:
-                os.remove(file_path)
+            if res is None:
+                res = self.clio_api_client.mark_document_uploaded(
+                    upload["document_id"], upload["document_uuid"]
+                )
+            if resumed and res.status_code in RESTART_STATUSES:
+                logger.info(
+                    f"Restarting upload of attachment {attachment.id}: "
+                    f"Clio answered {res.status_code}"
+                )
+                upload = spool.restart_upload(attachment)
+                resumed = False
+                continue
+            res.raise_for_status()
+            break
+        spool.finish_upload(attachment)
+        doc = res.json()
+        self.matter_documents.add(matter_id, attachment.id, doc["data"])
+        return doc
 
-        attachments_update_files = sorted(
-            os.listdir(self.gis_ligation_attachments_update_path)
-        )
-        for _file in attachments_update_files:
-            file_path = os.path.join(self.gis_ligation_attachments_update_path, _file)
-            failures = []
-            with open(file_path, "r") as f:
-                attachment_json = f.readline()
-                while attachment_json:
-                    attachment = GISAttachment(**json.loads(attachment_json))
-                    logger.info(f"uploading document, {attachment}")
-                    try:
-                        doc = self.upload_document(
-                            attachment=attachment, migrate=migrate
+    def process_segment(
+        self, file_path, process: Callable[[dict], bool], workers=1, stage=None
+    ):
+        if stage is not None:
+            process = self._counted(process, stage)
+        if workers > 1 and is_indexable(file_path):
+            with IndexedSegment(file_path) as segment:
+
+                def process_range(line_range):
+                    return [
+                        record
+                        for record in segment.iter_range(*line_range)
+                        if not process(record)
+                    ]
+
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    return [
+                        failure
+                        for failures in pool.map(
+                            process_range, segment.partitions(workers)
                         )
-                    except:
-                        doc = None
-                    if doc:
-                        logger.info(
-                            f"Successfully uploaded document to clio {attachment}"
+                        for failure in failures
+                    ]
+        return [record for record in iter_segment(file_path) if not process(record)]
+
+    def _counted(self, process, stage):
+        def inner(record):
+            stage.add(records=1)
+            return process(record)
+
+        return inner
+
+    ## Skips segments leased by another push or removed before the lease was taken
+    def claimed_segments(self, directory):
+        for file_path in list_segments(directory):
+            lease = segment_lease(file_path)
+            if not lease.acquire():
+                logger.info(
+                    f"Skipping {file_path}, leased by {(lease.holder or {}).get('owner')}"
+                )
+                continue
+            try:
+                if os.path.exists(file_path):
+                    yield file_path, lease
+            finally:
+                lease.release()
+
+    def finish_segment(self, file_path, failures, lease=None):
+        if lease is not None and lease.lost:
+            ## Another push took the segment over and will finish it
+            logger.warning(f"Lease on {file_path} was lost, leaving it in place")
+            return
+        if bool(failures):
+            rewrite_segment(file_path, failures)
+        else:
+            remove_segment(file_path)
+
+    def push_litigation(self, litigation_json, migrate=False):
+        litigation = GISIncident(**litigation_json)
+        logger.info(f"uploading matter {litigation}")
+        res = None
+        try:
+            res = self.create_or_update_matter(litigation, migrate)
+
+            res.raise_for_status()
+        except Exception as e:
+
+            logger.warning(f"Failed to process matter update {litigation}")
+            logger.warning(res.content if res is not None else e)
+            return False
+        return True
+
+    def push_attachment(self, attachment_json, migrate=False, document_lookup=None):
+        attachment = GISAttachment(**attachment_json)
+        if self.attachment_manifest.is_synced(attachment):
+            logger.info(f"Document already synced to clio {attachment}")
+            return True
+        logger.info(f"uploading document, {attachment}")
+        try:
+            doc = self.upload_document(
+                attachment=attachment, migrate=migrate, document_lookup=document_lookup
+            )
+        except:
+            doc = None
+        if doc:
+            logger.info(f"Successfully uploaded document to clio {attachment}")
+            ## An upload returns the PATCH response body, an existing document is
+            ## the document itself
+            uploaded = "data" in doc
+            self.attachment_manifest.record(
+                attachment,
+                UPLOADED if uploaded else FOUND,
+                (doc["data"] if uploaded else doc).get("id"),
+            )
+            return True
+        logger.warning(f"Failed to upload document to clio {attachment}")
+        return False
+
+    def push_gis_updates(self, migrate=False, workers=1, document_lookup=None):
+        document_lookup = document_lookup or DOCUMENT_LOOKUP
+        if document_lookup not in DOCUMENT_LOOKUPS:
+            raise ValueError(f"Unknown document lookup {document_lookup}")
+        self.matter_documents = MatterDocuments()
+        with metrics.stage("clio.push_matters") as stage:
+            for file_path, lease in self.claimed_segments(
+                self.gis_active_litigation_update_path
+            ):
+                failures = self.process_segment(
+                    file_path,
+                    lambda litigation: self.push_litigation(litigation, migrate),
+                    workers,
+                    stage,
+                )
+                self.finish_segment(file_path, failures, lease)
+
+        with metrics.stage("clio.push_documents") as stage:
+            for file_path, lease in self.claimed_segments(
+                self.gis_ligation_attachments_update_path
+            ):
+                failures = self.process_segment(
+                    file_path,
+                    lambda attachment: self.push_attachment(
+                        attachment, migrate, document_lookup
+                    ),
+                    workers,
+                    stage,
+                )
+                self.finish_segment(file_path, failures, lease)
+        evicted = self.attachment_spool.evict()
+        if evicted:
+            logger.info(f"Evicted {evicted} attachments from the spool")
+
+    ## With several workers, pages arrive in no particular order
+    def iter_matter_pages(
+        self, ids=None, updated_since=None, limit=CLIO_PAGE_LIMIT, workers=None
+    ) -> Iterator[List[Dict]]:
+        workers = workers or CLIO_FETCH_WORKERS
+        with metrics.stage("clio.fetch_matters") as stage:
+            if ids or workers <= 1:
+                pages = self.clio_api_client.iter_matter_pages(
+                    self.group.id,
+                    self.practice_area.id,
+                    ids=ids,
+                    updated_since=updated_since,
+                    limit=limit,
+                )
+            else:
+                pages = iter_concurrently(
+                    [
+                        functools.partial(
+                            self.iter_matter_window_pages, since, before, limit
                         )
-                    else:
-                        failures.append(attachment)
-                        logger.warning(
-                            f"Failed to upload document to clio {attachment}"
+                        for since, before in self.matter_update_windows(
+                            updated_since, workers * WINDOWS_PER_WORKER
                         )
-                    attachment_json = f.readline()
-            if bool(failures):
-                update_file = open(file_path, "w")
-                for failure in failures:
-                    update_file.write(json.dumps(asdict(failure)))
-                    update_file.write("\n")
-                update_file.close()
-            else:
-                os.remove(file_path)
-
-    def get_all_matters(self, ids=None, updated_since=None):
-        matters = []
-        res = self.clio_api_client.get_matters(
-            self.group.id, self.practice_area.id, ids=ids, updated_since=updated_since
+                    ],
+                    workers,
+                )
+            try:
+                for page in pages:
+                    stage.add(records=len(page))
+                    yield page
+            finally:
+                pages.close()
+
+    ## From `updated_since`, or the least recently updated matter, to now
+    def matter_update_windows(self, updated_since, count):
+        end = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+            seconds=1
         )
-        if res.status_code == 200:
-            body = res.json()
-            matters += body["data"]
-            next = body["meta"].get("paging").get("next")
-            while next:
-                res = self.clio_api_client.oauth.client.get(next)
-                content = res.json()
-                matters += content.get("data", [])
-                next = res.json().get("meta", {}).get("paging", {}).get("next")
-        return matters
+        if updated_since:
+            start = parse_clio_time(updated_since)
+        else:
+            matter = self.clio_api_client.get_least_recently_updated_matter(
+                self.group.id, self.practice_area.id
+            )
+            if matter is None:
+                return []
+            start = parse_clio_time(matter["updated_at"]) - datetime.timedelta(
+                seconds=1
+            )
+        windows = time_windows(start, end, count)
+        if not updated_since:
+            windows[0] = (None, windows[0][1])
+        return windows
+
+    ## Clio's filters are widened by a second and trimmed here, so adjacent windows
+    ## neither miss nor repeat a matter
+    def iter_matter_window_pages(self, since, before, limit=CLIO_PAGE_LIMIT):
+        pages = self.clio_api_client.iter_matter_pages(
+            self.group.id,
+            self.practice_area.id,
+            updated_since=since.isoformat() if since else None,
+            updated_before=(before + datetime.timedelta(seconds=1)).isoformat(),
+            limit=limit,
+        )
+        for page in pages:
+            yield [
+                matter
+                for matter in page
+                if (since is None or parse_clio_time(matter["updated_at"]) > since)
+                and parse_clio_time(matter["updated_at"]) <= before
+            ]
+
+    ## Given `matter_ids`, reads those matters' entries on `workers` threads instead
+    def fetch_next_calendar_entries(
+        self, updated_since=None, _from=None, matter_ids=None, workers=None
+    ) -> Dict[int, Dict]:
+        workers = workers or CLIO_FETCH_WORKERS
+        with metrics.stage("clio.fetch_calendar_entries") as stage:
+            if matter_ids is None:
+                pages = self.clio_api_client.iter_calendar_entry_pages(
+                    self.clio_calendar.id, updated_since, _from
+                )
+            else:
+                pages = iter_concurrently(
+                    [
+                        functools.partial(
+                            self.clio_api_client.iter_calendar_entry_pages,
+                            self.clio_calendar.id,
+                            updated_since,
+                            _from,
+                            matter_id,
+                        )
+                        for matter_id in matter_ids
+                    ],
+                    workers,
+                )
+            next_entries = {}
+            for page in pages:
+                stage.add(records=len(page))
+                reduce_next_calendar_entries(page, next_entries)
+        return next_entries
 
+    @exclusive(lambda self: self.clio_update_queue_path)
     def pull_clio_updates(self, max_records=None):
         now = self.make_timestamp()
         logger.info(f"Pulling Clio updates at {now}")
         logger.info(f"Last Clio pull was {self.last_clio_pull}")
-        logger.info("Fetching all Clio matters")
         last_clio_pull_date = self.last_clio_pull
-        recently_updated_matters = self.get_all_matters(
-            updated_since=last_clio_pull_date
-        )[0:max_records]
-        ce_res = self.clio_api_client.get_calendar_entries(
-            self.clio_calendar.id, last_clio_pull_date, now
+        next_calendar_entries_by_matter_id = self.fetch_next_calendar_entries(
+            last_clio_pull_date, now
         )
-        calendar_entries = sorted(
-            [ce for ce in ce_res.json()["data"] if ce["matter"]],
-            key=lambda x: x["start_at"],
-            reverse=True,
+        logger.info("Fetching all Clio matters")
+        ## Matters are queued as their pages arrive; only ids are kept, to queue each
+        ## matter once
+        recently_updated_matters = (
+            matter
+            for page in self.iter_matter_pages(updated_since=last_clio_pull_date)
+            for matter in page
         )
-        matters_by_id = {}
-        if calendar_entries:
-            next_calendar_entries_by_matter_id = {
-                ce["matter"]["id"]: ce for ce in calendar_entries
-            }
-            calendar_entry_matters = self.get_all_matters(
-                ids=next_calendar_entries_by_matter_id.keys()
+        calendar_entry_matters = (
+            (
+                matter
+                for page in self.iter_matter_pages(
+                    ids=next_calendar_entries_by_matter_id.keys()
+                )
+                for matter in page
             )
-        else:
-            next_calendar_entries_by_matter_id = {}
-            calendar_entry_matters = []
-        matters_by_id = {
-            matter["id"]: matter
-            for matter in recently_updated_matters + calendar_entry_matters
-        }
-        logger.debug(f"Fetched {len(matters_by_id)} matters")
-        if bool(matters_by_id):
-            matter_f = open(os.path.join(self.clio_matters_update_path, now), "w")
-            for id, matter in matters_by_id.items():
+            if next_calendar_entries_by_matter_id
+            else ()
+        )
+        queued_ids = set()
+        dismissed_option_id = self.custom_fields.fields_by_name[
+            ClioCustomFieldNames.COURT_STATUS.value
+        ].get_option_id_by_name("Dismissed")
+        with metrics.stage("clio.queue_matters") as stage, SegmentWriter(
+            self.clio_matters_update_path, now
+        ) as matter_f:
+            for matter in chain(
+                islice(recently_updated_matters, max_records), calendar_entry_matters
+            ):
+                id = matter["id"]
+                if id in queued_ids:
+                    continue
+                queued_ids.add(id)
                 calendar_entry = next_calendar_entries_by_matter_id.get(id, {})
                 matter = ClioMatter(
                     matter,
                     calendar_entry.get("start_at"),
                     calendar_entry.get("description"),
                 )
-                if (
-                    matter.court_status
-                    == self.custom_fields.fields_by_name[
-                        ClioCustomFieldNames.COURT_STATUS.value
-                    ].get_option_id_by_name("Dismissed")
-                    or matter.next_court_date
-                ):
+                if matter.court_status == dismissed_option_id or matter.next_court_date:
                     logger.info(f"Logging Clio matter update {matter.input_doc}")
                     log = {
                         "matter": matter.input_doc,
                         "next_court_date": matter.next_court_date,
                         "court_notes": matter.court_notes,
                     }
-                    matter_f.write(json.dumps(log))
-                    matter_f.write("\n")
-            matter_f.close()
-        with open(self.clio_update_log_path, "w") as f:
-            f.write(now)
-
-    def process_clio_matters(self):
-        matter_update_files = sorted(os.listdir(self.clio_matters_update_path))
-        for _file in matter_update_files:
-            file_path = os.path.join(self.clio_matters_update_path, _file)
-            matters_to_process_by_id: Dict[str, ClioMatter] = {}
-            matter_id_by_gis_object_id: Dict[str, str] = {}
+                    matter_f.write(log)
+            stage.add(records=matter_f.records, bytes=matter_f.bytes_written)
+        logger.debug(f"Fetched {len(queued_ids)} matters")
+        self.queue_clio_notes(now, last_clio_pull_date)
+        self.write_log(self.clio_update_log_path, now)
+
+    ## Only each matter's latest note, and only if newer than its watermark
+    def queue_clio_notes(self, timestamp, updated_since=None, batch_size=200):
+        watermarks = NoteWatermarks.load(self.note_watermarks_path)
+        latest_notes = {}
+        with metrics.stage("clio.fetch_notes") as stage:
+            for page in self.clio_api_client.iter_note_pages(updated_since):
+                stage.add(records=len(page))
+                for note in page:
+                    if not note.get("matter") or not watermarks.is_new(note):
+                        continue
+                    matter_id = note["matter"]["id"]
+                    current = latest_notes.get(matter_id)
+                    if current is None or parse_clio_time(
+                        note["updated_at"]
+                    ) >= parse_clio_time(current["updated_at"]):
+                        latest_notes[matter_id] = note
+        matter_ids = list(latest_notes)
+        with metrics.stage("clio.queue_notes") as stage, SegmentWriter(
+            self.clio_notes_update_path, timestamp
+        ) as notes_f:
+            for start in range(0, len(matter_ids), batch_size):
+                ## Only matters of the data bridge's group and practice area
+                for page in self.iter_matter_pages(
+                    ids=matter_ids[start : start + batch_size]
+                ):
+                    for matter in page:
+                        note = latest_notes[matter["id"]]
+                        notes_f.write({"matter": matter, "note": note})
+                        watermarks.advance(matter["id"], note["updated_at"])
+            stage.add(records=notes_f.records, bytes=notes_f.bytes_written)
+        logger.info(f"Queued the latest note of {notes_f.records} matters")
+        watermarks.save()
+
+    def process_clio_matters(self, batch_size=500):
+        for file_path, lease in self.claimed_segments(self.clio_matters_update_path):
             failures = []
-            matters_to_process = []
-            with open(file_path, "r") as f:
-                matter_json = f.readline()
-                while matter_json:
-                    details = json.loads(matter_json)
-                    matter = ClioMatter(
-                        matter=details["matter"],
-                        next_court_date=details["next_court_date"],
-                        court_notes=details["court_notes"],
-                    )
-                    matters_to_process.append(matter)
-                    matter_json = f.readline()
-            res = self.gis_client.add_litigation_history(
-                [matter.to_gis_request_feature() for matter in matters_to_process]
+            for batch in iter_batches(file_path, batch_size):
+                with metrics.stage("gis.push_litigation_history") as stage:
+                    failures += self.push_litigation_history(batch)
+                    stage.add(records=len(batch))
+            self.finish_segment(file_path, failures, lease)
+
+    def push_litigation_history(self, batch):
+        failures = []
+        matters_to_process = [
+            ClioMatter(
+                matter=details["matter"],
+                next_court_date=details["next_court_date"],
+                court_notes=details["court_notes"],
             )
-            if res.status_code == 200:
-                update_results = res.json()["addResults"]
-                for i, result in enumerate(update_results):
-                    matter = matters_to_process[i]
-                    if result["success"]:
-                        logger.info(
-                            f"Successfully pushed matter updates to GIS {matter}"
-                        )
-                    else:
-                        logger.warning(f"Failed to push matter updates to GIS {matter}")
-                        failures.append(
-                            {
-                                "matter": matter.input_doc,
-                                "next_court_date": matter.next_court_date,
-                                "court_notes": matter.court_notes,
-                            }
-                        )
-            else:
-                failures = [
-                    {
-                        "matter": matter.input_doc,
-                        "next_court_date": matter.next_court_date,
-                        "court_notes": matter.court_notes,
-                    }
-                    for matter in matters_to_process
-                ]
-            if failures:
-                update_file = open(file_path, "w")
-                for failure in failure:
-                    update_file.write(json.dumps(failure))
-                    update_file.write("\n")
-                update_file.close()
+            for details in batch
+        ]
+        res = self.gis_client.add_litigation_history(
+            [matter.to_gis_request_feature() for matter in matters_to_process]
+        )
+        if res.status_code == 200:
+            update_results = res.json()["addResults"]
+            for i, result in enumerate(update_results):
+                matter = matters_to_process[i]
+                if result["success"]:
+                    logger.info(f"Successfully pushed matter updates to GIS {matter}")
+                else:
+                    logger.warning(f"Failed to push matter updates to GIS {matter}")
+                    failures.append(batch[i])
+        else:
+            failures += batch
+        return failures
+
+    def process_clio_notes(self, batch_size=500):
+        for file_path, lease in self.claimed_segments(self.clio_notes_update_path):
+            failures = []
+            for batch in iter_batches(file_path, batch_size):
+                with metrics.stage("gis.push_notes") as stage:
+                    failures += self.push_note_updates(batch)
+                    stage.add(records=len(batch))
+            self.finish_segment(file_path, failures, lease)
+
+    ## One updateFeatures request per batch; returns the notes that failed
+    def push_note_updates(self, batch):
+        notes, records = [], []
+        for record in batch:
+            note = ClioNote(**record)
+            if not note.matter.object_id:
+                logger.warning(f"Skipping note {note.id}, its matter has no GIS id")
+                continue
+            notes.append(note)
+            records.append(record)
+        if not notes:
+            return []
+        res = self.gis_client.update_litigations(
+            [note.to_gis_request_feature() for note in notes]
+        )
+        if res.status_code != 200:
+            return records
+        failures = []
+        for note, record, result in zip(notes, records, res.json()["updateResults"]):
+            if result["success"]:
+                logger.info(f"Successfully pushed note {note.id} to GIS")
             else:
-                os.remove(file_path)
+                logger.warning(f"Failed to push note {note.id} to GIS {result}")
+                failures.append(record)
+        return failures
 
     def push_clio_updates(self):
         self.process_clio_matters()
+        self.process_clio_notes()
 
     def timestamp_to_datetime_str(self, timestamp):
         return datetime.datetime.fromtimestamp(timestamp / 1e3).isoformat()
@@ -0,0 +1,118 @@
+"""The latest dismiss status and condition of every civil warrant, kept on disk.
+
+The litigation history table only grows, so the index saved in
+`data/gis/dismissed_statuses.json` remembers the highest OBJECTID it has read and
+each refresh only asks for rows added after it, a page at a time. Rows are read in
+OBJECTID order and a later row replaces an earlier one for the same civil warrant,
+as the full query did. History rows edited in place are picked up by a full rebuild
+once the index is older than DATABRIDGE_DISMISSED_INDEX_MAX_AGE seconds (a day by
+default).
+
+Both `gis_to_clio_migration` and `pull_gis_updates` refresh the index and set
+`dismiss_status` and `dismissed_condition` on every litigation they queue.
+"""
+
+import os
+import time
+from typing import Dict, Iterable, Iterator, Optional
+
+from utils.atomic import atomic_write
+from utils.constants import GISLitigationHistoryFields
+from utils.serialization import dumps, loads
+
+DISMISSED_INDEX_MAX_AGE = float(
+    os.environ.get("DATABRIDGE_DISMISSED_INDEX_MAX_AGE", 24 * 3600)
+)
+
+OBJECT_ID = GISLitigationHistoryFields.OBJECT_ID.value
+CIVIL_WARRANT = GISLitigationHistoryFields.CIVIL_WARRANT.value
+DISMISS_STATUS = GISLitigationHistoryFields.DISMISS_STATUS.value
+DISMISSED_CONDITION = GISLitigationHistoryFields.DISMISSED_CONDITION.value
+
+
+class DismissedStatusIndex:
+    def __init__(
+        self,
+        path,
+        statuses: Optional[Dict[str, Dict]] = None,
+        max_object_id: Optional[int] = None,
+        built_at: Optional[float] = None,
+    ):
+        self.path = path
+        ## Civil warrant -> {DismissStatus, DismissedCondition}
+        self.statuses: Dict[str, Dict] = statuses or {}
+        self.max_object_id = max_object_id
+        ## When the index was last rebuilt from the whole table
+        self.built_at = built_at
+
+    @classmethod
+    def load(cls, path) -> "DismissedStatusIndex":
+        try:
+            with open(path, "rb") as f:
+                saved = loads(f.read())
+        except (FileNotFoundError, ValueError):
+            saved = {}
+        return cls(
+            path,
+            saved.get("statuses"),
+            saved.get("max_object_id"),
+            saved.get("built_at"),
+        )
+
+    def save(self):
+        atomic_write(
+            self.path,
+            dumps(
+                {
+                    "max_object_id": self.max_object_id,
+                    "built_at": self.built_at,
+                    "statuses": self.statuses,
+                }
+            ),
+        )
+
+    def is_stale(self, max_age=DISMISSED_INDEX_MAX_AGE, now=None) -> bool:
+        return (
+            self.max_object_id is None
+            or self.built_at is None
+            or (now or time.time()) - self.built_at > max_age
+        )
+
+    def refresh(self, gis_client, max_age=DISMISSED_INDEX_MAX_AGE) -> int:
+        """Read history rows added since the last refresh, or the whole table if
+        the index is stale, and return how many were read."""
+        if self.is_stale(max_age):
+            built_at = time.time()
+            rows = gis_client.get_dismissed_statuses()["features"]
+            self.statuses, self.max_object_id = {}, None
+            self.built_at = built_at
+        else:
+            rows = gis_client.get_dismissed_statuses(
+                after_object_id=self.max_object_id
+            )["features"]
+        self.add(row["attributes"] for row in rows)
+        if self.max_object_id is None:
+            self.max_object_id = 0
+        return len(rows)
+
+    def add(self, rows: Iterable[Dict]):
+        for row in rows:
+            civil_warrant = row.get(CIVIL_WARRANT)
+            if civil_warrant is not None:
+                self.statuses[civil_warrant] = {
+                    DISMISS_STATUS: row.get(DISMISS_STATUS),
+                    DISMISSED_CONDITION: row.get(DISMISSED_CONDITION),
+                }
+            object_id = row.get(OBJECT_ID)
+            if object_id is not None and (
+                self.max_object_id is None or object_id > self.max_object_id
+            ):
+                self.max_object_id = object_id
+
+    def annotate(self, incidents: Iterable) -> Iterator:
+        """Set the dismiss status and condition of each incident as it passes."""
+        for incident in incidents:
+            status = self.statuses.get(incident.civil_warrant, {})
+            incident.dismiss_status = status.get(DISMISS_STATUS)
+            incident.dismissed_condition = status.get(DISMISSED_CONDITION)
+            yield incident
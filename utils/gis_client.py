@@ -1,8 +1,7 @@
 import json
 import os
-from typing import Dict
+from typing import Dict, Iterable, Iterator, List
 import urllib
-import requests
 from requests.models import Response
 
 from utils.constants import (
@@ -14,14 +13,86 @@ from utils.constants import (
     GIS_LITIGATION_HISTORY_TABLE_ID,
     GIS_LITIGATION_HISTORY_TABLE_ID,
 )
+from utils.arcgis_pbf import CONTENT_TYPE as PBF_CONTENT_TYPE, decode_query_response
+from utils.json_stream import JSONArrayStream
 from utils.logging import logger
+from utils.metrics import instrument_client
+from utils.sessions import make_session
+
+## f= of GIS queries: pjson (indented JSON), json or pbf (protobuf, ArcGIS 10.7+)
+GIS_RESPONSE_FORMATS = ("pjson", "json", "pbf")
+GIS_RESPONSE_FORMAT = os.environ.get("DATABRIDGE_GIS_FORMAT", "json")
+
+## Bytes read at a time from streamed query responses
+STREAM_CHUNK_SIZE = 64 * 1024
+
+## Fields of the lightweight change scan
+ACTIVE_LITIGATION_VERSION_FIELDS = [
+    GISActiveLitigationsFields.OBJECT_ID.value,
+    GISActiveLitigationsFields.LAST_MODIFIED_DATE.value,
+]
+## Rows per page of the change scan; ArcGIS servers cap it at their maxRecordCount
+SCAN_PAGE_SIZE = 2000
+DISMISSED_STATUS_FIELDS = [
+    GISLitigationHistoryFields.OBJECT_ID.value,
+    GISLitigationHistoryFields.CIVIL_WARRANT.value,
+    GISLitigationHistoryFields.DISMISS_STATUS.value,
+    GISLitigationHistoryFields.DISMISSED_CONDITION.value,
+    GISLitigationHistoryFields.NEXT_COURT_DATE.value,
+]
+ACTIVE_LITIGATION_FIELDS = [
+    GISActiveLitigationsFields.OBJECT_ID.value,
+    ## sr number
+    GISActiveLitigationsFields.INCIDENT_NUMBER.value,
+    GISActiveLitigationsFields.PARCEL_ID.value,
+    GISActiveLitigationsFields.CITY_FILE_NO.value,
+    ## subdistrict
+    GISActiveLitigationsFields.SUB_DISTRICT.value,
+    GISActiveLitigationsFields.NPA_INSPECT_SUMMARY.value,
+    GISActiveLitigationsFields.CIVIL_WARRANT.value,
+    ## location
+    GISActiveLitigationsFields.LOCATION.value,
+    GISActiveLitigationsFields.NEXT_COURT_DATE.value,
+    ## property owner
+    GISActiveLitigationsFields.PROPERTY_OWNER.value,
+    ## defendent
+    GISActiveLitigationsFields.DEFENDENT.value,
+    GISActiveLitigationsFields.COURT_STATUS.value,
+    GISActiveLitigationsFields.LATEST_COURT_NOTES.value,
+    GISActiveLitigationsFields.CREATION_DATE.value,
+    GISActiveLitigationsFields.LAST_MODIFIED_DATE.value,
+]
+
+
+def decode_response(res: Response):
+    """Parse a query response; `f=pbf` responses are protobuf, anything else, error
+    responses included, is JSON."""
+    if res.headers.get("Content-Type", "").startswith(PBF_CONTENT_TYPE):
+        return decode_query_response(res.content)
+    return res.json()
+
+
+def iter_features(res: Response) -> Iterator[Dict]:
+    """The features of a streamed query response, parsed one at a time. Protobuf
+    responses cannot be split, so they are decoded whole."""
+    if res.status_code != 200:
+        logger.info(f"Non 200 status code for gis request {res}")
+        raise Exception
+    if res.headers.get("Content-Type", "").startswith(PBF_CONTENT_TYPE):
+        yield from handle_api_response(res)["features"]
+        return
+    stream = JSONArrayStream(res.iter_content(STREAM_CHUNK_SIZE))
+    yield from stream
+    if not stream.found:
+        logger.info(f"Unexpected response body for gis request {stream.fields}")
+        raise Exception
 
 
 def handle_api_response(res: Response):
     if res.status_code != 200:
         logger.info(f"Non 200 status code for gis request {res}")
     else:
-        content = res.json()
+        content = decode_response(res)
         if content.get("features") is not None:
             return content
         else:
@@ -29,6 +100,8 @@ def handle_api_response(res: Response):
     raise Exception
 
 
+## Generators are excluded: their calls return before any request is made
+@instrument_client("gis", exclude=("build_query_url", "iter_active_litigations"))
 class GISClient:
     def __init__(
         self,
@@ -36,18 +109,24 @@ class GISClient:
         feature_server_path=GIS_FEATURE_SERVER_PATH,
         active_litigation_table_id=GIS_ACTIVE_LITIGATION_TABLE_ID,
         litigation_history_table_id=GIS_LITIGATION_HISTORY_TABLE_ID,
+        response_format=GIS_RESPONSE_FORMAT,
     ):
+        if response_format not in GIS_RESPONSE_FORMATS:
+            raise ValueError(f"Unknown GIS response format {response_format}")
         self.host = host
+        ## f= of every query; attachment listings are always compact JSON
+        self.response_format = response_format
+        self.session = make_session("gis")
         self.feature_server_path = feature_server_path
         self.active_litigation_table_id = active_litigation_table_id
         self.litigation_history_table_id = litigation_history_table_id
 
     def build_query_url(self, table_id, query_params: Dict = {}, query_path = "query"):
         default_query_params = {
-            "f": "pjson",
+            "f": self.response_format,
             "returnGeometry": "true",
         }
-        params = {**query_params, **default_query_params}
+        params = {**default_query_params, **query_params}
         query_string = urllib.parse.urlencode(params)
         url = (
             os.path.join(self.host, self.feature_server_path, str(table_id), query_path)
@@ -59,28 +138,7 @@ class GISClient:
     def get_active_litigations(
         self,
         query_start_datetime=None,
-        fields=[
-            GISActiveLitigationsFields.OBJECT_ID.value,
-            ## sr number
-            GISActiveLitigationsFields.INCIDENT_NUMBER.value,
-            GISActiveLitigationsFields.PARCEL_ID.value,
-            GISActiveLitigationsFields.CITY_FILE_NO.value,
-            ## subdistrict
-            GISActiveLitigationsFields.SUB_DISTRICT.value,
-            GISActiveLitigationsFields.NPA_INSPECT_SUMMARY.value,
-            GISActiveLitigationsFields.CIVIL_WARRANT.value,
-            ## location
-            GISActiveLitigationsFields.LOCATION.value,
-            GISActiveLitigationsFields.NEXT_COURT_DATE.value,
-            ## property owner
-            GISActiveLitigationsFields.PROPERTY_OWNER.value,
-            ## defendent
-            GISActiveLitigationsFields.DEFENDENT.value,
-            GISActiveLitigationsFields.COURT_STATUS.value,
-            GISActiveLitigationsFields.LATEST_COURT_NOTES.value,
-            GISActiveLitigationsFields.CREATION_DATE.value,
-            GISActiveLitigationsFields.LAST_MODIFIED_DATE.value,
-        ],
+        fields=ACTIVE_LITIGATION_FIELDS,
     ):
         """ """
         query_params = {
@@ -90,28 +148,126 @@ class GISClient:
             "outFields": ",".join(fields),
         }
         url = self.build_query_url(self.active_litigation_table_id, query_params)
-        res = requests.get(url)
+        res = self.session.get(url)
         return handle_api_response(res)
 
+    def iter_active_litigations(
+        self,
+        query_start_datetime=None,
+        fields=ACTIVE_LITIGATION_FIELDS,
+    ) -> Iterator[Dict]:
+        """Like `get_active_litigations`, but yield features while the response
+        downloads. Closing the generator early closes the connection, so the rest
+        of the response is never read."""
+        query_params = {
+            "where": f"last_modified_date > '{query_start_datetime}'"
+            if query_start_datetime
+            else "",
+            "outFields": ",".join(fields),
+        }
+        url = self.build_query_url(self.active_litigation_table_id, query_params)
+        with self.session.get(url, stream=True) as res:
+            yield from iter_features(res)
+
+    def query_pages(
+        self, table_id, query_params: Dict, page_size=SCAN_PAGE_SIZE
+    ) -> List[Dict]:
+        """Every feature matching a query, without geometry, fetched in pages
+        ordered by OBJECTID."""
+        features: List[Dict] = []
+        while True:
+            url = self.build_query_url(
+                table_id,
+                {
+                    **query_params,
+                    "orderByFields": GISActiveLitigationsFields.OBJECT_ID.value,
+                    "resultOffset": len(features),
+                    "resultRecordCount": page_size,
+                    "returnGeometry": "false",
+                },
+            )
+            content = handle_api_response(self.session.get(url))
+            features.extend(content["features"])
+            if not content.get("exceededTransferLimit") or not content["features"]:
+                return features
+
+    def scan_active_litigations(
+        self, query_start_datetime=None, page_size=SCAN_PAGE_SIZE
+    ) -> List[Dict]:
+        """The OBJECTID and LAST_MODIFIED_DATE of every active litigation, or of
+        those modified since `query_start_datetime`, without geometry."""
+        query_params = {
+            "where": f"last_modified_date > '{query_start_datetime}'"
+            if query_start_datetime
+            else "1=1",
+            "outFields": ",".join(ACTIVE_LITIGATION_VERSION_FIELDS),
+        }
+        return [
+            feature["attributes"]
+            for feature in self.query_pages(
+                self.active_litigation_table_id, query_params, page_size
+            )
+        ]
+
+    def get_active_litigations_by_ids(
+        self, object_ids: Iterable[int], fields=ACTIVE_LITIGATION_FIELDS
+    ) -> List[Dict]:
+        """Full attributes and geometry of the given litigations. The ids are sent
+        in a POST body, so a batch is not limited by the URL length."""
+        url = os.path.join(
+            self.host,
+            self.feature_server_path,
+            str(self.active_litigation_table_id),
+            "query",
+        )
+        res = self.session.post(
+            url,
+            data={
+                "objectIds": ",".join(str(object_id) for object_id in object_ids),
+                "outFields": ",".join(fields),
+                "returnGeometry": "true",
+                "f": self.response_format,
+            },
+        )
+        return handle_api_response(res)["features"]
+
     def get_dismissed_statuses(
         self,
-        fields=[
-            GISLitigationHistoryFields.CIVIL_WARRANT.value,
-            GISLitigationHistoryFields.DISMISS_STATUS.value,
-            GISLitigationHistoryFields.DISMISSED_CONDITION.value,
-            GISLitigationHistoryFields.NEXT_COURT_DATE.value,
-        ],
+        fields=DISMISSED_STATUS_FIELDS,
+        after_object_id=None,
+        page_size=SCAN_PAGE_SIZE,
     ):
+        """Litigation history rows with a dismiss status or condition, in OBJECTID
+        order, optionally only those added after `after_object_id`."""
+        where = ["DismissStatus IS NOT NULL", "DismissedCondition IS NOT NULL"]
+        if after_object_id is not None:
+            ## AND binds tighter than OR
+            where = [
+                f"{condition} AND {GISLitigationHistoryFields.OBJECT_ID.value} > "
+                f"{int(after_object_id)}"
+                for condition in where
+            ]
         query_params = {
-            "where": "DismissStatus IS NOT NULL OR DismissedCondition IS NOT NULL",
+            "where": " OR ".join(where),
             "outFields": ",".join(fields),
         }
-        url = self.build_query_url(self.litigation_history_table_id, query_params)
-        res = requests.get(url)
-        return handle_api_response(res)
+        return {
+            "features": self.query_pages(
+                self.litigation_history_table_id, query_params, page_size
+            )
+        }
 
-    def update_litigation():
-        pass
+    def update_litigations(self, features):
+        """Update attributes of active litigations, identified by OBJECTID."""
+        url = os.path.join(
+            self.host,
+            self.feature_server_path,
+            self.active_litigation_table_id,
+            "updateFeatures",
+        )
+        return self.session.post(
+            url, data={"f": "json", "features": json.dumps(features)}
+        )
 
     def get_attachments(self, object_id):
         url = os.path.join(
@@ -121,7 +277,7 @@ class GISClient:
             str(object_id),
             "attachments",
         )
-        return requests.get(url, params={"f": "pjson"}).json()["attachmentInfos"]
+        return self.session.get(url, params={"f": "json"}).json()["attachmentInfos"]
 
     def get_attachment(self, feature_object_id, attachment_object_id):
         url = os.path.join(
@@ -132,7 +288,7 @@ class GISClient:
             "attachments",
             str(attachment_object_id),
         )
-        return requests.get(url).content
+        return self.session.get(url).content
 
     def add_litigation_history(self, features):
         url = os.path.join(
@@ -141,4 +297,6 @@ class GISClient:
             self.litigation_history_table_id,
             "addFeatures"
         )
-        return requests.post(url, params={"f": "json", "features": json.dumps(features)})
+        return self.session.post(
+            url, data={"f": "json", "features": json.dumps(features)}
+        )
@@ -0,0 +1,76 @@
+"""The last seen LAST_MODIFIED_DATE of every active litigation, for delta pulls.
+
+With DATABRIDGE_GIS_FETCH_MODE=delta (the default) a GIS pull runs in two phases.
+It first scans the whole table for OBJECTID and LAST_MODIFIED_DATE only, without
+geometry, and compares the rows with the version map saved in
+`data/gis/versions.json`. Then it fetches full attributes and geometry, in
+`objectIds` batches, only for the rows that are new or whose LAST_MODIFIED_DATE
+changed. `full` keeps the single query of every field for rows modified since the
+last pull.
+
+The map is saved after the pull's queue segments, so a crash in between queues the
+same rows again on the next pull rather than losing them.
+"""
+
+import os
+from typing import Dict, Iterable, List, Optional, Set
+
+from utils.atomic import atomic_write
+from utils.constants import GISActiveLitigationsFields
+from utils.serialization import dumps, loads
+
+GIS_FETCH_MODES = ("delta", "full")
+GIS_FETCH_MODE = os.environ.get("DATABRIDGE_GIS_FETCH_MODE", "delta")
+## Litigations per objectIds query of the second phase
+GIS_FETCH_BATCH_SIZE = int(os.environ.get("DATABRIDGE_GIS_FETCH_BATCH_SIZE", 200))
+
+OBJECT_ID = GISActiveLitigationsFields.OBJECT_ID.value
+LAST_MODIFIED_DATE = GISActiveLitigationsFields.LAST_MODIFIED_DATE.value
+
+
+class GISVersionMap:
+    def __init__(self, path, versions: Optional[Dict[int, object]] = None):
+        self.path = path
+        self.versions: Dict[int, object] = versions or {}
+
+    @classmethod
+    def load(cls, path) -> "GISVersionMap":
+        try:
+            with open(path, "rb") as f:
+                saved = loads(f.read())
+        except (FileNotFoundError, ValueError):
+            saved = {}
+        return cls(
+            path,
+            {int(object_id): version for object_id, version in saved.items()},
+        )
+
+    def save(self):
+        atomic_write(
+            self.path,
+            dumps(
+                {str(object_id): version for object_id, version in self.versions.items()}
+            ),
+        )
+
+    def changed(self, rows: Iterable[Dict]) -> List[int]:
+        """Object ids of scanned rows that are new or modified since recorded."""
+        return [
+            row[OBJECT_ID]
+            for row in rows
+            if self.versions.get(row[OBJECT_ID], object()) != row.get(LAST_MODIFIED_DATE)
+        ]
+
+    def record(self, rows: Iterable[Dict], exclude: Set[int] = frozenset()):
+        for row in rows:
+            if row[OBJECT_ID] not in exclude:
+                self.versions[row[OBJECT_ID]] = row.get(LAST_MODIFIED_DATE)
+
+    def retain(self, rows: Iterable[Dict]):
+        """Forget litigations that are no longer in the table."""
+        present = {row[OBJECT_ID] for row in rows}
+        self.versions = {
+            object_id: version
+            for object_id, version in self.versions.items()
+            if object_id in present
+        }
@@ -0,0 +1,107 @@
+"""Incremental parsing of one large array in a JSON object as it downloads.
+
+ArcGIS query responses are a small object around one big `features` array.
+`JSONArrayStream` reads the response a chunk at a time and yields the array's items
+one by one, parsing each with the standard library decoder, so at most one chunk
+and one item are held in memory besides what the caller keeps. The object's other
+keys, e.g. `exceededTransferLimit`, are collected in `fields` as they are passed;
+keys after the array are only known once iteration finished. A consumer that stops
+early, e.g. after `max_records` items, can close the response without downloading
+the rest.
+"""
+
+import codecs
+import json
+from typing import Any, Dict, Iterable, Iterator
+
+_WHITESPACE = " \t\n\r"
+_decoder = json.JSONDecoder()
+
+
+class JSONArrayStream:
+    def __init__(self, chunks: Iterable[bytes], array_key="features"):
+        self.array_key = array_key
+        ## Keys of the object other than `array_key`
+        self.fields: Dict[str, Any] = {}
+        ## Set once `array_key` was found, even if the array was empty
+        self.found = False
+        self._chunks = iter(chunks)
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._exhausted = False
+
+    def _fill(self) -> bool:
+        """Append the next chunk to the buffer, dropping what was parsed."""
+        if self._exhausted:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._exhausted = True
+            text = self._text.decode(b"", final=True)
+        else:
+            text = self._text.decode(chunk)
+        self._buffer = self._buffer[self._pos :] + text
+        self._pos = 0
+        return True
+
+    def _peek(self) -> str:
+        while True:
+            while (
+                self._pos < len(self._buffer) and self._buffer[self._pos] in _WHITESPACE
+            ):
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON response")
+
+    def _expect(self, characters) -> str:
+        character = self._peek()
+        if character not in characters:
+            raise ValueError(
+                f"Expected one of {characters!r} in JSON response, got {character!r}"
+            )
+        self._pos += 1
+        return character
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                ## Most likely the value continues in the next chunk
+                if not self._fill():
+                    raise
+                continue
+            ## A number at the end of the buffer may continue in the next chunk
+            if end == len(self._buffer) and not self._exhausted:
+                self._fill()
+                continue
+            self._pos = end
+            return value
+
+    def __iter__(self) -> Iterator[Any]:
+        self._expect("{")
+        if self._peek() == "}":
+            return
+        while True:
+            key = self._value()
+            if not isinstance(key, str):
+                raise ValueError(f"Expected an object key in JSON response, got {key!r}")
+            self._expect(":")
+            if key == self.array_key:
+                self.found = True
+                self._expect("[")
+                if self._peek() == "]":
+                    self._pos += 1
+                else:
+                    while True:
+                        yield self._value()
+                        if self._expect(",]") == "]":
+                            break
+            else:
+                self.fields[key] = self._value()
+            if self._expect(",}") == "}":
+                return
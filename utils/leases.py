@@ -0,0 +1,175 @@
+## Expiring leases on the shared data directory, renewed by a heartbeat thread, so
+## only one pull writes a queue and concurrent pushes take different segments
+
+import functools
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional
+
+from utils.atomic import atomic_write, file_lock
+from utils.logging import logger
+
+LEASE_TTL = float(os.environ.get("DATABRIDGE_LEASE_TTL", 60))
+
+
+class LeaseUnavailable(RuntimeError):
+    pass
+
+
+def make_owner():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def read_lease(path) -> Optional[Dict]:
+    try:
+        with open(path) as f:
+            return json.loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+class Lease:
+    def __init__(self, path, ttl=LEASE_TTL, owner=None):
+        self.path = path
+        self.ttl = ttl
+        self.owner = owner or make_owner()
+        self.held = False
+        ## Set when the lease expired and another process took it over while held
+        self.lost = False
+        self.holder: Optional[Dict] = None
+        ## One advisory lock per directory guards every lease in it, so no lock
+        ## files are left behind for segments that were removed
+        self._lock_path = os.path.join(os.path.dirname(path), "leases")
+        self._stop = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    def _write(self, now, acquired_at=None):
+        atomic_write(
+            self.path,
+            json.dumps(
+                {
+                    "owner": self.owner,
+                    "pid": os.getpid(),
+                    "acquired_at": acquired_at or now,
+                    "renewed_at": now,
+                    "expires_at": now + self.ttl,
+                }
+            ),
+        )
+
+    def try_acquire(self) -> bool:
+        with file_lock(self._lock_path):
+            current = read_lease(self.path)
+            now = time.time()
+            if current and current.get("owner") != self.owner:
+                if current.get("expires_at", 0) > now:
+                    self.holder = current
+                    return False
+                logger.warning(
+                    f"Taking over expired lease {self.path} from {current.get('owner')}"
+                )
+            self._write(now)
+        self.held, self.lost, self.holder = True, False, None
+        self._start_heartbeat()
+        return True
+
+    def acquire(self, timeout=0.0, poll=1.0) -> bool:
+        deadline = time.monotonic() + timeout
+        while not self.try_acquire():
+            if time.monotonic() + poll > deadline:
+                return False
+            time.sleep(poll)
+        return True
+
+    def renew(self) -> bool:
+        with file_lock(self._lock_path):
+            current = read_lease(self.path)
+            if not current or current.get("owner") != self.owner:
+                self.lost = True
+                logger.warning(
+                    f"Lost lease {self.path} to {(current or {}).get('owner')}"
+                )
+                return False
+            self._write(time.time(), current.get("acquired_at"))
+        return True
+
+    def release(self):
+        self._stop_heartbeat()
+        if not self.held:
+            return
+        self.held = False
+        with file_lock(self._lock_path):
+            current = read_lease(self.path)
+            if current and current.get("owner") == self.owner:
+                try:
+                    os.remove(self.path)
+                except FileNotFoundError:
+                    pass
+
+    def _start_heartbeat(self):
+        self._stop_heartbeat()
+        self._stop.clear()
+        self._heartbeat = threading.Thread(
+            target=self._beat, name=f"lease-{os.path.basename(self.path)}", daemon=True
+        )
+        self._heartbeat.start()
+
+    def _stop_heartbeat(self):
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+
+    def _beat(self):
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                if not self.renew():
+                    return
+            except OSError as e:
+                logger.warning(f"Failed to renew lease {self.path}: {e}")
+
+    def __enter__(self):
+        if not self.acquire():
+            raise LeaseUnavailable(
+                f"{self.path} is held by {(self.holder or {}).get('owner')}"
+            )
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def queue_lease(directory, ttl=LEASE_TTL) -> Lease:
+    return Lease(os.path.join(directory, ".queue.lease"), ttl)
+
+
+def segment_lease(path, ttl=LEASE_TTL) -> Lease:
+    directory, name = os.path.split(path)
+    return Lease(os.path.join(directory, f".{name}.lease"), ttl)
+
+
+## Skips the call, returning None, while another process holds the queue lease
+def exclusive(directory: Callable[..., str]):
+    def decorate(method):
+        @functools.wraps(method)
+        def inner(self, *args, **kwargs):
+            path = directory(self)
+            lease = queue_lease(path)
+            if not lease.acquire():
+                logger.warning(
+                    f"Skipping {method.__name__}: {path} is leased by "
+                    f"{(lease.holder or {}).get('owner')}"
+                )
+                return None
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                lease.release()
+
+        return inner
+
+    return decorate
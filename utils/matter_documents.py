@@ -0,0 +1,98 @@
+"""Matters and their documents, looked up once per push rather than per attachment.
+
+Every queued attachment needs its matter, found by civil warrant, and to know whether
+the matter already has a document with the attachment's GIS id. Asking Clio for both
+per attachment costs two requests each. With the default
+DATABRIDGE_DOCUMENT_LOOKUP=bulk, a push instead lists each matter's documents once,
+with their external properties, and answers the existence check for all of that
+matter's attachments from the listing. Matters found by civil warrant are kept
+too. `DATABRIDGE_DOCUMENT_LOOKUP=single` keeps the per-attachment `get_document`.
+
+Pulls queue a litigation's attachments next to each other, so only the most
+recently used DATABRIDGE_DOCUMENT_CACHE_MATTERS matters are kept.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from utils.constants import ClioCustomFieldNames
+
+DOCUMENT_LOOKUPS = ("bulk", "single")
+DOCUMENT_LOOKUP = os.environ.get("DATABRIDGE_DOCUMENT_LOOKUP", "bulk")
+DOCUMENT_CACHE_MATTERS = int(os.environ.get("DATABRIDGE_DOCUMENT_CACHE_MATTERS", 1024))
+
+GIS_ID = ClioCustomFieldNames.DOCUMENT_EXTERNAL_ID_FIELD.value
+
+
+def gis_id_of(document) -> Optional[str]:
+    for prop in document.get("external_properties") or []:
+        if prop.get("name") == GIS_ID:
+            return str(prop.get("value"))
+    return None
+
+
+class MatterDocuments:
+    def __init__(self, max_matters=DOCUMENT_CACHE_MATTERS):
+        self.max_matters = max_matters
+        ## Civil warrant -> matter
+        self._matters: "OrderedDict[str, Dict]" = OrderedDict()
+        ## Matter id -> GIS id -> document
+        self._documents: "OrderedDict[int, Dict[str, Dict]]" = OrderedDict()
+        ## Held while a matter's documents are listed, so workers list it once
+        self._listing: Dict[int, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _remember(self, cache: OrderedDict, key, value):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.max_matters:
+            evicted, _ = cache.popitem(last=False)
+            if cache is self._documents:
+                self._listing.pop(evicted, None)
+
+    def matter(
+        self, civil_warrant, find: Callable[[], Optional[Dict]]
+    ) -> Optional[Dict]:
+        """The matter of a civil warrant, from `find` the first time. A matter that
+        was not found is looked up again next time."""
+        with self._lock:
+            matter = self._matters.get(civil_warrant)
+            if matter is not None:
+                self._matters.move_to_end(civil_warrant)
+                return matter
+        matter = find()
+        if matter:
+            with self._lock:
+                self._remember(self._matters, civil_warrant, matter)
+        return matter
+
+    def document(
+        self, matter_id, gis_id, list_documents: Callable[[], List[Dict]]
+    ) -> Optional[Dict]:
+        """The matter's document with this GIS id, listing the matter's documents
+        with `list_documents` the first time."""
+        with self._lock:
+            listing = self._listing.setdefault(matter_id, threading.Lock())
+        with listing:
+            with self._lock:
+                documents = self._documents.get(matter_id)
+                if documents is not None:
+                    self._documents.move_to_end(matter_id)
+            if documents is None:
+                documents = {}
+                for document in list_documents():
+                    key = gis_id_of(document)
+                    if key is not None:
+                        documents[key] = document
+                with self._lock:
+                    self._remember(self._documents, matter_id, documents)
+        return documents.get(str(gis_id))
+
+    def add(self, matter_id, gis_id, document):
+        """Record a document uploaded since its matter was listed."""
+        with self._lock:
+            documents = self._documents.get(matter_id)
+            if documents is not None:
+                documents[str(gis_id)] = document
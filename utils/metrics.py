@@ -0,0 +1,322 @@
+"""Counters, latency histograms and stage timers for the data bridge.
+
+Client methods are timed with `instrument_client`, HTTP requests are counted by the
+sessions built in `utils.sessions`, and DataBridge stages are wrapped with
+`metrics.stage(...)`. Job scripts run inside `metrics.job(...)`, which writes a JSON
+summary to `data/metrics/{job}.json`. The web app serves the summaries in the
+Prometheus text format at `/metrics`.
+"""
+
+import datetime
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Tuple
+
+from utils.atomic import atomic_write
+from utils.constants import BASE_DATA_DIR
+from utils.startup import mark
+
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    300.0,
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def metrics_directory(base_data_dir=BASE_DATA_DIR):
+    return os.path.join(base_data_dir, "data", "metrics")
+
+
+def _labels(labels: Dict) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = list(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def to_dict(self):
+        cumulative, buckets = 0, []
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            buckets.append([bound, cumulative])
+        return {"buckets": buckets, "sum": self.sum, "count": self.count}
+
+
+class Stage:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.records = 0
+        self.bytes = 0
+
+    def add(self, records=0, bytes=0):
+        with self._lock:
+            self.records += records
+            self.bytes += bytes
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @contextmanager
+    def stage(self, name):
+        """Time a DataBridge stage; call `add(records=, bytes=)` on the yielded
+        object to report throughput."""
+        stage = Stage()
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            self.observe(
+                "databridge_stage_seconds", time.perf_counter() - start, stage=name
+            )
+            self.inc("databridge_stage_records_total", stage.records, stage=name)
+            self.inc("databridge_stage_bytes_total", stage.bytes, stage=name)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self.counters.items())
+                ],
+                "histograms": [
+                    {"name": name, "labels": dict(labels), **histogram.to_dict()}
+                    for (name, labels), histogram in sorted(self.histograms.items())
+                ],
+            }
+
+    def summary(self, **extra):
+        snapshot = self.snapshot()
+        stages = {}
+        for histogram in snapshot["histograms"]:
+            if histogram["name"] == "databridge_stage_seconds":
+                stages[histogram["labels"]["stage"]] = {
+                    "seconds": histogram["sum"],
+                    "runs": histogram["count"],
+                    "records": 0,
+                    "bytes": 0,
+                }
+        for counter in snapshot["counters"]:
+            stage = stages.get(counter["labels"].get("stage"))
+            if stage is None:
+                continue
+            if counter["name"] == "databridge_stage_records_total":
+                stage["records"] = counter["value"]
+            elif counter["name"] == "databridge_stage_bytes_total":
+                stage["bytes"] = counter["value"]
+        for stage in stages.values():
+            stage["records_per_second"] = (
+                stage["records"] / stage["seconds"] if stage["seconds"] else None
+            )
+        return {**extra, "stages": stages, **snapshot}
+
+    @contextmanager
+    def job(self, name, base_data_dir=BASE_DATA_DIR):
+        """Run a job script and write its metrics summary when it finishes."""
+        mark("job_started")
+        self.reset()
+        started_at = datetime.datetime.utcnow()
+        start = time.perf_counter()
+        status = "failed"
+        try:
+            yield self
+            status = "succeeded"
+        finally:
+            summary = self.summary(
+                job=name,
+                status=status,
+                started_at=started_at.isoformat(),
+                duration_seconds=time.perf_counter() - start,
+            )
+            write_summary(summary, base_data_dir)
+
+
+metrics = MetricsRegistry()
+
+
+def write_summary(summary, base_data_dir=BASE_DATA_DIR):
+    directory = metrics_directory(base_data_dir)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{summary['job']}.json")
+    ## The web app may be reading the summary while a job replaces it
+    atomic_write(path, json.dumps(summary, indent=2))
+    return path
+
+
+def load_summaries(base_data_dir=BASE_DATA_DIR) -> List[Dict]:
+    directory = metrics_directory(base_data_dir)
+    summaries = []
+    try:
+        names = sorted(os.listdir(directory))
+    except FileNotFoundError:
+        return summaries
+    for name in names:
+        if name.endswith(".json"):
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    summaries.append(json.loads(f.read()))
+            except (OSError, ValueError):
+                continue
+    return summaries
+
+
+def _format_labels(labels: Dict):
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            key,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for key, value in sorted(labels.items())
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value):
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+def render_prometheus(snapshots: Iterable[Tuple[Dict, Dict]]):
+    """Render (snapshot, extra labels) pairs in the Prometheus text format."""
+    families: Dict[str, Tuple[str, List[str]]] = {}
+
+    def family(name, kind):
+        return families.setdefault(name, (kind, []))[1]
+
+    for snapshot, extra_labels in snapshots:
+        for counter in snapshot.get("counters", []):
+            name = counter["name"]
+            labels = _format_labels({**counter["labels"], **extra_labels})
+            family(name, "counter").append(
+                f"{name}{labels} {_format_value(counter['value'])}"
+            )
+        for histogram in snapshot.get("histograms", []):
+            name = histogram["name"]
+            labels = {**histogram["labels"], **extra_labels}
+            lines = family(name, "histogram")
+            for bound, count in histogram["buckets"] + [
+                [float("inf"), histogram["count"]]
+            ]:
+                bucket_labels = _format_labels({**labels, "le": _format_value(bound)})
+                lines.append(f"{name}_bucket{bucket_labels} {count}")
+            lines.append(
+                f"{name}_sum{_format_labels(labels)} {_format_value(histogram['sum'])}"
+            )
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+    text = []
+    for name, (kind, lines) in families.items():
+        text.append(f"# TYPE {name} {kind}")
+        text += lines
+    return "\n".join(text) + "\n"
+
+
+def render_job_summaries(summaries: Iterable[Dict], extra_snapshots=()):
+    summaries = list(summaries)
+    text = render_prometheus(
+        list(extra_snapshots)
+        + [(summary, {"job": summary["job"]}) for summary in summaries]
+    )
+    lines = ["# TYPE databridge_job_duration_seconds gauge"]
+    for summary in summaries:
+        labels = _format_labels({"job": summary["job"], "status": summary["status"]})
+        lines.append(
+            f"databridge_job_duration_seconds{labels} "
+            f"{_format_value(summary['duration_seconds'])}"
+        )
+    return text + "\n".join(lines) + "\n"
+
+
+def instrument_client(service, exclude=(), registry: MetricsRegistry = metrics):
+    """Class decorator timing every public method of an API client."""
+
+    def wrap(func):
+        @functools.wraps(func)
+        def inner(*args, **kwargs):
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                result = func(*args, **kwargs)
+                outcome = "ok"
+                return result
+            finally:
+                registry.observe(
+                    "databridge_client_call_seconds",
+                    time.perf_counter() - start,
+                    service=service,
+                    call=func.__name__,
+                )
+                registry.inc(
+                    "databridge_client_calls_total",
+                    service=service,
+                    call=func.__name__,
+                    outcome=outcome,
+                )
+
+        return inner
+
+    def decorate(cls):
+        for name, value in list(vars(cls).items()):
+            if callable(value) and not name.startswith("_") and name not in exclude:
+                setattr(cls, name, wrap(value))
+        return cls
+
+    return decorate
@@ -0,0 +1,36 @@
+## The updated_at of the last note queued per matter, so a note read again by an
+## overlapping pull, or older than one already queued, is not queued twice
+
+from typing import Dict, Optional
+
+from utils.atomic import atomic_write
+from utils.clio_paging import parse_clio_time
+from utils.serialization import dumps, loads
+
+
+class NoteWatermarks:
+    def __init__(self, path, watermarks: Optional[Dict[str, str]] = None):
+        self.path = path
+        ## Matter id -> updated_at of its latest queued note
+        self.watermarks: Dict[str, str] = watermarks or {}
+
+    @classmethod
+    def load(cls, path) -> "NoteWatermarks":
+        try:
+            with open(path, "rb") as f:
+                watermarks = loads(f.read())
+        except (FileNotFoundError, ValueError):
+            watermarks = {}
+        return cls(path, watermarks)
+
+    def save(self):
+        atomic_write(self.path, dumps(self.watermarks))
+
+    def is_new(self, note) -> bool:
+        watermark = self.watermarks.get(str(note["matter"]["id"]))
+        return watermark is None or parse_clio_time(
+            note["updated_at"]
+        ) > parse_clio_time(watermark)
+
+    def advance(self, matter_id, updated_at):
+        self.watermarks[str(matter_id)] = updated_at
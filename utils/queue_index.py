@@ -0,0 +1,150 @@
+"""Random access to uncompressed queue segments.
+
+`IndexedSegment` memory-maps a segment and keeps an index of line offsets, stored
+next to the segment as a hidden `.{name}.idx` file so the next run can skip the
+scan. Records are decoded only when they are read, which lets a push walk a huge
+migration segment in batches or hand line ranges to a pool of workers without
+loading the file.
+"""
+import mmap
+import os
+import struct
+from array import array
+from itertools import islice
+from typing import Any, Iterator, List, Tuple
+
+from utils.queue_segments import GZIP_MAGIC, ZSTD_MAGIC, iter_segment, sidecar_path
+from utils.serialization import loads
+
+INDEX_HEADER = struct.Struct("<4sQq")
+INDEX_MAGIC = b"QIX1"
+
+
+def index_path_for(path):
+    return sidecar_path(path, "idx")
+
+
+def is_indexable(path):
+    """Only uncompressed segments can be memory-mapped."""
+    with open(path, "rb") as f:
+        magic = f.read(4)
+    return bool(magic) and magic[:2] != GZIP_MAGIC and magic != ZSTD_MAGIC
+
+
+class IndexedSegment:
+    def __init__(self, path, persist_index=True):
+        self.path = path
+        self.persist_index = persist_index
+        self._file = open(path, "rb")
+        stat = os.fstat(self._file.fileno())
+        self._size = stat.st_size
+        self._mtime = stat.st_mtime_ns
+        self._mmap = (
+            mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if self._size
+            else b""
+        )
+        ## starts[i] and ends[i] bound line i, without its newline
+        self._starts, self._ends = self._load_index() or self._build_index()
+
+    def _load_index(self):
+        try:
+            with open(index_path_for(self.path), "rb") as f:
+                magic, size, mtime = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+                if magic != INDEX_MAGIC or size != self._size or mtime != self._mtime:
+                    return None
+                offsets = array("Q")
+                offsets.frombytes(f.read())
+        except (FileNotFoundError, struct.error, ValueError):
+            return None
+        count = len(offsets) // 2
+        return offsets[:count], offsets[count:]
+
+    def _build_index(self):
+        starts, ends = array("Q"), array("Q")
+        data, pos = self._mmap, 0
+        while pos < self._size:
+            end = data.find(b"\n", pos)
+            if end == -1:
+                end = self._size
+            if end > pos:
+                starts.append(pos)
+                ends.append(end)
+            pos = end + 1
+        if self.persist_index:
+            self._save_index(starts, ends)
+        return starts, ends
+
+    def _save_index(self, starts, ends):
+        index_path = index_path_for(self.path)
+        tmp_path = index_path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(INDEX_HEADER.pack(INDEX_MAGIC, self._size, self._mtime))
+                f.write(starts.tobytes())
+                f.write(ends.tobytes())
+            os.replace(tmp_path, index_path)
+        except OSError:
+            ## The index is only a cache
+            pass
+
+    def __len__(self):
+        return len(self._starts)
+
+    def raw(self, i) -> bytes:
+        return self._mmap[self._starts[i] : self._ends[i]]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return loads(self.raw(i))
+
+    def __iter__(self) -> Iterator[Any]:
+        return self.iter_range(0, len(self))
+
+    def iter_range(self, start, stop) -> Iterator[Any]:
+        for i in range(start, min(stop, len(self))):
+            yield loads(self.raw(i))
+
+    def batches(self, size, start=0, stop=None) -> Iterator[List[Any]]:
+        stop = len(self) if stop is None else min(stop, len(self))
+        for batch_start in range(start, stop, size):
+            yield self[batch_start : min(batch_start + size, stop)]
+
+    def partitions(self, count) -> List[Tuple[int, int]]:
+        """Split the segment into at most `count` contiguous line ranges."""
+        total = len(self)
+        count = max(1, min(count, total))
+        step, extra = divmod(total, count)
+        ranges, start = [], 0
+        for i in range(count):
+            stop = start + step + (1 if i < extra else 0)
+            ranges.append((start, stop))
+            start = stop
+        return ranges
+
+    def close(self):
+        if isinstance(self._mmap, mmap.mmap):
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_batches(path, size) -> Iterator[List[Any]]:
+    """Yield lists of at most `size` records, memory-mapping plain segments."""
+    if is_indexable(path):
+        with IndexedSegment(path) as segment:
+            yield from segment.batches(size)
+    else:
+        records = iter_segment(path)
+        batch = list(islice(records, size))
+        while batch:
+            yield batch
+            batch = list(islice(records, size))
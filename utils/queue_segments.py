@@ -0,0 +1,204 @@
+"""Queue segment files.
+
+A pull writes its records to one or more segments named
+`{timestamp}.{sequence}{extension}`, rotating to a new segment once
+`max_segment_bytes` of encoded records have been written. Segments can be plain
+JSONL, gzip or zstd (requires the `zstandard` package). Readers detect the framing
+from the file header, so older uncompressed queue files are still read.
+"""
+import gzip
+import io
+import os
+from typing import Any, Iterable, Iterator, List
+
+from utils.atomic import fsync_directory, fsync_path, replacing
+from utils.serialization import dump_line, loads
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+EXTENSIONS = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+SIDECAR_SUFFIXES = ["idx"]
+
+QUEUE_COMPRESSION = os.environ.get("DATABRIDGE_QUEUE_COMPRESSION", "none")
+QUEUE_COMPRESSION_LEVEL = int(os.environ.get("DATABRIDGE_QUEUE_COMPRESSION_LEVEL", 3))
+QUEUE_MAX_SEGMENT_BYTES = int(
+    os.environ.get("DATABRIDGE_QUEUE_MAX_SEGMENT_BYTES", 64 * 1024 * 1024)
+)
+
+
+def compression_for_path(path):
+    for compression, extension in EXTENSIONS.items():
+        if extension and path.endswith(extension):
+            return compression
+    return "none"
+
+
+def _open_writer(path, compression, level):
+    if compression == "gzip":
+        return gzip.open(path, "wb", compresslevel=level)
+    if compression == "zstd":
+        import zstandard
+
+        raw = open(path, "wb")
+        return zstandard.ZstdCompressor(level=level).stream_writer(
+            raw, closefd=True
+        )
+    if compression == "none":
+        return open(path, "wb", buffering=1024 * 1024)
+    raise ValueError(f"Unknown queue compression {compression}")
+
+
+def open_segment(path):
+    """Open a segment for binary line iteration, decompressing on the fly."""
+    raw = open(path, "rb")
+    magic = raw.peek(4)[:4]
+    if magic[:2] == GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=raw, mode="rb")
+    if magic == ZSTD_MAGIC:
+        import zstandard
+
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        return io.BufferedReader(reader, buffer_size=1024 * 1024)
+    return raw
+
+
+def iter_segment(path) -> Iterator[Any]:
+    """Yield the decoded records of a segment one at a time."""
+    with open_segment(path) as f:
+        for line in f:
+            if line.strip():
+                yield loads(line)
+
+
+def sidecar_path(path, suffix):
+    """Hidden file stored next to a segment, e.g. its line index."""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.{suffix}")
+
+
+def remove_sidecars(path):
+    for suffix in SIDECAR_SUFFIXES:
+        try:
+            os.remove(sidecar_path(path, suffix))
+        except FileNotFoundError:
+            pass
+
+
+def remove_segment(path):
+    os.remove(path)
+    remove_sidecars(path)
+
+
+def list_segments(directory) -> List[str]:
+    """Sorted segment paths in a queue directory, skipping hidden sidecar files. A
+    queue directory that was never written to has no segments."""
+    try:
+        names = sorted(os.listdir(directory))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, name) for name in names if not name.startswith(".")]
+
+
+class SegmentWriter:
+    def __init__(
+        self,
+        directory,
+        name,
+        compression=None,
+        max_segment_bytes=None,
+        compression_level=None,
+    ):
+        self.directory = directory
+        self.name = name
+        self.compression = compression or QUEUE_COMPRESSION
+        self.max_segment_bytes = (
+            QUEUE_MAX_SEGMENT_BYTES if max_segment_bytes is None else max_segment_bytes
+        )
+        self.compression_level = (
+            QUEUE_COMPRESSION_LEVEL if compression_level is None else compression_level
+        )
+        self.paths: List[str] = []
+        ## Segments are written to hidden temporary files and only renamed to their
+        ## final names by `close`, so a failed pull leaves no partial queue behind
+        self._temp_paths: List[str] = []
+        self.records = 0
+        self.bytes_written = 0
+        self._file = None
+        self._segment_bytes = 0
+
+    def _rotate(self):
+        self._close_segment()
+        if not self.paths:
+            os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(
+            self.directory,
+            f"{self.name}.{len(self.paths):04d}{EXTENSIONS[self.compression]}",
+        )
+        temp_path = sidecar_path(path, "tmp")
+        self._file = _open_writer(temp_path, self.compression, self.compression_level)
+        self.paths.append(path)
+        self._temp_paths.append(temp_path)
+        self._segment_bytes = 0
+
+    def _close_segment(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def write(self, record):
+        line = dump_line(record)
+        if self._file is None or (
+            self.max_segment_bytes
+            and self._segment_bytes
+            and self._segment_bytes + len(line) > self.max_segment_bytes
+        ):
+            self._rotate()
+        self._file.write(line)
+        self._segment_bytes += len(line)
+        self.bytes_written += len(line)
+        self.records += 1
+
+    def write_all(self, records: Iterable[Any]):
+        for record in records:
+            self.write(record)
+
+    def close(self):
+        """Finish writing and publish every segment under its final name."""
+        self._close_segment()
+        for temp_path, path in zip(self._temp_paths, self.paths):
+            fsync_path(temp_path)
+            os.replace(temp_path, path)
+        if self._temp_paths:
+            fsync_directory(self.directory)
+        self._temp_paths = []
+
+    def abort(self):
+        """Discard the segments written so far."""
+        self._close_segment()
+        for temp_path in self._temp_paths:
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+        self._temp_paths = []
+        self.paths = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def rewrite_segment(path, records: Iterable[Any]):
+    """Atomically replace a segment's contents, keeping its compression."""
+    compression = compression_for_path(path)
+    remove_sidecars(path)
+    with replacing(path) as temp_path:
+        with _open_writer(temp_path, compression, QUEUE_COMPRESSION_LEVEL) as f:
+            for record in records:
+                f.write(dump_line(record))
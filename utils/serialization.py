@@ -0,0 +1,108 @@
+## The fastest installed JSON backend (orjson, then msgspec, then json) unless
+## DATABRIDGE_JSON_BACKEND names one
+
+import json
+import os
+from typing import Any, Dict, Optional
+
+
+def _encode_default(obj):
+    ## Dataclass instances are encoded from their own attribute dict (no deep copy);
+    ## nested values are handled by the encoder itself
+    try:
+        return obj.__dict__
+    except AttributeError:
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class JsonCodec:
+    name = "json"
+
+    def __init__(self):
+        self._encoder = json.JSONEncoder(
+            default=_encode_default, separators=(",", ":"), ensure_ascii=False
+        )
+        self._decoder = json.JSONDecoder()
+
+    def dumps(self, obj: Any) -> bytes:
+        return self._encoder.encode(obj).encode("utf-8")
+
+    def loads(self, data) -> Any:
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data).decode("utf-8")
+        return self._decoder.decode(data)
+
+
+class OrjsonCodec:
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+
+        self._orjson = orjson
+
+    def dumps(self, obj: Any) -> bytes:
+        ## orjson serializes dataclasses natively
+        return self._orjson.dumps(obj, default=_encode_default)
+
+    def loads(self, data) -> Any:
+        return self._orjson.loads(data)
+
+
+class MsgspecCodec:
+    name = "msgspec"
+
+    def __init__(self):
+        import msgspec
+
+        self._encoder = msgspec.json.Encoder(enc_hook=_encode_default)
+        self._decoder = msgspec.json.Decoder()
+
+    def dumps(self, obj: Any) -> bytes:
+        return self._encoder.encode(obj)
+
+    def loads(self, data) -> Any:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        return self._decoder.decode(data)
+
+
+CODECS = {
+    OrjsonCodec.name: OrjsonCodec,
+    MsgspecCodec.name: MsgspecCodec,
+    JsonCodec.name: JsonCodec,
+}
+
+_codecs: Dict[str, Any] = {}
+
+
+def get_codec(name: Optional[str] = None):
+    if name and name not in CODECS:
+        raise ValueError(f"Unknown JSON backend {name}")
+    names = [name] if name else list(CODECS)
+    for codec_name in names:
+        if codec_name in _codecs:
+            return _codecs[codec_name]
+        try:
+            codec = CODECS[codec_name]()
+        except ImportError:
+            if name:
+                raise
+            continue
+        _codecs[codec_name] = codec
+        return codec
+
+
+codec = get_codec(os.environ.get("DATABRIDGE_JSON_BACKEND") or None)
+
+
+def dumps(obj: Any) -> bytes:
+    return codec.dumps(obj)
+
+
+def dump_line(obj: Any) -> bytes:
+    return codec.dumps(obj) + b"\n"
+
+
+def loads(data) -> Any:
+    return codec.loads(data)
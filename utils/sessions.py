@@ -0,0 +1,237 @@
+"""HTTP sessions for the GIS and Clio clients.
+
+`make_session` builds every session the data bridge uses with the same urllib3 retry
+policy and a list of request hooks. Each hook gets `before(call)` ahead of the
+request and `after(call)` once it finished, where `call` is a `RequestCall` with
+the method, endpoint template, status, latency, bytes and retry attempts.
+
+By default requests are counted in `utils.metrics`. Setting DATABRIDGE_TRACE_FILE
+also appends one OpenTelemetry-style JSON span per request to that file.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.metrics import metrics
+
+TRACE_FILE = os.environ.get("DATABRIDGE_TRACE_FILE")
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+## Path segments that are ids, tokens or storage keys rather than resource names
+_ID_SEGMENT = re.compile(r"^(\d+|[0-9a-fA-F-]{16,}|[^/]{40,})$")
+
+
+def endpoint_template(url):
+    """`https://host/api/v4/matters/123?x=1` -> `host/api/v4/matters/{id}`"""
+    parts = urlsplit(url)
+    segments = [
+        "{id}" if _ID_SEGMENT.match(segment) else segment
+        for segment in parts.path.split("/")
+    ]
+    return parts.netloc + "/".join(segments)
+
+
+def default_retry():
+    return Retry(total=10, backoff_factor=1, status_forcelist=RETRY_STATUSES)
+
+
+@dataclass
+class RequestCall:
+    service: str
+    method: str
+    url: str
+    endpoint: str
+    start_time_ns: int = 0
+    end_time_ns: int = 0
+    latency: float = 0.0
+    status: Optional[int] = None
+    request_bytes: int = 0
+    response_bytes: int = 0
+    retries: int = 0
+    error: Optional[BaseException] = None
+    context: Dict[str, Any] = field(default_factory=dict)
+
+
+class RequestHook:
+    def before(self, call: RequestCall):
+        pass
+
+    def after(self, call: RequestCall):
+        pass
+
+
+class MetricsHook(RequestHook):
+    def after(self, call: RequestCall):
+        labels = {
+            "service": call.service,
+            "method": call.method,
+            "endpoint": call.endpoint,
+        }
+        metrics.inc(
+            "databridge_http_requests_total",
+            status=call.status if call.status is not None else "error",
+            **labels,
+        )
+        metrics.observe("databridge_http_request_seconds", call.latency, **labels)
+        metrics.inc(
+            "databridge_http_response_bytes_total", call.response_bytes, **labels
+        )
+        metrics.inc("databridge_http_request_bytes_total", call.request_bytes, **labels)
+        if call.retries:
+            metrics.inc("databridge_http_retries_total", call.retries, **labels)
+
+
+class SpanFileExporter(RequestHook):
+    """Appends one OpenTelemetry JSON span per request to a local file."""
+
+    _lock = threading.Lock()
+    trace_id = uuid.uuid4().hex
+
+    def __init__(self, path):
+        self.path = path
+
+    def after(self, call: RequestCall):
+        attributes = {
+            "http.method": call.method,
+            "http.route": call.endpoint,
+            "http.url": call.url.split("?")[0],
+            "http.status_code": call.status,
+            "http.request_content_length": call.request_bytes,
+            "http.response_content_length": call.response_bytes,
+            "http.retry_count": call.retries,
+            "service.name": call.service,
+        }
+        span = {
+            "traceId": self.trace_id,
+            "spanId": uuid.uuid4().hex[:16],
+            "name": f"{call.method} {call.endpoint}",
+            "kind": "SPAN_KIND_CLIENT",
+            "startTimeUnixNano": call.start_time_ns,
+            "endTimeUnixNano": call.end_time_ns,
+            "attributes": [
+                {"key": key, "value": _span_value(value)}
+                for key, value in attributes.items()
+                if value is not None
+            ],
+            "status": {
+                "code": (
+                    "STATUS_CODE_ERROR"
+                    if call.error is not None or (call.status or 0) >= 400
+                    else "STATUS_CODE_OK"
+                )
+            },
+        }
+        if call.error is not None:
+            span["status"]["message"] = repr(call.error)
+        line = json.dumps(span) + "\n"
+        with self._lock, open(self.path, "a") as f:
+            f.write(line)
+
+
+def _span_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    return {"stringValue": str(value)}
+
+
+def default_hooks() -> List[RequestHook]:
+    hooks: List[RequestHook] = [MetricsHook()]
+    if TRACE_FILE:
+        hooks.append(SpanFileExporter(TRACE_FILE))
+    return hooks
+
+
+def _body_length(body):
+    if body is None or hasattr(body, "read"):
+        return 0
+    return len(body)
+
+
+class TracedSessionMixin:
+    service = "http"
+    request_hooks: List[RequestHook] = []
+
+    def request(self, method, url, *args, **kwargs):
+        call = RequestCall(
+            service=self.service,
+            method=method.upper(),
+            url=url,
+            endpoint=endpoint_template(url),
+        )
+        for hook in self.request_hooks:
+            hook.before(call)
+        call.start_time_ns = time.time_ns()
+        start = time.perf_counter()
+        try:
+            res = super().request(method, url, *args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        else:
+            call.status = res.status_code
+            call.request_bytes = _body_length(res.request.body)
+            length = res.headers.get("Content-Length")
+            if length is not None:
+                call.response_bytes = int(length)
+            elif not kwargs.get("stream"):
+                call.response_bytes = len(res.content or b"")
+            retries = getattr(res.raw, "retries", None)
+            call.retries = len(retries.history) if retries is not None else 0
+            return res
+        finally:
+            call.latency = time.perf_counter() - start
+            call.end_time_ns = time.time_ns()
+            for hook in self.request_hooks:
+                hook.after(call)
+
+
+class TracedSession(TracedSessionMixin, requests.Session):
+    pass
+
+
+_oauth_session_class = None
+
+
+def _traced_oauth_session_class():
+    global _oauth_session_class
+    if _oauth_session_class is None:
+        from requests_oauthlib import OAuth2Session
+
+        class TracedOAuth2Session(TracedSessionMixin, OAuth2Session):
+            pass
+
+        _oauth_session_class = TracedOAuth2Session
+    return _oauth_session_class
+
+
+def make_session(
+    service,
+    retry: Optional[Retry] = None,
+    hooks: Optional[List[RequestHook]] = None,
+    oauth: Optional[Dict[str, Any]] = None,
+):
+    """Build a session with retries and request hooks. Pass `oauth` keyword
+    arguments to get an OAuth2Session instead of a plain requests session."""
+    if oauth is not None:
+        session = _traced_oauth_session_class()(**oauth)
+    else:
+        session = TracedSession()
+    session.service = service
+    session.request_hooks = default_hooks() if hooks is None else hooks
+    adapter = HTTPAdapter(max_retries=retry or default_retry())
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
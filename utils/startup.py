@@ -0,0 +1,228 @@
+"""Import-time and cold-start profiling for the job scripts.
+
+Set DATABRIDGE_PROFILE_STARTUP=1 and every job script writes a report to
+`data/metrics/startup/{job}.json`; any other value is used as the report path,
+with `{job}` replaced by the job name. The report lists how long each module took
+to import (its own time and including the modules it imported), the time per
+top-level package, and the initialization phases wrapped in `phase(...)`, such as
+building the GIS client or reading the Clio tokens, with the modules each of them
+imported.
+
+Each job script calls `install_from_env` before its other imports, which works both
+as `python -m job.<name>` and in the container, where the scripts sit at the image
+root and run as `python -m <name>`. This module only uses the standard library so
+it can be imported first, and when the variable is unset `phase` does nothing.
+"""
+
+import atexit
+import datetime
+import importlib.abc
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+PROFILE_STARTUP = os.environ.get("DATABRIDGE_PROFILE_STARTUP")
+
+
+class _TimedLoader:
+    """Wraps a module's loader to time `exec_module`; everything else is delegated."""
+
+    def __init__(self, loader, profiler: "StartupProfiler"):
+        self._loader = loader
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._profiler._enter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler._exit(module.__name__)
+
+
+class _ImportTimer(importlib.abc.MetaPathFinder):
+    def __init__(self, profiler: "StartupProfiler"):
+        self.profiler = profiler
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is None:
+                continue
+            if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                spec.loader = _TimedLoader(spec.loader, self.profiler)
+            return spec
+        return None
+
+
+class StartupProfiler:
+    def __init__(self):
+        self.started_at = datetime.datetime.utcnow()
+        self.start = time.perf_counter()
+        self.preloaded = len(sys.modules)
+        self.imports: List[Dict] = []
+        self.phases: List[Dict] = []
+        self.marks: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._finder = _ImportTimer(self)
+
+    def install(self):
+        sys.meta_path.insert(0, self._finder)
+
+    def uninstall(self):
+        if self._finder in sys.meta_path:
+            sys.meta_path.remove(self._finder)
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _enter(self):
+        ## [start, seconds spent importing children]
+        self._stack().append([time.perf_counter(), 0.0])
+
+    def _exit(self, name):
+        now = time.perf_counter()
+        stack = self._stack()
+        start, children = stack.pop()
+        cumulative = now - start
+        if stack:
+            stack[-1][1] += cumulative
+        with self._lock:
+            self.imports.append(
+                {
+                    "module": name,
+                    "offset_seconds": start - self.start,
+                    "self_seconds": cumulative - children,
+                    "cumulative_seconds": cumulative,
+                    "nested": bool(stack),
+                }
+            )
+
+    @contextmanager
+    def phase(self, name):
+        with self._lock:
+            imported = len(self.imports)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                modules = [record["module"] for record in self.imports[imported:]]
+                self.phases.append(
+                    {
+                        "name": name,
+                        "offset_seconds": start - self.start,
+                        "seconds": seconds,
+                        "modules_imported": modules,
+                    }
+                )
+
+    def mark(self, name):
+        with self._lock:
+            self.marks.setdefault(name, time.perf_counter() - self.start)
+
+    def report(self, job):
+        with self._lock:
+            imports = list(self.imports)
+            phases = list(self.phases)
+            marks = dict(self.marks)
+        packages: Dict[str, Dict] = {}
+        for record in imports:
+            package = packages.setdefault(
+                record["module"].partition(".")[0], {"modules": 0, "self_seconds": 0.0}
+            )
+            package["modules"] += 1
+            package["self_seconds"] += record["self_seconds"]
+        return {
+            "job": job,
+            "started_at": self.started_at.isoformat(),
+            "python": sys.version.split()[0],
+            "seconds": time.perf_counter() - self.start,
+            "marks": marks,
+            "modules_before_profiling": self.preloaded,
+            "modules_imported": len(imports),
+            "import_seconds": sum(
+                record["cumulative_seconds"]
+                for record in imports
+                if not record["nested"]
+            ),
+            "phases": phases,
+            "packages": dict(
+                sorted(packages.items(), key=lambda item: -item[1]["self_seconds"])
+            ),
+            "imports": sorted(imports, key=lambda record: -record["cumulative_seconds"]),
+        }
+
+
+_profiler: Optional[StartupProfiler] = None
+
+
+def _job_name():
+    spec = getattr(sys.modules.get("__main__"), "__spec__", None)
+    if spec is not None:
+        return spec.name.rpartition(".")[2]
+    return os.path.splitext(os.path.basename(sys.argv[0]))[0] or "python"
+
+
+def report_path(job, setting=PROFILE_STARTUP):
+    if setting.lower() in ("1", "true", "yes"):
+        from utils.metrics import metrics_directory
+
+        return os.path.join(metrics_directory(), "startup", f"{job}.json")
+    return setting.replace("{job}", job)
+
+
+def write_report():
+    if _profiler is None:
+        return None
+    job = _job_name()
+    path = report_path(job)
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        f.write(json.dumps(_profiler.report(job), indent=2))
+    return path
+
+
+def install_from_env():
+    """Start profiling if DATABRIDGE_PROFILE_STARTUP is set; the report is written
+    when the process exits."""
+    global _profiler
+    if not PROFILE_STARTUP or _profiler is not None:
+        return _profiler
+    _profiler = StartupProfiler()
+    _profiler.install()
+    atexit.register(write_report)
+    return _profiler
+
+
+@contextmanager
+def phase(name):
+    """Time an initialization phase when startup profiling is on."""
+    if _profiler is None:
+        yield
+        return
+    with _profiler.phase(name):
+        yield
+
+
+def mark(name):
+    """Record the first time the process reaches `name`, e.g. the start of the job."""
+    if _profiler is not None:
+        _profiler.mark(name)
@@ -0,0 +1,271 @@
+## Clio rotates the refresh token on every refresh, so only one thread of one
+## process refreshes at a time: threads share a manager per auth directory and
+## processes lock the token file
+
+import json
+import os
+import threading
+import time
+import weakref
+from typing import Callable, Dict, List, Optional
+
+from utils.atomic import atomic_write, file_lock
+from utils.constants import CLIO_API_KEY, CLIO_API_SECRET, CLIO_TOKEN_URL
+from utils.logging import logger
+from utils.sessions import RequestCall, RequestHook, make_session
+
+REFRESH_MARGIN = float(os.environ.get("DATABRIDGE_TOKEN_REFRESH_MARGIN", 300))
+## How often the background refresher wakes when the expiry is unknown or far off,
+## and how long it waits after a failed refresh
+REFRESHER_POLL_SECONDS = 600
+REFRESHER_RETRY_SECONDS = 30
+
+Token = Dict[str, object]
+
+
+def _read(path) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def with_expires_at(token: Token, now=None) -> Token:
+    token = dict(token)
+    if token.get("expires_at") is None and token.get("expires_in"):
+        token["expires_at"] = (now or time.time()) + float(token["expires_in"])
+    return token
+
+
+class TokenManager:
+    def __init__(
+        self,
+        auth_data_dir,
+        api_key=CLIO_API_KEY,
+        api_secret=CLIO_API_SECRET,
+        token_url=CLIO_TOKEN_URL,
+        token_filename="token.json",
+        access_token_filename="access",
+        refresh_token_filename="refresh",
+        expires_at_filename="expires_at",
+        margin=REFRESH_MARGIN,
+    ):
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.token_url = token_url
+        self.token_path = os.path.join(auth_data_dir, token_filename)
+        ## Written by earlier versions; migrated into token_path on first read
+        self.legacy_paths = {
+            "access_token": os.path.join(auth_data_dir, access_token_filename),
+            "refresh_token": os.path.join(auth_data_dir, refresh_token_filename),
+            "expires_at": os.path.join(auth_data_dir, expires_at_filename),
+        }
+        self.margin = margin
+        self.token: Token = {}
+        self.refreshes = 0
+        self._listeners: List[weakref.WeakMethod] = []
+        self._lock = threading.Lock()
+        self._session = None
+        self._refresher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    ## Persistence
+
+    def read(self) -> Token:
+        with file_lock(self.token_path, shared=True):
+            token = self._read()
+        if token or not os.path.exists(self.legacy_paths["access_token"]):
+            return token
+        with file_lock(self.token_path):
+            return self._read_or_migrate()
+
+    def _read(self) -> Token:
+        ## flock is per open file, so callers already holding the exclusive lock
+        ## must not take the shared one
+        try:
+            return json.loads(_read(self.token_path) or "{}")
+        except ValueError:
+            logger.warning(f"Ignoring unreadable Clio token file {self.token_path}")
+            return {}
+
+    ## Call under the exclusive lock
+    def _read_or_migrate(self) -> Token:
+        token = self._read()
+        if token:
+            return token
+        legacy = {key: _read(path) for key, path in self.legacy_paths.items()}
+        if legacy["access_token"] is None or legacy["refresh_token"] is None:
+            return {}
+        token = {
+            "access_token": legacy["access_token"],
+            "refresh_token": legacy["refresh_token"],
+            "token_type": "bearer",
+        }
+        try:
+            token["expires_at"] = float(legacy["expires_at"])
+        except (TypeError, ValueError):
+            pass
+        self._write(token)
+        for path in self.legacy_paths.values():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        logger.info(f"Migrated Clio tokens to {self.token_path}")
+        return token
+
+    def load(self) -> Token:
+        with self._lock:
+            self._set(self.read())
+        return self.token
+
+    def save(self, token: Token):
+        token = with_expires_at(token)
+        with self._lock:
+            with file_lock(self.token_path):
+                self._write(token)
+            self._set(token)
+
+    def _write(self, token: Token):
+        atomic_write(self.token_path, json.dumps(token, indent=2))
+
+    ## Weak, so short-lived clients (one per web request) are not leaked
+    def subscribe(self, listener: Callable[[Token], None]):
+        self._listeners.append(weakref.WeakMethod(listener))
+
+    def _set(self, token: Token):
+        self.token = token
+        alive = []
+        for reference in self._listeners:
+            listener = reference()
+            if listener is not None:
+                listener(token)
+                alive.append(reference)
+        self._listeners = alive
+
+    ## Refresh
+
+    def seconds_left(self, token: Optional[Token] = None) -> Optional[float]:
+        token = self.token if token is None else token
+        expires_at = token.get("expires_at")
+        if not token.get("refresh_token") or expires_at is None:
+            return None
+        return float(expires_at) - time.time()
+
+    def needs_refresh(self, token: Optional[Token] = None, margin=None) -> bool:
+        left = self.seconds_left(token)
+        return left is not None and left < (self.margin if margin is None else margin)
+
+    def ensure_fresh(self, margin=None) -> Token:
+        if not self.needs_refresh(margin=margin):
+            return self.token
+        with self._lock:
+            if not self.needs_refresh(margin=margin):
+                return self.token
+            with file_lock(self.token_path):
+                saved = self._read_or_migrate()
+                ## Another process may have refreshed while we waited for the lock
+                if (
+                    saved
+                    and saved["access_token"] != self.token.get("access_token")
+                    and not self.needs_refresh(saved, margin)
+                ):
+                    logger.info("Using Clio token refreshed by another process")
+                    self._set(saved)
+                    return self.token
+                token = self._refresh((saved or self.token)["refresh_token"])
+                self._write(token)
+            self._set(token)
+        return self.token
+
+    ## After a 401, unless the token was already replaced
+    def expire(self, access_token=None):
+        with self._lock:
+            if access_token is None or self.token.get("access_token") == access_token:
+                self.token = {**self.token, "expires_at": 0.0}
+
+    def _refresh(self, refresh_token) -> Token:
+        if self._session is None:
+            self._session = make_session("clio_oauth")
+        logger.info("Refreshing Clio access token")
+        res = self._session.post(
+            self.token_url,
+            data={
+                "grant_type": "refresh_token",
+                "refresh_token": refresh_token,
+                "client_id": self.api_key,
+                "client_secret": self.api_secret,
+            },
+        )
+        res.raise_for_status()
+        token = res.json()
+        token.setdefault("refresh_token", refresh_token)
+        self.refreshes += 1
+        return with_expires_at(token)
+
+    ## Background refresh
+
+    def start_refresher(self):
+        with self._lock:
+            if self._refresher is not None and self._refresher.is_alive():
+                return
+            self._stop.clear()
+            self._refresher = threading.Thread(
+                target=self._run_refresher, name="clio-token-refresher", daemon=True
+            )
+            self._refresher.start()
+
+    def stop_refresher(self):
+        self._stop.set()
+        if self._refresher is not None:
+            self._refresher.join()
+            self._refresher = None
+
+    def _next_refresh_delay(self):
+        left = self.seconds_left()
+        if left is None:
+            return REFRESHER_POLL_SECONDS
+        lead = 2 * self.margin
+        if left <= lead:
+            ## A token that is short-lived from the start is refreshed at the
+            ## request margin instead, rather than over and over
+            lead = self.margin
+        return min(max(left - lead, 1.0), REFRESHER_POLL_SECONDS)
+
+    def _run_refresher(self):
+        delay = self._next_refresh_delay()
+        while not self._stop.wait(delay):
+            try:
+                self.ensure_fresh(margin=2 * self.margin)
+                delay = self._next_refresh_delay()
+            except Exception as e:
+                logger.warning(f"Background Clio token refresh failed: {e}")
+                delay = REFRESHER_RETRY_SECONDS
+
+
+_managers: Dict[str, TokenManager] = {}
+_managers_lock = threading.Lock()
+
+
+def token_manager(auth_data_dir, **kwargs) -> TokenManager:
+    key = os.path.abspath(auth_data_dir)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = _managers[key] = TokenManager(auth_data_dir, **kwargs)
+            manager.load()
+        return manager
+
+
+class TokenRefreshHook(RequestHook):
+    def __init__(self, manager: TokenManager):
+        self.manager = manager
+
+    def before(self, call: RequestCall):
+        self.manager.ensure_fresh()
+        call.context["access_token"] = self.manager.token.get("access_token")
+
+    def after(self, call: RequestCall):
+        if call.status == 401:
+            self.manager.expire(call.context.get("access_token"))
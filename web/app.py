@@ -1,5 +1,6 @@
 from utils.clio_client import AuthClient
-from flask import Flask, request, redirect
+from utils.metrics import load_summaries, metrics, render_job_summaries
+from flask import Flask, Response, request, redirect
 
 app = Flask(__name__)
 
@@ -20,6 +21,14 @@ def callback():
     return "OK"
 
 
+@app.route("/metrics")
+def prometheus_metrics():
+    text = render_job_summaries(
+        load_summaries(), extra_snapshots=[(metrics.snapshot(), {"job": "web"})]
+    )
+    return Response(text, mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/health")
 def health():
     return "OK"